@@ -0,0 +1,101 @@
+"""
+run the code: python benchmark_target_decoder.py --frames 1000000
+"""
+import argparse
+import time
+
+import numpy as np
+
+from target_decoder import decode
+
+
+def reference_decode(inp):
+    """
+    The `decode` as it was copied in the converter, the inference and the training (masks and shifts over
+    strided copies of the words).
+    """
+    N = inp.shape[0]
+
+    tmp = inp.reshape(N, -1)
+    target_bins = tmp[:, ::2]
+    target_amps = tmp[:, 1::2]
+
+    decoded_bins = target_bins & 0x00FF
+    decoded_amps = ((target_bins & 0xFF00) >> 8) + ((target_amps & 0x00FF) << 4)
+
+    return decoded_amps.reshape(N, 2, 2), decoded_bins.reshape(N, 2, 2)
+
+
+def reference_features(inp):
+    """
+    The model features as they were built by `tf_inference.preprocess_target` from the decoded targets.
+    """
+    amps, bins = reference_decode(inp)
+    len_points = amps.shape[0]
+    amps, bins = amps.reshape(len_points, 4), bins.reshape(len_points, 4)
+    data = np.hstack((amps, bins)).astype(np.float32)
+
+    data[:, [4, 5, 6, 7]] = data[:, [4, 5, 6, 7]] / 31
+
+    return data[:, [0, 4, 1, 5, 2, 6, 3, 7]]
+
+
+def features(inp, out=None):
+    """
+    The model features decoded directly into their (interleaved) columns.
+    """
+    if out is None:
+        out = np.empty((len(inp), 8), dtype=np.float32)
+    decode(inp, amps=out[:, 0::2], bins=out[:, 1::2])
+    out[:, 1::2] /= 31
+
+    return out
+
+
+def measure(name, func, num_frames, reference=None, repeats=5):
+    """
+    Runs the decoding and prints its throughput and whether it equals the reference.
+        -`func`: function without arguments returning the decoded data (an array or a tuple of arrays)
+        -`num_frames`: number of frames of the target data
+        -`return`: the decoded data
+    """
+    best = np.inf
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+
+    line = f"{name:<28} {num_frames / best:14.0f} frames/s"
+    if reference is not None:
+        equal = all(np.array_equal(a, b) for a, b in zip(np.atleast_1d(result), np.atleast_1d(reference)))
+        line += f"   identical: {equal}"
+    print(line)
+
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--frames", type=int, default=1000000, help="number of random target frames")
+    parser.add_argument("--repeats", type=int, default=5)
+
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    target = rng.integers(0, 0xFFFF, size=(args.frames, 8), dtype=np.uint16, endpoint=True)
+
+    amps, bins = np.empty((args.frames, 2, 2), dtype=np.uint16), np.empty((args.frames, 2, 2), dtype=np.uint16)
+    out = np.empty((args.frames, 8), dtype=np.float32)
+
+    reference = measure("reference decode", lambda: reference_decode(target), args.frames, repeats=args.repeats)
+    measure("decode", lambda: decode(target), args.frames, reference, args.repeats)
+    measure("decode into buffers", lambda: decode(target, amps, bins), args.frames, reference, args.repeats)
+
+    reference = measure("reference features", lambda: reference_features(target), args.frames, repeats=args.repeats)
+    measure("features", lambda: features(target), args.frames, reference, args.repeats)
+    measure("features into buffer", lambda: features(target, out), args.frames, reference, args.repeats)
+
+    # a single frame, like in the frame loop of the matlab port
+    frame = target[:1]
+    measure("reference decode 1 frame", lambda: reference_decode(frame), 1, repeats=1000)
+    measure("decode 1 frame", lambda: decode(frame), 1, repeats=1000)
@@ -0,0 +1,80 @@
+"""
+run the code: python benchmark_target_extractor.py --frames 100000
+"""
+import argparse
+import time
+
+import numpy as np
+
+from target_extractor import TargetExtractor, gauss, pack_targets
+
+
+def reference_target(inp):
+    """
+    The target extraction as it was done per call before `TargetExtractor` (window recomputed, copies of the data).
+    """
+    window = gauss(inp.shape[-1])
+    window /= window.sum()
+
+    data = inp[:, :, 0, :] + 1j * inp[:, :, 1, :]
+    data -= data.mean(axis=-1, keepdims=True)
+    data = data * window
+
+    amps = np.abs(np.fft.fft(data, axis=-1))
+    bins = np.argpartition(amps, -2, axis=-1)[..., -2:][..., ::-1]
+    values = np.take_along_axis(amps, indices=bins, axis=-1)
+
+    return pack_targets(values.astype(np.uint16), bins.astype(np.uint16))
+
+
+def measure(name, func, num_frames, reference=None, repeats=3):
+    """
+    Runs the extraction and prints its throughput and the number of frames differing from the reference.
+        -`func`: function without arguments returning the Nx8 target data
+        -`num_frames`: number of frames of the raw data
+        -`return`: the target data
+    """
+    best = np.inf
+    for _ in range(repeats):
+        start = time.perf_counter()
+        target = func()
+        best = min(best, time.perf_counter() - start)
+
+    line = f"{name:<28} {num_frames / best:12.0f} frames/s"
+    if reference is not None:
+        line += f"   differing frames: {(target != reference).any(axis=-1).sum()}"
+    print(line)
+
+    return target
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--frames", type=int, default=100000, help="number of random raw data frames")
+    parser.add_argument("--repeats", type=int, default=3)
+
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    raw_data = rng.integers(0, 4095, size=(args.frames, 2, 2, 32), dtype=np.uint16)
+
+    reference = measure("reference", lambda: reference_target(raw_data), args.frames, repeats=args.repeats)
+
+    for dtype in [np.complex128, np.complex64]:
+        extractor = TargetExtractor(dtype=dtype)
+        workspace = np.empty((args.frames, 2, 32), dtype=dtype)
+
+        measure(
+            f"extractor {np.dtype(dtype).name}",
+            lambda: extractor.target(raw_data),
+            args.frames,
+            reference,
+            args.repeats,
+        )
+        measure(
+            f"extractor {np.dtype(dtype).name} workspace",
+            lambda: extractor.target(raw_data, workspace),
+            args.frames,
+            reference,
+            args.repeats,
+        )
@@ -1,115 +1,131 @@
 """
-run the code: python raw_to_target_converter.py --folder-name "20230118"
+run the code: python raw_to_target_converter.py --folder-name "20230118" --workers 8
+(long recordings: --chunk-size 100000)
 """
 import argparse
 import glob
 import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 from pathlib import Path
 
 import numpy as np
-import torch
 
-
-def gauss(n):
-    """
-    A window function that is applied on the raw data before the Fourier Transformation.
-    Parameters:
-        -`n`: The number of samples for constructing the window.
-    """
-    n += 1
-    x = np.arange(-n // 2 + 1, n // 2)
-    x = 2 * x / n
-    y = np.exp(-1 / (1 - x**2))
-
-    return y / y.sum()
+from target_extractor import gauss, get_extractor, pack_targets
 
 
-def fft(inp, window):
+def fft(inp, window, dtype=np.complex128, workspace=None):
     """
         A function that converts the raw data into target data. The function removes the mean from the data, applies a window function, \
         performs Fourier Transformation, takes the strongest 2 FFTs/targets, does the bit shifts and saves the data.
         Parameters:
             -`inp`: Raw data (radar.npy).
             -`window`: The window function. 
+            -`dtype`: The complex type of the computations (complex64 halves the memory, but may differ in rounding).
+            -`workspace`: Preallocated complex buffer of at least Nx2xn, which is reused instead of allocating the data.
     """
 
-    window = window(inp.shape[-1])
-    window /= window.sum()
+    values, bins = get_extractor(window, dtype).extract(inp, workspace)
 
-    I = inp[:, :, 0, :]
-    Q = inp[:, :, 1, :]
+    return values, bins, pack_targets(values, bins)
 
-    data = I + 1j * Q
-    data -= data.mean(axis=-1, keepdims=True)
-    data = data * window
 
-    fft_data = np.fft.fft(data, axis=-1)
+def convert_chunked(path, target_path, chunk_size, dtype=np.complex128):
+    """
+    A function that converts a raw data file chunk by chunk, so that the memory does not depend on the recording length.
+    The raw data is memory-mapped and the target data is written incrementally to a memory-mapped .npy file.
+        -`path`: Path of the raw data file.
+        -`target_path`: Path of the target.npy file.
+        -`chunk_size`: The number of frames converted at once.
+        -`dtype`: The complex type of the workspace (see `fft`).
+        -`return`: The number of converted frames.
+    """
 
-    amps = np.abs(fft_data)
-    values, bins = torch.topk(torch.from_numpy(amps), k=2, dim=-1)
+    raw_data = np.load(path, mmap_mode="r")
+    num_frames = raw_data.shape[0]
 
-    values = values.numpy().astype(np.uint16)
-    bins = bins.numpy().astype(np.uint16)
+    target = np.lib.format.open_memmap(target_path, mode="w+", dtype=np.uint16, shape=(num_frames, 8))
+    workspace = np.empty((min(chunk_size, num_frames), raw_data.shape[1], raw_data.shape[3]), dtype=dtype)
 
-    d_bins = bins + ((values & 0x00FF) << 8)
-    d_amps = (values & 0x0FF0) >> 4
+    for start in range(0, num_frames, chunk_size):
+        stop = min(start + chunk_size, num_frames)
+        _, _, target[start:stop] = fft(raw_data[start:stop], gauss, dtype, workspace)
 
-    # merge bits for allowing matlab to reconstruct them.
-    save_data = np.stack(
-        (
-            d_bins[:, 0, 0],
-            d_amps[:, 0, 0],
-            d_bins[:, 0, 1],
-            d_amps[:, 0, 1],
-            d_bins[:, 1, 0],
-            d_amps[:, 1, 0],
-            d_bins[:, 1, 1],
-            d_amps[:, 1, 1],
-        ),
-        axis=-1,
-    )
+    target.flush()
+    del target
 
-    return values, bins, save_data
+    return num_frames
 
 
-def decode(inp):
+def convert_file(path, force=False, chunk_size=None, dtype=np.complex128):
     """
-    A function, that given the target input data, decodes the amplitudes and bins, to give to the Matlab algorithm.
-        -`inp`: Target data (target.npy).
+    A function that converts a single raw_data.npy file into the target.npy file in the same directory.
+        -`path`: Path of the raw_data.npy file.
+        -`force`: Converts the file, even if its target.npy file is newer.
+        -`chunk_size`: Converts the file in chunks of this number of frames (see `convert_chunked`), None loads it at once.
+        -`dtype`: The complex type of the computations (see `fft`).
+        -`return`: The number of converted frames (0 if the file was skipped).
     """
 
-    N = inp.shape[0]
+    path = Path(path)
+    target_path = path.parent / "target.npy"
 
-    tmp = inp.reshape(N, -1)
-    target_bins = tmp[:, ::2]
-    target_amps = tmp[:, 1::2]
+    if not force and target_path.exists() and target_path.stat().st_mtime >= path.stat().st_mtime:
+        return 0
 
-    decoded_bins = target_bins & 0x00FF
-    decoded_amps = ((target_bins & 0xFF00) >> 8) + ((target_amps & 0x00FF) << 4)
+    if chunk_size is None:
+        raw_data = np.load(path)
+        _, _, target = fft(raw_data, gauss, dtype)
+
+        np.save(target_path, target)
+
+        return target.shape[0]
 
-    amps = decoded_amps.reshape(N, 2, 2)
-    bins = decoded_bins.reshape(N, 2, 2)
+    # an interrupted conversion must not leave a target.npy, which looks up to date
+    partial_path = path.parent / "target.partial.npy"
+    num_frames = convert_chunked(path, partial_path, chunk_size, dtype)
+    os.replace(partial_path, target_path)
 
-    return amps, bins
+    return num_frames
 
 
-def raw_to_target_converter(folder_name):
+def raw_to_target_converter(
+    folder_name, workers=1, force=False, chunk_size=None, dtype=np.complex128, source_name="raw_data.npy"
+):
     """
-    A function that converts the radar.npy files into target.npy files and saves in the same directory.
-        -`folder_name`: The folder name containing the radar.npy files. (data/folder_name)
+    A function that converts the raw_data.npy files into target.npy files and saves in the same directory.
+        -`folder_name`: The folder name containing the raw_data.npy files. (data/folder_name)
+        -`workers`: The number of processes converting the files (None for one per CPU).
+        -`force`: Converts also the files, whose target.npy files are up to date.
+        -`chunk_size`: Converts the files in chunks of this number of frames, None loads them at once.
+        -`dtype`: The complex type of the computations (see `fft`).
+        -`source_name`: The file name of the raw data (raw_data.npy or radar.npy).
     """
 
     folder_name = Path(folder_name)
 
-    # find paths of the radar.npy files in the folder
-    raw_data_path_list = list(folder_name.rglob("**/raw_data.npy"))
+    # find paths of the raw_data.npy files in the folder
+    raw_data_path_list = sorted(folder_name.rglob(f"**/{source_name}"))
 
-    # convert each radar.npy file to target.npy file and save in the same directory
-    for path in raw_data_path_list:
-        raw_data = np.load(path)
-        _, _, target = fft(raw_data, gauss)
+    start = time.perf_counter()
+    convert = partial(convert_file, force=force, chunk_size=chunk_size, dtype=dtype)
+
+    # convert each raw_data.npy file to target.npy file and save in the same directory
+    if workers == 1:
+        num_frames = [convert(path) for path in raw_data_path_list]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            num_frames = list(executor.map(convert, raw_data_path_list))
+
+    duration = time.perf_counter() - start
+    num_converted = sum(n > 0 for n in num_frames)
 
-        np.save(path.parent / "target", target)
+    print(
+        f"converted {num_converted} of {len(raw_data_path_list)} files "
+        f"({len(raw_data_path_list) - num_converted} up to date) in {duration:.1f} s, "
+        f"{num_converted / max(duration, 1e-9):.1f} files/s, {sum(num_frames) / max(duration, 1e-9):.0f} frames/s"
+    )
 
 
 if __name__ == "__main__":
@@ -121,9 +137,44 @@ if __name__ == "__main__":
         help="folder name of a file containing recordings",
         required=True,
     )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="number of processes converting the files (default: one per CPU)",
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="convert also the files, whose target.npy is newer than the raw_data.npy",
+    )
+    parser.add_argument(
+        "--chunk-size",
+        type=int,
+        default=None,
+        help="memory-map the recordings and convert them in chunks of this number of frames",
+    )
+    parser.add_argument(
+        "--complex64",
+        action="store_true",
+        help="compute in complex64 (half the memory, may differ in rounding from complex128)",
+    )
+    parser.add_argument(
+        "--source-name",
+        type=str,
+        default="raw_data.npy",
+        help="file name of the raw data, e.g. radar.npy",
+    )
 
     args = parser.parse_args()
 
     # TODO: add error handlings, such as for the case when there is no folder with the given name
 
-    raw_to_target_converter(folder_name=args.folder_name)
+    raw_to_target_converter(
+        folder_name=args.folder_name,
+        workers=args.workers,
+        force=args.force,
+        chunk_size=args.chunk_size,
+        dtype=np.complex64 if args.complex64 else np.complex128,
+        source_name=args.source_name,
+    )
@@ -0,0 +1,70 @@
+"""
+The decoding of the bit-packed target data (target.npy) into the amplitudes and bins, shared by the training,
+the inference and the matlab port.
+
+Every target is packed into 2 little-endian uint16 words (see `target_extractor.pack_targets`), i.e. 4 bytes:
+    byte 0: bin, byte 1: amplitude bits 0-7, byte 2: amplitude bits 4-11, byte 3: unused
+so that an Nx8 target array is an Nx4 array of records (2 antennas x 2 targets), whose fields are views of it.
+"""
+import numpy as np
+
+TARGET_RECORD = np.dtype(
+    {
+        "names": ["bin", "amp_low", "amp_high"],
+        "formats": ["u1", "u1", "u1"],
+        "offsets": [0, 1, 2],
+        "itemsize": 4,
+    }
+)
+
+
+def target_records(target):
+    """
+    The targets as records, without copying the target data if it is a C-contiguous uint16 array.
+        -`target`: Nx8 (or Nx2x4) target data (target.npy)
+        -`return`: Nx4 TARGET_RECORD array
+    """
+    target = np.asarray(target)
+    if target.dtype != np.dtype("<u2") or not target.flags.c_contiguous:
+        target = np.ascontiguousarray(target, dtype="<u2")
+
+    return target.reshape(target.shape[0], 8).view(TARGET_RECORD)
+
+
+def _rows(out, num_frames):
+    """
+    The output as Nx4 view, an error is raised instead of writing into a copy.
+    """
+    rows = out.reshape(num_frames, 4)
+    if rows.size and not np.may_share_memory(rows, out):
+        raise ValueError(f"The output of shape {out.shape} and strides {out.strides} can not be viewed as Nx4")
+
+    return rows
+
+
+def decode(inp, amps=None, bins=None, dtype=None):
+    """
+    A function, that given the target input data, decodes the amplitudes and bins in one pass over the targets.
+        -`inp`: Nx8 target data (target.npy).
+        -`amps`, `bins`: Preallocated outputs with N*4 elements (e.g. Nx2x2 or the Nx4 columns of a feature array)
+                         of any numeric type.
+        -`dtype`: The type of the outputs that are allocated (default: the type of `inp`, uint16 for lists).
+        -`return`: Nx2x2 amplitudes and bins (or the given outputs)
+    """
+    records = target_records(inp)
+    num_frames = records.shape[0]
+    if dtype is None:
+        dtype = inp.dtype.type if isinstance(inp, np.ndarray) else np.uint16
+
+    if amps is None:
+        amps = np.empty((num_frames, 2, 2), dtype=dtype)
+    if bins is None:
+        bins = np.empty((num_frames, 2, 2), dtype=dtype)
+
+    amp_rows, bin_rows = _rows(amps, num_frames), _rows(bins, num_frames)
+
+    np.multiply(records["amp_high"], 16, out=amp_rows, dtype=amp_rows.dtype.type, casting="unsafe")
+    np.add(amp_rows, records["amp_low"], out=amp_rows, dtype=amp_rows.dtype.type, casting="unsafe")
+    np.copyto(bin_rows, records["bin"], casting="unsafe")
+
+    return amps, bins
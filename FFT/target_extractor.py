@@ -0,0 +1,166 @@
+"""
+The target extraction (raw data -> 2 strongest FFTs/targets) shared by the converter, the data recorder and the training.
+"""
+from functools import lru_cache
+
+import numpy as np
+
+
+def gauss(n):
+    """
+    A window function that is applied on the raw data before the Fourier Transformation.
+    Parameters:
+        -`n`: The number of samples for constructing the window.
+    """
+    n += 1
+    x = np.arange(-n // 2 + 1, n // 2)
+    x = 2 * x / n
+    y = np.exp(-1 / (1 - x**2))
+
+    return y / y.sum()
+
+
+def top_k(amps, k=2, overwrite=False):
+    """
+    The k strongest FFTs/targets along the last axis, strongest first (the lower bin first on equal amplitudes).
+        -`amps`: The FFT amplitudes.
+        -`k`: The number of targets.
+        -`overwrite`: The found targets may be overwritten in `amps` instead of in a copy of it.
+        -`return`: values and bins of the targets
+    """
+    if not overwrite:
+        amps = amps.copy()
+
+    values = np.empty(amps.shape[:-1] + (k,), dtype=amps.dtype)
+    bins = np.empty(amps.shape[:-1] + (k,), dtype=np.intp)
+
+    # k passes of argmax over the few bins are cheaper than a partition and a sort
+    for i in range(k):
+        index = amps.argmax(axis=-1)[..., None]
+        bins[..., i : i + 1] = index
+        values[..., i : i + 1] = np.take_along_axis(amps, index, axis=-1)
+        np.put_along_axis(amps, index, -np.inf, axis=-1)
+
+    return values, bins
+
+
+def pack_targets(values, bins):
+    """
+    Merges the bits of the targets for allowing matlab to reconstruct them (inverse of `decode`).
+        -`values`: Nx2x2 uint16 amplitudes
+        -`bins`: Nx2x2 uint16 bins
+        -`return`: Nx8 target data (target.npy)
+    """
+    d_bins = bins + ((values & 0x00FF) << 8)
+    d_amps = (values & 0x0FF0) >> 4
+
+    return np.stack(
+        (
+            d_bins[:, 0, 0],
+            d_amps[:, 0, 0],
+            d_bins[:, 0, 1],
+            d_amps[:, 0, 1],
+            d_bins[:, 1, 0],
+            d_amps[:, 1, 0],
+            d_bins[:, 1, 1],
+            d_amps[:, 1, 1],
+        ),
+        axis=-1,
+    )
+
+
+class TargetExtractor:
+    """
+    Extracts the targets from the raw data. The mean removal, the windowing and the FFT of all the frames are done
+    in one batched pass on a single complex buffer, the normalized window is computed once per number of samples.
+        -`window`: The window function (None for no window).
+        -`dtype`: The complex type of the computations, complex128 gives the results of the original `fft`
+                  functions, complex64 halves the memory and is faster, but may differ in rounding.
+        -`num_targets`: The number of the strongest FFTs that are kept.
+    """
+
+    def __init__(self, window=gauss, dtype=np.complex128, num_targets=2):
+        self.window = window
+        self.dtype = np.dtype(dtype)
+        self.num_targets = num_targets
+        self._windows = {}
+
+    def get_window(self, n):
+        """
+        The normalized window for n samples (cached).
+        """
+        if n not in self._windows:
+            if self.window is None:
+                self._windows[n] = None
+            else:
+                window = self.window(n)
+                window /= window.sum()
+                self._windows[n] = window.astype(np.finfo(self.dtype).dtype)
+
+        return self._windows[n]
+
+    def spectrum(self, inp, workspace=None):
+        """
+        The FFT of the mean free, windowed raw data.
+            -`inp`: ...x2x2xn raw data (radar.npy), the IQ components on the second to last axis
+            -`workspace`: Preallocated complex buffer (at least the size of the result) which is reused
+            -`return`: ...x2xn FFT data
+        """
+        shape = inp.shape[:-2] + inp.shape[-1:]
+        if workspace is None:
+            data = np.empty(shape, dtype=self.dtype)
+        else:
+            data = workspace.reshape(-1)[: int(np.prod(shape))].reshape(shape)
+
+        data.real = inp[..., 0, :]
+        data.imag = inp[..., 1, :]
+
+        data -= data.mean(axis=-1, keepdims=True)
+
+        window = self.get_window(inp.shape[-1])
+        if window is not None:
+            data *= window
+
+        return np.fft.fft(data, axis=-1)
+
+    def extract(self, inp, workspace=None):
+        """
+        The strongest FFTs/targets of the raw data.
+            -`inp`: ...x2x2xn raw data (radar.npy)
+            -`workspace`: see `spectrum`
+            -`return`: ...x2xnum_targets uint16 values and bins
+        """
+        values, bins = top_k(np.abs(self.spectrum(inp, workspace)), self.num_targets, overwrite=True)
+
+        return values.astype(np.uint16), bins.astype(np.uint16)
+
+    def target(self, inp, workspace=None):
+        """
+        The target data as recorded by the radar.
+            -`inp`: Nx2x2xn raw data (radar.npy)
+            -`workspace`: see `spectrum`
+            -`return`: Nx8 bit-packed target data (target.npy)
+        """
+        return pack_targets(*self.extract(inp, workspace))
+
+    def values_bins(self, inp, workspace=None):
+        """
+        The unpacked target data used by the training.
+            -`inp`: ...x2x2xn raw data (radar.npy)
+            -`workspace`: see `spectrum`
+            -`return`: ...x8 uint16 data, the 4 values followed by the 4 bins
+        """
+        values, bins = self.extract(inp, workspace)
+        shape = values.shape[:-2] + (values.shape[-2] * values.shape[-1],)
+
+        return np.concatenate((values.reshape(shape), bins.reshape(shape)), axis=-1)
+
+    __call__ = target
+
+
+@lru_cache(maxsize=None)
+def get_extractor(window=gauss, dtype=np.complex128, num_targets=2):
+    """
+    A shared TargetExtractor, so that the windows are cached between calls.
+    """
+    return TargetExtractor(window, dtype, num_targets)
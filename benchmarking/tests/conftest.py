@@ -31,7 +31,7 @@ def pytest_addoption(parser):
     """Add custom cmd line options.
 
     Options:
-        --app: Select between C & Matlab application.
+        --app: Select between C, Matlab & Python applications.
         --scope: Select the scope of the test cases. The scope for individual recordings is defined in recs.yaml.
         --matlab-path: Select custom path to matlab app.
         --report-tracks: If flag is set, the report will include track metrics and plots.
@@ -56,7 +56,15 @@ def pytest_addoption(parser):
         action="store",
         default="c",
         type=str,
-        choices=["c", "matlab", "python"],
+        choices=[
+            "c",
+            "matlab",
+            "python",
+            "python-server",
+            "python-inprocess",
+            "python-classic",
+            "python-classic-cli",
+        ],
         help="Application to use.",
     )
 
@@ -1,12 +1,16 @@
 """Fixtures and classes for different types of benchmarking inputs."""
+import atexit
 import copy
+import importlib
 import json
 import os
 import shlex
 import subprocess
+import sys
 from abc import ABC, abstractmethod
 from pathlib import Path
-from typing import Optional
+from types import ModuleType
+from typing import Optional, Tuple
 
 import numpy as np
 import pandas as pd
@@ -15,7 +19,8 @@ from _pytest.fixtures import FixtureRequest
 from ifxdaq.utils.common import read_json
 
 from ..utils.cfg import BenchmarkConfig
-from .utils import load_timestamps
+from ..utils.kicks import kicks_to_frame
+from .utils import find_archived, load_array, load_timestamps, recording_file_exists
 
 __all__ = ["input_reference", "input_app"]
 
@@ -66,7 +71,9 @@ class InputABC(ABC):
             Datetime index with the absolute timestamps.
         """
         timestamps_file = self._recording_path / self._TIMESTAMP_FILENAME
-        if not timestamps_file.exists():  # Fallback for legacy ifxdaq format
+        if not recording_file_exists(
+            timestamps_file
+        ):  # Fallback for legacy ifxdaq format
             timestamps_file = self._recording_path / "time.csv"
         return load_timestamps(timestamps_file)
 
@@ -100,6 +107,14 @@ class Algorithm(InputABC):
     def _command(self) -> str:
         pass
 
+    @staticmethod
+    def _import_script(script_path: Path) -> ModuleType:
+        """Import a python script of the repository (its folder is added to the path for its own imports)."""
+        script_dir = script_path.parent.as_posix()
+        if script_dir not in sys.path:
+            sys.path.insert(0, script_dir)
+        return importlib.import_module(script_path.stem)
+
     def _get_app_results(self, shell=False) -> str:
         """Run command and return stdout."""
         # Insert the recording into the command.
@@ -207,18 +222,46 @@ class MatlabAlgorithm(Algorithm):
             json.loads(s) for s in app_stdout.split("\n") if s.startswith("{")
         ]
 
-        df_kick = pd.DataFrame(
-            data={"kick": [0 for _ in range(len(self.timestamps))]},
-            index=self.timestamps,
+        kicks = [
+            (frame_output["kick_start"], frame_output["frame"])
+            for frame_output in parsed_output
+            if frame_output["yagi_kick"] and frame_output["patch_kick"]
+        ]
+        kick_starts, kick_stops = zip(*kicks) if kicks else ((), ())
+        return kicks_to_frame(kick_starts, kick_stops, self.timestamps)
+
+
+class ClassicPythonAlgo(MatlabAlgorithm):
+    """Python port of the matlab kick detection (matlab/matlab2python) run as an application.
+
+    The script prints the same JSON lines as the matlab application.
+
+    Args:
+        recording_path: Path to the recording.
+        config: Benchmarking configuration.
+        stdout_dir: Path where results are stored.
+    """
+
+    @property
+    def name(self) -> str:
+        """Display name/prefix in plots.
+
+        Returns:
+            Prefix/name.
+        """
+        return "Classic-Python-Algo"
+
+    @property
+    def _command(self) -> str:
+        script_path = Path(os.path.realpath(__file__)).parents[3]
+        script_path = (
+            script_path
+            / "matlab"
+            / "matlab2python"
+            / "kick_detection_recording_optimized.py"
         )
 
-        for frame_output in parsed_output:
-            if frame_output["yagi_kick"] and frame_output["patch_kick"]:
-                kick_start = frame_output["kick_start"]
-                kick_stop = frame_output["frame"]
-                kick_duration = kick_stop - kick_start + 1
-                df_kick.iloc[kick_start - 1 : kick_stop] = np.ones((kick_duration, 1))
-        return df_kick
+        return "python " + script_path.as_posix() + " --target {}"
 
 
 class PythonMLAlgo(Algorithm):
@@ -259,17 +302,9 @@ class PythonMLAlgo(Algorithm):
                 json.loads(s) for s in app_stdout.split("\n") if s.startswith("{")
             ]
 
-            df_kick = pd.DataFrame(
-                data={"kick": [0 for _ in range(len(self.timestamps))]},
-                index=self.timestamps,
-            )
-
-            for frame_output in parsed_output:
-                kick_start = frame_output["kick_start"]
-                kick_stop = frame_output["frame"]
-                kick_duration = kick_stop - kick_start + 1
-                df_kick.iloc[kick_start - 1 : kick_stop] = np.ones((kick_duration, 1))
-            return df_kick
+            kick_starts = [frame_output["kick_start"] for frame_output in parsed_output]
+            kick_stops = [frame_output["frame"] for frame_output in parsed_output]
+            return kicks_to_frame(kick_starts, kick_stops, self.timestamps)
         except Exception as e:
             print(e)
 
@@ -282,6 +317,202 @@ class PythonMLAlgo(Algorithm):
         return self._parse_kicks(app_stdout=app_out)
 
 
+class PythonMLServerAlgo(PythonMLAlgo):
+    """Python ML input answered by a long-lived inference server (tf_net/inference_server.py).
+
+    The server is started with the first recording and is shared by all the following recordings of the
+    process (pytest-xdist worker), so that python startup, tensorflow import and weight loading are paid once.
+
+    Args:
+        recording_path: Path to the recording.
+        config: Benchmarking configuration.
+        stdout_dir: Path where results are stored.
+    """
+
+    _server: Optional[subprocess.Popen] = None
+
+    @property
+    def _command(self) -> str:
+        script_path = Path(os.path.realpath(__file__))
+        script_path = script_path.parents[3] / "tf_net" / "inference_server.py"
+
+        return "python " + script_path.as_posix()
+
+    @classmethod
+    def _stop_server(cls) -> None:
+        """Close the server input, the server exits after answering the pending requests."""
+        if cls._server is not None:
+            cls._server.stdin.close()
+            cls._server.wait()
+            cls._server = None
+
+    def _get_server(self) -> subprocess.Popen:
+        """Return the running server or start a new one."""
+        cls = type(self)
+        if cls._server is None or cls._server.poll() is not None:
+            # shell=True it is needed to run python from virtual-env, otherwise standard python is run.
+            cls._server = subprocess.Popen(
+                self._command,
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                universal_newlines=True,
+                shell=True,
+            )
+            atexit.register(cls._stop_server)
+        return cls._server
+
+    def _get_app_results(self, shell=True) -> str:
+        """Send the recording to the server and return its kicks in the stdout format of tf_inference.py.
+
+        The kicks are rendered with `tf_inference.format_kick`, so that the saved stdout artifacts are the same as the
+        ones of `--app python`.
+        """
+        server = self._get_server()
+        request = {"path": (self._recording_path / "target.npy").as_posix()}
+        server.stdin.write(json.dumps(request) + "\n")
+        server.stdin.flush()
+
+        response = server.stdout.readline()
+        if not response:
+            pytest.fail(msg=f"\nInference server terminated with returncode: {server.poll()}")
+        response = json.loads(response)
+        if "error" in response:
+            pytest.fail(msg=f"\nInference server error:\n{response['error']}")
+
+        tf_inference = self._import_script(
+            Path(os.path.realpath(__file__)).parents[3] / "tf_net" / "tf_inference.py"
+        )
+        return "".join(
+            tf_inference.format_kick(kick["frame"], kick["kick_start"]) + "\n"
+            for kick in response["kicks"]
+        )
+
+
+class InProcessAlgorithm(Algorithm):
+    """Base class for python algorithms that are imported and called directly on the loaded target data.
+
+    There is no subprocess and no stdout parsing: the detector returns the kick intervals as arrays. The stdout
+    artifact is still written (the lines the script prints for these kicks) for traceability.
+
+    Args:
+        recording_path: Path to the recording.
+        config: Benchmarking configuration.
+        stdout_dir: Path where results are stored.
+    """
+
+    _SCRIPT: Path
+
+    @property
+    def _command(self) -> str:
+        raise NotImplementedError(
+            f"{type(self).__name__} calls {self._SCRIPT.name} in-process, there is no command to run"
+        )
+
+    @abstractmethod
+    def _detect(self, target: np.ndarray) -> Tuple[np.ndarray, np.ndarray, str]:
+        """Detect the kicks in the target data.
+
+        Args:
+            target: Target data (target.npy).
+
+        Returns:
+            Kick starts and kick stops (same convention as `kick_start` and `frame` of the stdout lines) and the
+            stdout of the script for the recording.
+        """
+        raise NotImplementedError
+
+    def _calculate_kicks(
+        self,
+    ) -> pd.DataFrame:
+        target = load_array(self._recording_path / "target.npy")
+        kick_starts, kick_stops, stdout = self._detect(target)
+
+        df_kick = kicks_to_frame(kick_starts, kick_stops, self.timestamps)
+
+        self._save_app_output(stdout=stdout)
+        return df_kick
+
+
+class PythonMLInProcessAlgo(InProcessAlgorithm):
+    """Python ML input, tf_net/tf_inference.py called in-process (the model is loaded once per process).
+
+    Args:
+        recording_path: Path to the recording.
+        config: Benchmarking configuration.
+        stdout_dir: Path where results are stored.
+    """
+
+    _SCRIPT = Path(os.path.realpath(__file__)).parents[3] / "tf_net" / "tf_inference.py"
+    _model = None
+
+    @property
+    def name(self) -> str:
+        """Display name/prefix in plots.
+
+        Returns:
+            Prefix/name.
+        """
+        return "ML-Algo"
+
+    def _detect(self, target: np.ndarray) -> Tuple[np.ndarray, np.ndarray, str]:
+        tf_inference = self._import_script(self._SCRIPT)
+        if PythonMLInProcessAlgo._model is None:
+            PythonMLInProcessAlgo._model = tf_inference.load_model()
+
+        kicks = tf_inference.predict_kicks(
+            PythonMLInProcessAlgo._model, tf_inference.preprocess_target(target)
+        )
+        kicks = np.array(kicks, dtype=int).reshape(-1, 2)
+        stdout = "".join(
+            tf_inference.format_kick(stop, start) + "\n" for stop, start in kicks
+        )
+        return kicks[:, 1], kicks[:, 0], stdout
+
+
+class ClassicPythonInProcessAlgo(InProcessAlgorithm):
+    """Python port of the matlab kick detection (matlab/matlab2python) called in-process.
+
+    The stdout artifact holds the JSON line of every kick candidate (`yagi_kick`/`patch_kick`), like the one of
+    `--app python-classic-cli`, so that `MatlabAlgorithm._parse_kicks` parses it into the same kicks.
+
+    Args:
+        recording_path: Path to the recording.
+        config: Benchmarking configuration.
+        stdout_dir: Path where results are stored.
+    """
+
+    _SCRIPT = (
+        Path(os.path.realpath(__file__)).parents[3]
+        / "matlab"
+        / "matlab2python"
+        / "kick_detection_recording_optimized.py"
+    )
+
+    @property
+    def name(self) -> str:
+        """Display name/prefix in plots.
+
+        Returns:
+            Prefix/name.
+        """
+        return "Classic-Python-Algo"
+
+    def _detect(self, target: np.ndarray) -> Tuple[np.ndarray, np.ndarray, str]:
+        script = self._import_script(self._SCRIPT)
+        candidates, _, _ = script.kick_candidates(target)
+        kicks = np.array(
+            [
+                (candidate["kick_start"], candidate["frame"])
+                for candidate in candidates
+                if candidate["yagi_kick"] and candidate["patch_kick"]
+            ],
+            dtype=int,
+        ).reshape(-1, 2)
+        stdout = "".join(line + "\n" for line in script.format_candidates(candidates))
+        # the port counts the frames from 0, the matlab application (and the parsing) from 1
+        return kicks[:, 0] + 1, kicks[:, 1] + 1, stdout
+
+
 class Label(InputABC):
     """Camera/Label based input.
 
@@ -318,7 +549,9 @@ class Label(InputABC):
             Datetime index with the absolute timestamps.
         """
         timestamps_file = self._recording_path / self._TIMESTAMP_FILENAME
-        if not timestamps_file.exists():  # Fallback for legacy ifxdaq format
+        if not recording_file_exists(
+            timestamps_file
+        ):  # Fallback for legacy ifxdaq format
             return pd.DatetimeIndex([])
         return load_timestamps(timestamps_file)
 
@@ -326,8 +559,8 @@ class Label(InputABC):
         self,
     ) -> pd.DataFrame:
         label_file = self._recording_path / "kick.json"
-        if (
-            not label_file.exists()
+        if not recording_file_exists(
+            label_file
         ):  # If no label file exists, we assume that the recording does not contain any kick.
             df_kick = pd.DataFrame(
                 {"kick": [0 for _ in range(len(self._radar_timestamps))]}
@@ -336,9 +569,13 @@ class Label(InputABC):
 
             return df_kick
 
-        df_kick = pd.DataFrame(
-            data=read_json(label_file), index=self._load_timestamps()
+        archived_kicks = find_archived(label_file)
+        labels = (
+            read_json(label_file)
+            if archived_kicks is None
+            else {"kick": np.asarray(archived_kicks)}
         )
+        df_kick = pd.DataFrame(data=labels, index=self._load_timestamps())
 
         # Synchronize with radar timestamps, so that we have a label for each radar frame
         df_kick = df_kick.reindex(self._radar_timestamps, method="nearest")
@@ -422,6 +659,22 @@ def _get_input(
         inp = PythonMLAlgo(
             recording_path=radar_recording, config=config, stdout_dir=stdout_dir
         )
+    elif input_type.lower() == "python-server":
+        inp = PythonMLServerAlgo(
+            recording_path=radar_recording, config=config, stdout_dir=stdout_dir
+        )
+    elif input_type.lower() == "python-inprocess":
+        inp = PythonMLInProcessAlgo(
+            recording_path=radar_recording, config=config, stdout_dir=stdout_dir
+        )
+    elif input_type.lower() == "python-classic":
+        inp = ClassicPythonInProcessAlgo(
+            recording_path=radar_recording, config=config, stdout_dir=stdout_dir
+        )
+    elif input_type.lower() == "python-classic-cli":
+        inp = ClassicPythonAlgo(
+            recording_path=radar_recording, config=config, stdout_dir=stdout_dir
+        )
     else:
         label_dir = next(radar_recording.parent.glob("Labels_*"))
         inp = Label(
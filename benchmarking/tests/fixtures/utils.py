@@ -1,15 +1,118 @@
 """Fixtures to process data with the applications."""
-from datetime import datetime
+import sys
+from functools import lru_cache
 from pathlib import Path
+from typing import Optional, Tuple
 
+import numpy as np
 import pandas as pd
 import pytest
 
-__all__ = ["load_timestamps", "radar_timestamps", "stdout_dir"]
+sys.path.insert(0, str(Path(__file__).resolve().parents[3] / "ifxdaq"))
+from session_archive import ARCHIVE_NAME, SessionArchive
+
+__all__ = [
+    "find_archived",
+    "load_array",
+    "load_timestamps",
+    "radar_timestamps",
+    "recording_file_exists",
+    "stdout_dir",
+]
+
+
+@lru_cache(maxsize=None)
+def _open_archive(archive_file: Path, mtime_ns: int) -> SessionArchive:
+    """Open a session archive once per session and modification.
+
+    Args:
+        archive_file: Resolved path to the archive.
+        mtime_ns: Modification time of the archive, part of the cache key.
+
+    Returns:
+        The archive.
+    """
+    return SessionArchive(archive_file)
+
+
+@lru_cache(maxsize=None)
+def _archive_files(folder: Path) -> Tuple[Path, ...]:
+    """Look up the session archives of a folder and of its parent folders once per folder.
+
+    Archives, which are created later in the process, are not found.
+
+    Args:
+        folder: Resolved path to the folder.
+
+    Returns:
+        The archives, the nearest first.
+    """
+    return tuple(
+        parent / ARCHIVE_NAME
+        for parent in (folder, *folder.parents)
+        if (parent / ARCHIVE_NAME).exists()
+    )
+
+
+def _mtime_ns(path: Path) -> int:
+    """Modification time of a file, -1 if it does not exist."""
+    try:
+        return path.stat().st_mtime_ns
+    except FileNotFoundError:
+        return -1
+
+
+def find_archived(path: Path) -> Optional[np.ndarray]:
+    """Look up a file of a recording in the session archive (ifxdaq/session_archive.py) of its parent folders.
+
+    Args:
+        path: Path to the file (e.g. `.../RadarIfxMimose_00/target.npy`).
+
+    An archived file, whose file in the recording folder exists and differs (size or modification time), is stale
+    and the file on disk is taken instead.
+
+    Returns:
+        The archived (memory-mapped) array of the file, None if it is not archived or stale.
+    """
+    path = Path(path).resolve()
+    for archive_file in _archive_files(path.parent):
+        archive = _open_archive(archive_file, _mtime_ns(archive_file))
+        array = archive.find(path)
+        if array is not None:
+            return array
+    return None
+
+
+def recording_file_exists(path: Path) -> bool:
+    """Check if a file of a recording exists, in its folder or in the session archive.
+
+    Args:
+        path: Path to the file.
+
+    Returns:
+        True, if the file exists.
+    """
+    return Path(path).exists() or find_archived(path) is not None
+
+
+def load_array(path: Path) -> np.ndarray:
+    """Load a .npy file of a recording, from the session archive if it is archived.
+
+    Args:
+        path: Path to the file.
+
+    Returns:
+        The array.
+    """
+    array = find_archived(path)
+    return np.load(path) if array is None else array
 
 
 def load_timestamps(timestamps_file: Path) -> pd.DatetimeIndex:
-    """Load the timestamps from a file.
+    """Load the timestamps from a file (or from the session archive, if the file is archived).
+
+    The file is read once per modification of the file and of its session archives, later calls return the
+    cached index.
 
     Args:
         timestamps_file: Path to the file.
@@ -17,13 +120,51 @@ def load_timestamps(timestamps_file: Path) -> pd.DatetimeIndex:
     Returns:
         Timestamps as DatetimeIndex.
     """
-    with open(timestamps_file, "r", encoding="utf-8") as f_handle:
-        timestamps = [
-            datetime.utcfromtimestamp(float(line)) for line in f_handle.readlines()
-        ]
-    timestamps = pd.to_datetime(timestamps)
+    timestamps_file = Path(timestamps_file).resolve()
+    archives_mtime_ns = tuple(
+        _mtime_ns(archive_file)
+        for archive_file in _archive_files(timestamps_file.parent)
+    )
+    return _load_timestamps(
+        timestamps_file, _mtime_ns(timestamps_file), archives_mtime_ns
+    )
+
+
+@lru_cache(maxsize=None)
+def _load_timestamps(
+    timestamps_file: Path, mtime_ns: int, archives_mtime_ns: Tuple[int, ...]
+) -> pd.DatetimeIndex:
+    """Read the timestamps (seconds since epoch, one per line) of a file or of its session archive.
+
+    Args:
+        timestamps_file: Resolved path to the file.
+        mtime_ns: Modification time of the file (-1 if it does not exist), part of the cache key.
+        archives_mtime_ns: Modification times of the session archives, part of the cache key.
+
+    Returns:
+        Timestamps as DatetimeIndex.
+    """
+    seconds = find_archived(timestamps_file)
+    if seconds is None:
+        seconds = np.loadtxt(timestamps_file, dtype=np.float64, ndmin=1)
+
+    return _to_datetime(seconds)
+
+
+def _to_datetime(seconds: np.ndarray) -> pd.DatetimeIndex:
+    """Convert timestamps in seconds since epoch.
+
+    Args:
+        seconds: Timestamps in seconds since epoch.
+
+    Returns:
+        Timestamps as DatetimeIndex.
+    """
+    # rounded to microseconds like `datetime.utcfromtimestamp`
+    fraction, integer = np.modf(seconds)
+    microseconds = integer.astype(np.int64) * 1_000_000 + np.round(fraction * 1e6).astype(np.int64)
 
-    return timestamps
+    return pd.to_datetime(microseconds, unit="us")
 
 
 @pytest.fixture(scope="package")
@@ -37,7 +178,7 @@ def radar_timestamps(radar_recording: Path) -> pd.DatetimeIndex:
         Datetime index with the absolute radar timestamps.
     """
     timestamps_file = radar_recording / "radar_timestamp.csv"
-    if not timestamps_file.exists():
+    if not recording_file_exists(timestamps_file):
         timestamps_file = radar_recording / "target_timestamp.csv"
 
     return load_timestamps(timestamps_file)
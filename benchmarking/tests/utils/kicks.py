@@ -0,0 +1,86 @@
+"""Rasterization of detected kicks into per-frame labels."""
+import numpy as np
+import pandas as pd
+import pytest
+
+__all__ = ["kicks_to_mask", "kicks_to_frame"]
+
+
+def _slice_bound(index: np.ndarray, length: int) -> np.ndarray:
+    """Normalize slice bounds like python slicing does (negative indices count from the end, then clip)."""
+    index = np.where(index < 0, index + length, index)
+    return np.clip(index, 0, length)
+
+
+def kicks_to_mask(kick_starts, kick_stops, num_frames: int) -> np.ndarray:
+    """Rasterize kicks into a frame mask with a single difference-array pass.
+
+    Each kick marks the frames `[kick_start - 1 : kick_stop]` (1-based kick start, inclusive kick stop), with the
+    semantics of python slicing.
+
+    Args:
+        kick_starts: Kick starts.
+        kick_stops: Kick stops.
+        num_frames: Number of frames of the recording.
+
+    Returns:
+        Mask with 1 for the frames inside a kick, 0 otherwise.
+    """
+    starts = _slice_bound(np.asarray(kick_starts, dtype=np.int64).reshape(-1) - 1, num_frames)
+    stops = _slice_bound(np.asarray(kick_stops, dtype=np.int64).reshape(-1), num_frames)
+    valid = starts < stops
+
+    diff = np.zeros(num_frames + 1, dtype=np.int64)
+    np.add.at(diff, starts[valid], 1)
+    np.add.at(diff, stops[valid], -1)
+
+    return (np.cumsum(diff[:-1]) > 0).astype(np.uint8)
+
+
+def kicks_to_frame(kick_starts, kick_stops, timestamps: pd.DatetimeIndex) -> pd.DataFrame:
+    """Rasterize kicks into a timestamp indexed data frame.
+
+    Args:
+        kick_starts: Kick starts (see `kicks_to_mask`).
+        kick_stops: Kick stops.
+        timestamps: Timestamps of the frames.
+
+    Returns:
+        Data frame with an int64 `kick` column (like the kicks of the labels). The former zero-filled frame, which the
+        kicks were assigned to with `iloc`, became float64 on pandas < 2.1. The metrics and plots only compare the
+        0/1 values, and the kick columns are not saved, so the results do not depend on it.
+    """
+    mask = kicks_to_mask(kick_starts, kick_stops, len(timestamps))
+    return pd.DataFrame(data={"kick": mask.astype(np.int64)}, index=timestamps)
+
+
+@pytest.mark.parametrize(
+    ["kick_starts", "kick_stops", "num_frames"],
+    [
+        ([], [], 5),
+        ([1], [3], 5),
+        ([3, 4], [5, 9], 8),
+        ([2, 6], [4, 7], 10),
+        ([0], [2], 6),
+        ([7], [7], 6),
+    ],
+)
+def test_kicks_to_mask(kick_starts, kick_stops, num_frames) -> None:
+    expected = np.zeros(num_frames, dtype=np.uint8)
+    for kick_start, kick_stop in zip(kick_starts, kick_stops):
+        expected[kick_start - 1 : kick_stop] = 1
+    assert np.array_equal(expected, kicks_to_mask(kick_starts, kick_stops, num_frames))
+
+
+def test_kicks_to_frame() -> None:
+    timestamps = pd.date_range("2023-01-18", periods=10, freq="40ms")
+    kick_starts, kick_stops = [2, 6], [4, 7]
+
+    # the former construction of the frame
+    expected = pd.DataFrame(data={"kick": [0 for _ in range(len(timestamps))]}, index=timestamps)
+    for kick_start, kick_stop in zip(kick_starts, kick_stops):
+        expected.iloc[kick_start - 1 : kick_stop] = np.ones((kick_stop - kick_start + 1, 1))
+
+    df_kick = kicks_to_frame(kick_starts, kick_stops, timestamps)
+    assert df_kick["kick"].dtype == np.int64
+    pd.testing.assert_frame_equal(df_kick, expected.astype(np.int64))
@@ -7,72 +7,209 @@ import keyboard
 import os
 import shutil
 import json
+import queue
+import sys
+import threading
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "FFT"))
+from target_extractor import TargetExtractor
 
 config_path = "RadarIfxMimose_00.json"
 
 
-def gauss(n):
-    """
-    A window function that is applied on the raw data before the Fourier Transformation.
-    Parameters:
-        -`n`: The number of samples for constructing the window.
-    """
-    n += 1
-    x = np.arange(-n // 2 + 1, n // 2)
-    x = 2 * x / n
-    y = np.exp(-1 / (1 - x**2))
+class NpyWriter:
+    '''
+    A writer, that streams rows (e.g. the label or the target of every frame) to a .npy file in chunks, so that every
+    frame costs the same (no reallocation) and the file is a valid .npy file of the rows written so far (after a crash
+    too).
+        Input:
+            -`path`: Path of the .npy file
+            -`dtype`: Type of the rows
+            -`row_shape`: Shape of a row (() for a single value per frame)
+            -`chunk_size`: Number of appended rows, which are buffered, before they are written (1 second at 25 fps)
+    '''
+
+    def __init__(self, path, dtype=np.uint16, row_shape=(), chunk_size=25):
+        self.path = Path(path)
+        self.buffer = np.zeros((chunk_size,) + tuple(row_shape), dtype=np.dtype(dtype).newbyteorder("<"))
+        self.buffered = 0
+        self.written = 0
+
+        self.file = open(self.path, "wb")
+        self.data_offset = self.write_header()
 
-    return y / y.sum()
+    def write_header(self):
+        # the header is padded to 128 bytes for any number of rows, so that it is rewritten in place
+        self.file.seek(0)
+        np.lib.format.write_array_header_1_0(
+            self.file,
+            {"descr": self.buffer.dtype.str, "fortran_order": False, "shape": (self.written,) + self.buffer.shape[1:]},
+        )
+        return self.file.tell()
 
+    def append(self, row):
+        self.buffer[self.buffered] = row
+        self.buffered += 1
 
-def fft(inp, window):
-    """
-        A function that converts the raw data into target data. The function removes the mean from the data, applies a window function, \
-        performs Fourier Transformation, takes the strongest 2 FFTs/targets, does the bit shifts and saves the data.
-        Parameters:
-            -`inp`: Raw data (radar.npy).
-            -`window`: The window function. 
-    """
+        if self.buffered == len(self.buffer):
+            self.flush()
 
-    window = window(inp.shape[-1])
-    window /= window.sum()
-    
-    I = inp[:, :, 0, :]
-    Q = inp[:, :, 1, :]
-
-    data = I + 1j * Q
-    data -= data.mean(axis=-1, keepdims=True)
-    data = data * window
-
-    fft_data = np.fft.fft(data, axis=-1)
-
-    amps = np.abs(fft_data)
-    # Get top k values
-    bins = np.argpartition(amps, -2, axis=-1)[..., -2:][..., ::-1]
-    values = np.take_along_axis(amps, indices=bins, axis=-1)
-
-    values = values.astype(np.uint16)
-    bins = bins.astype(np.uint16)
-
-    d_bins = bins + ((values & 0x00FF) << 8)
-    d_amps = (values & 0x0FF0) >> 4
-
-    # merge bits for allowing matlab to reconstruct them.
-    save_data = np.stack(
-        (
-            d_bins[:, 0, 0],
-            d_amps[:, 0, 0],
-            d_bins[:, 0, 1],
-            d_amps[:, 0, 1],
-            d_bins[:, 1, 0],
-            d_amps[:, 1, 0],
-            d_bins[:, 1, 1],
-            d_amps[:, 1, 1],
-        ),
-        axis=-1,
-    )
+    def extend(self, rows):
+        self.flush()
+        self.write(np.asarray(rows, dtype=self.buffer.dtype).reshape((-1,) + self.buffer.shape[1:]))
+
+    def write(self, rows):
+        self.file.seek(self.data_offset + self.written * self.buffer[0].nbytes)
+        self.file.write(rows.tobytes())
+        self.written += len(rows)
+
+        if self.write_header() != self.data_offset:
+            raise RuntimeError(f"The header of {self.path} changed its size")
+        self.file.flush()
+
+    def flush(self):
+        if self.buffered:
+            self.write(self.buffer[: self.buffered])
+            self.buffered = 0
+
+    def close(self):
+        self.flush()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def radar_frame(frame):
+    '''
+    A function for taking the raw data out of a frame of the device (the entry, which the DataRecorder saves as
+    radar.npy), as array or as `Frame` with a `data` array:
+        Input:
+            -`frame`: Frame of the device
+        Output:
+            - 2x2xn raw data of the frame
+    '''
+    data = frame["radar"]
+    data = np.asarray(getattr(data, "data", data))
+    if data.ndim != 3 or data.shape[:2] != (2, 2):
+        raise ValueError(f"Expected the radar data of a frame of shape 2x2xn, but got {data.shape}")
+
+    return data
+
+
+class OnlineTargetExtractor:
+    '''
+    Extracts the target of every recorded frame in a background thread and streams it to target.npy, so that the
+    target data is ready, when the recording stops. The frames are passed through a bounded queue, the acquisition
+    never waits for the extraction. The extraction takes the frames, which are waiting, at once (one batched FFT).
+    A failing extraction, or one which falls `max_frames` frames behind, never stops the recording: it stops itself,
+    keeps its error in `error` and target.npy is extracted from radar.npy after the recording (`extract_targets`).
+        Input:
+            -`path`: Path of target.npy
+            -`max_frames`: Size of the queue (40 seconds at 25 fps)
+    '''
+
+    def __init__(self, path, max_frames=1000):
+        self.writer = NpyWriter(path, dtype=np.uint16, row_shape=(8,))
+        self.extractor = TargetExtractor()
+        self.frames = queue.Queue(maxsize=max_frames)
+        self.frame_shape = None
+        self.error = None
+
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def put(self, frame):
+        '''
+        Queues a frame for the extraction, a frame without 2x2xn radar data (of the shape of the first frame) stops
+        the extraction at once:
+            Input:
+                -`frame`: Frame of the device (the raw data before the swap of `swap_raw_data`)
+        '''
+        if self.error is not None:
+            return
+
+        try:
+            raw_frame = radar_frame(frame)
+            if self.frame_shape is not None and raw_frame.shape != self.frame_shape:
+                raise ValueError(f"Expected the radar data of a frame of shape {self.frame_shape}, but got {raw_frame.shape}")
+        except Exception as e:
+            self.fail(e)
+            return
+        self.frame_shape = raw_frame.shape
 
-    return values, bins, save_data
+        try:
+            self.frames.put_nowait(np.array(raw_frame))
+        except queue.Full:
+            self.fail(RuntimeError(f"The target extraction fell {self.frames.maxsize} frames behind the recording"))
+
+    def fail(self, error):
+        if self.error is None:
+            print(f"The online target extraction stopped ({error!r}), target.npy is extracted after the recording")
+            self.error = error
+
+    def run(self):
+        stopped = False
+        while not stopped:
+            raw_frames = [self.frames.get()]
+            while not self.frames.empty() and raw_frames[-1] is not None:
+                raw_frames.append(self.frames.get())
+
+            stopped = raw_frames[-1] is None
+            if stopped:
+                raw_frames.pop()
+            if not raw_frames or self.error is not None:
+                continue
+
+            try:
+                # the frames with swapped antennas like the saved radar.npy
+                self.writer.extend(self.extractor.target(np.stack(raw_frames)[:, [1, 0]]))
+            except Exception as e:
+                self.fail(e)
+
+    def close(self):
+        self.frames.put(None)
+        self.thread.join()
+        self.writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def extract_targets(raw_path, target_path, chunk_size=10000):
+    '''
+    A function for extracting the target data of a recording from its (swapped) raw data after the recording, chunk by
+    chunk of a memory-mapped file (the fallback of `OnlineTargetExtractor`):
+        Input:
+            -`raw_path`: Path to radar.npy
+            -`target_path`: Path to target.npy
+            -`chunk_size`: Number of frames, which are extracted at once
+    '''
+    raw_data = np.load(raw_path, mmap_mode="r")
+    extractor = TargetExtractor()
+    with NpyWriter(target_path, dtype=np.uint16, row_shape=(8,)) as writer:
+        for start in range(0, len(raw_data), chunk_size):
+            writer.extend(extractor.target(raw_data[start : start + chunk_size]))
+
+
+def swap_raw_data(path, chunk_size=10000):
+    '''
+    A function for swapping the antennas of the recorded raw data in place, chunk by chunk of a memory-mapped file (no
+    copy of the whole recording):
+        Input:
+            -`path`: Path to radar.npy
+            -`chunk_size`: Number of frames, which are swapped at once
+    '''
+    raw_data = np.load(path, mmap_mode="r+")
+    for start in range(0, len(raw_data), chunk_size):
+        raw_data[start : start + chunk_size] = raw_data[start : start + chunk_size][:, [1, 0]]
+    raw_data.flush()
 
 
 def to_json(ref_kick_path):
@@ -93,53 +230,53 @@ def to_json(ref_kick_path):
 
 if __name__ == "__main__":
 
-	parser = argparse.ArgumentParser()
-	parser.add_argument(
-	    "--destination",
-	    type=str,
-	    help="Recording destination folder path",
-	    required=True,
-	)
-
-	parser.add_argument(
-	    "--configuration",
-	    type=str,
-	    help="Radar configuration path",
-	    default=config_path
-	)
-
-	parser.add_argument(
-	    "--frames",
-	    type=int,
-	    help="Number of frames to record",
-	    required=True,
-	    default=100
-	)
-
-	args = parser.parse_args()
-	labels = np.zeros(0)
-
-	with RadarIfxMimose(args.configuration) as device:
-		with DataRecorder(args.destination, device.frame_format, device.meta_data, device.config_file) as rec:
-			print("The recording has begun")
-			try:
-				for i, (frame) in enumerate(device):
-					rec.write(frame)
-
-					if keyboard.is_pressed("space"):
-						print("Kick")
-						labels = np.concatenate((labels, np.ones(1)))
-					else:
-						print("Non kick")
-						labels = np.concatenate((labels, np.zeros(1)))
-
-					if (i > args.frames) and (args.frames > 0):
-						break
-			except KeyboardInterrupt:
-				print("The recording terminated")
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--destination",
+        type=str,
+        help="Recording destination folder path",
+        required=True,
+    )
 
-    
+    parser.add_argument(
+        "--configuration",
+        type=str,
+        help="Radar configuration path",
+        default=config_path
+    )
+
+    parser.add_argument(
+        "--frames",
+        type=int,
+        help="Number of frames to record",
+        required=True,
+        default=100
+    )
+
+    args = parser.parse_args()
     dst = Path(args.destination)
+
+    with RadarIfxMimose(args.configuration) as device:
+        with DataRecorder(args.destination, device.frame_format, device.meta_data, device.config_file) as rec, \
+                NpyWriter(dst / "ref_kicks.npy") as labels, OnlineTargetExtractor(dst / "target.npy") as targets:
+            print("The recording has begun")
+            try:
+                for i, (frame) in enumerate(device):
+                    rec.write(frame)
+                    targets.put(frame)
+
+                    if keyboard.is_pressed("space"):
+                        print("Kick")
+                        labels.append(1)
+                    else:
+                        print("Non kick")
+                        labels.append(0)
+
+                    if (i > args.frames) and (args.frames > 0):
+                        break
+            except KeyboardInterrupt:
+                print("The recording terminated")
+
     os.mkdir(dst / "RadarIfxMimose_00")
     os.mkdir(dst / "Labels_00")
     
@@ -154,17 +291,12 @@ if __name__ == "__main__":
     shutil.move(dst / "config.json", dst / "RadarIfxMimose_00")
     shutil.move(dst / "radar.npy", dst / "RadarIfxMimose_00")
     shutil.move(dst / "radar_timestamp.csv", dst / "RadarIfxMimose_00")
+    shutil.move(dst / "target.npy", dst / "RadarIfxMimose_00")
 
-    
-    raw_data = np.load(dst / "RadarIfxMimose_00/radar.npy")
-    raw_data = raw_data[:, [1, 0]]
-    np.save(dst / "RadarIfxMimose_00/radar.npy", raw_data)
-
-    _, __, result = fft(raw_data, gauss)
+    swap_raw_data(dst / "RadarIfxMimose_00/radar.npy")
+    if targets.error is not None:
+        extract_targets(dst / "RadarIfxMimose_00/radar.npy", dst / "RadarIfxMimose_00/target.npy")
 
-    np.save(dst / "RadarIfxMimose_00/target", result)
-    np.save(dst / "ref_kicks", labels.astype(np.uint16))
-    
     if os.path.exists(dst / "ref_kicks.npy"):
         json_dict = to_json(dst / "ref_kicks.npy")
         with open(dst / "Labels_00/kick.json", "w") as f:    
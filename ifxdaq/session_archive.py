@@ -0,0 +1,289 @@
+"""
+A session archive: the small files of all the recordings of a session (target, labels and timestamps) packed into
+one memory-mappable file, so that a dataset is opened with one file instead of thousands.
+
+The files keep their paths relative to the session folder (the layout of data_recorder.py):
+    recording_.../RadarIfxMimose_00/target.npy, radar_timestamp.csv
+    recording_.../Labels_00/kick.json, label_timestamp.csv
+    recording_.../ref_kicks.npy
+.npy files are stored as they are, the timestamps of .csv files as float64 seconds and the kicks of kick.json as an
+array of the "kick" values.
+
+The file consists of a fixed 64-byte header, the arrays (every one aligned to 64 bytes) and the index of their
+offsets at the end, so that the archive is written in one pass. The index keeps the size and the modification time of
+every source file: an archived file, whose source file exists in the session folder and differs, is stale and the
+readers take the file in the session folder instead.
+
+run the code: python session_archive.py --session path/to/session [--output path/to/session/session_archive.bin]
+"""
+import argparse
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+
+ARCHIVE_NAME = "session_archive.bin"
+# the files of a session, which are packed (radar.npy is added by `raw=True`)
+PATTERNS = ("target.npy", "ref_kicks.npy", "*timestamp.csv", "time.csv", "kick.json")
+
+MAGIC = b"STOARCH"
+VERSION = 2
+ALIGNMENT = 64
+MAX_DIMS = 8
+
+HEADER = np.dtype(
+    {
+        "names": ["magic", "version", "num_entries", "index_offset"],
+        "formats": ["S8", "<u4", "<u4", "<u8"],
+        "offsets": [0, 8, 12, 16],
+        "itemsize": 64,
+    }
+)
+ENTRY = np.dtype(
+    [
+        ("path", "S200"),
+        ("dtype", "S8"),
+        ("ndim", "<u8"),
+        ("shape", "<u8", (MAX_DIMS,)),
+        ("offset", "<u8"),
+        # -1 for arrays without a source file
+        ("source_size", "<i8"),
+        ("source_mtime_ns", "<i8"),
+    ]
+)
+
+
+def read_session_file(path):
+    """
+    Reads a file of a recording as it is stored in the archive.
+        -`path`: .npy, .csv (timestamps) or kick.json file
+        -`return`: the array
+    """
+    path = Path(path)
+    if path.suffix == ".npy":
+        return np.load(path)
+    if path.suffix == ".csv":
+        return np.loadtxt(path, dtype=np.float64, ndmin=1)
+    if path.suffix == ".json":
+        with open(path, "r") as f:
+            return np.array([label["kick"] for label in json.load(f)], dtype=np.uint16)
+
+    raise ValueError(f"Can not archive the file {path}")
+
+
+def session_files(session_path, raw=False):
+    """
+    The files of a session, which are packed into its archive.
+        -`session_path`: The session folder (e.g. the destination of data_recorder.py or a folder of recordings)
+        -`raw`: Pack the raw data (radar.npy) too.
+        -`return`: sorted paths of the files
+    """
+    session_path = Path(session_path)
+    patterns = PATTERNS + ("radar.npy",) if raw else PATTERNS
+
+    return sorted({path for pattern in patterns for path in session_path.rglob(pattern)})
+
+
+def _padding(position):
+    return -position % ALIGNMENT
+
+
+def write_archive(output_path, files):
+    """
+    Writes the arrays into an archive, one by one (only one array is in memory at a time).
+        -`output_path`: The archive file, which is replaced, when it is complete.
+        -`files`: Iterable of (relative path, array or a function returning the array[, source file])
+        -`return`: number of the archived arrays
+    """
+    output_path = Path(output_path)
+    entries = []
+
+    tmp_path = output_path.with_name(output_path.name + ".tmp")
+    with open(tmp_path, "wb") as f:
+        f.write(bytes(HEADER.itemsize))
+
+        for rel_path, array, *source_path in files:
+            # the source is checked before it is read, a later change makes the entry stale
+            source = Path(source_path[0]).stat() if source_path else None
+            array = np.asarray(array() if callable(array) else array)
+            if array.dtype.hasobject or array.ndim > MAX_DIMS:
+                raise ValueError(f"Can not archive {rel_path} of type {array.dtype} and shape {array.shape}")
+
+            name = Path(rel_path).as_posix().encode()
+            if len(name) > ENTRY["path"].itemsize:
+                raise ValueError(f"The path {rel_path} is too long for the archive index")
+
+            # little-endian, so that the archive is readable on every platform
+            array = array.astype(array.dtype.newbyteorder("<"), order="C", copy=False)
+
+            entry = np.zeros((), dtype=ENTRY)
+            entry["path"], entry["dtype"], entry["ndim"] = name, array.dtype.str.encode(), array.ndim
+            entry["shape"][: array.ndim] = array.shape
+            entry["offset"] = f.tell()
+            entry["source_size"] = -1 if source is None else source.st_size
+            entry["source_mtime_ns"] = -1 if source is None else source.st_mtime_ns
+            entries.append(entry)
+
+            f.write(array.tobytes())
+            f.write(bytes(_padding(f.tell())))
+
+        header = np.zeros((), dtype=HEADER)
+        header["magic"], header["version"], header["num_entries"] = MAGIC, VERSION, len(entries)
+        header["index_offset"] = f.tell()
+
+        f.write(np.array(entries, dtype=ENTRY).tobytes())
+        f.seek(0)
+        f.write(header.tobytes())
+
+    os.replace(tmp_path, output_path)
+
+    return len(entries)
+
+
+def build_archive(session_path, output_path=None, raw=False):
+    """
+    Packs the files of a session into an archive.
+        -`session_path`: The session folder.
+        -`output_path`: The archive file (Default: session_archive.bin in the session folder).
+        -`raw`: Pack the raw data (radar.npy) too.
+        -`return`: path of the archive
+    """
+    session_path = Path(session_path)
+    output_path = session_path / ARCHIVE_NAME if output_path is None else Path(output_path)
+
+    files = (
+        (path.relative_to(session_path), lambda path=path: read_session_file(path), path)
+        for path in session_files(session_path, raw)
+    )
+    write_archive(output_path, files)
+
+    return output_path
+
+
+class SessionArchive:
+    """
+    Reader of an archive, the arrays are read-only views of the memory-mapped file (nothing is copied).
+        -`path`: The archive file.
+        -`root`: The session folder, which the archive was built from, for the files that are not archived (e.g.
+                 radar.npy) (Default: the folder of the archive).
+    """
+
+    def __init__(self, path, root=None):
+        self.path = Path(path)
+        self.root = self.path.parent if root is None else Path(root)
+        self._buffer = np.memmap(self.path, dtype=np.uint8, mode="r")
+
+        header = self._buffer[: HEADER.itemsize].view(HEADER)[0]
+        if header["magic"] != MAGIC or header["version"] != VERSION:
+            raise ValueError(f"{self.path} is not a session archive of version {VERSION}")
+
+        index_offset = int(header["index_offset"])
+        index = self._buffer[index_offset : index_offset + int(header["num_entries"]) * ENTRY.itemsize]
+        self._entries = {entry["path"].decode(): entry for entry in index.view(ENTRY)}
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, rel_path):
+        return Path(rel_path).as_posix() in self._entries
+
+    @property
+    def files(self):
+        """
+        The relative paths of the archived files.
+        """
+        return sorted(self._entries)
+
+    def load(self, rel_path):
+        """
+        An archived file as array (like `read_session_file` of the file).
+            -`rel_path`: Path relative to the session folder.
+        """
+        entry = self._entries.get(Path(rel_path).as_posix())
+        if entry is None:
+            raise KeyError(f"{rel_path} is not in the archive {self.path}")
+
+        dtype = np.dtype(entry["dtype"].decode())
+        shape = tuple(int(size) for size in entry["shape"][: entry["ndim"]])
+        offset = int(entry["offset"])
+        nbytes = int(np.prod(shape, dtype=np.int64)) * dtype.itemsize
+
+        return self._buffer[offset : offset + nbytes].view(dtype).reshape(shape)
+
+    def is_stale(self, rel_path):
+        """
+        An archived file is stale, if its source file exists in the session folder and differs (size or modification
+        time) from the archived one.
+            -`rel_path`: Path relative to the session folder.
+        """
+        entry = self._entries[Path(rel_path).as_posix()]
+        if entry["source_size"] < 0:
+            return False
+
+        try:
+            source = (self.root / rel_path).stat()
+        except FileNotFoundError:
+            return False
+
+        return (source.st_size, source.st_mtime_ns) != (entry["source_size"], entry["source_mtime_ns"])
+
+    def get(self, rel_path):
+        """
+        A file of the session: the archived array, if it is archived and not stale, otherwise its path in the session
+        folder.
+            -`rel_path`: Path relative to the session folder.
+        """
+        if rel_path in self and not self.is_stale(rel_path):
+            return self.load(rel_path)
+
+        return self.root / rel_path
+
+    def find(self, path):
+        """
+        The archived array of a file, given its path in the session folder.
+            -`path`: Path of the file (absolute or relative to the working directory).
+            -`return`: the array, None if the file is not archived or stale
+        """
+        try:
+            rel_path = Path(os.path.abspath(path)).relative_to(os.path.abspath(self.root))
+        except ValueError:
+            return None
+
+        return self.load(rel_path) if rel_path in self and not self.is_stale(rel_path) else None
+
+    def recordings(self, target_name="target.npy", labels_name="ref_kicks.npy", raw_name="radar.npy"):
+        """
+        The recordings of the archive (every target with the labels of its folder or of the nearest parent folder).
+            -`return`: list of (raw data, target, labels), every one the archived array or (if it is stale or not
+                       archived) its path in the session folder
+        """
+        recordings = []
+        # in the order of the sorted paths of the recording folders (like `DataLoader.DataLoad`)
+        for rel_path in sorted(Path(rel_path) for rel_path in self._entries):
+            if rel_path.name != target_name:
+                continue
+
+            labels_path = next(
+                (folder / labels_name for folder in rel_path.parents if folder / labels_name in self), None
+            )
+            if labels_path is None:
+                raise ValueError(f"There are no labels ({labels_name}) of {rel_path} in the archive {self.path}")
+
+            recordings.append(
+                (self.get(rel_path.with_name(raw_name)), self.get(rel_path), self.get(labels_path))
+            )
+
+        return recordings
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--session", type=str, help="The session folder with the recordings", required=True)
+    parser.add_argument("--output", type=str, help="The archive file (Default: session_archive.bin in the session folder)", default=None)
+    parser.add_argument("--raw", action="store_true", help="Pack the raw data (radar.npy) too")
+
+    args = parser.parse_args()
+
+    output_path = build_archive(args.session, args.output, args.raw)
+    print(f"{len(SessionArchive(output_path))} files archived in {output_path}")
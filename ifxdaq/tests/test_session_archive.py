@@ -0,0 +1,133 @@
+"""Tests of the session archive (session_archive.py) and of its readers in the benchmarking fixtures."""
+import importlib.util
+import json
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from session_archive import SessionArchive, build_archive, write_archive  # noqa: E402
+
+
+@pytest.fixture
+def session(tmp_path: Path) -> Path:
+    """A session of 2 recordings in the folder layout of data_recorder.py."""
+    rng = np.random.default_rng(0)
+    for name, len_points in [("recording_b", 30), ("recording_a", 20)]:
+        radar_path = tmp_path / name / "RadarIfxMimose_00"
+        label_path = tmp_path / name / "Labels_00"
+        radar_path.mkdir(parents=True)
+        label_path.mkdir()
+
+        labels = rng.integers(0, 2, size=len_points).astype(np.uint16)
+        np.save(radar_path / "radar.npy", rng.integers(0, 4095, size=(len_points, 2, 2, 32), dtype=np.uint16))
+        np.save(radar_path / "target.npy", rng.integers(0, 100, size=(len_points, 8), dtype=np.uint16))
+        np.savetxt(radar_path / "radar_timestamp.csv", 1.6e9 + np.arange(len_points) / 25 + 1e-7)
+        np.savetxt(label_path / "label_timestamp.csv", 1.6e9 + np.arange(len_points) / 25 + 1e-7)
+        np.save(tmp_path / name / "ref_kicks.npy", labels)
+        with open(label_path / "kick.json", "w") as f:
+            json.dump([{"kick": int(label)} for label in labels], f)
+
+    return tmp_path
+
+
+def test_write_archive(tmp_path: Path) -> None:
+    arrays = {
+        "big_endian": np.arange(6, dtype=">i4").reshape(2, 3)[:, ::2],
+        "empty": np.zeros((0, 8), dtype=np.uint16),
+        "scalar": np.float32(3),
+    }
+    write_archive(tmp_path / "archive.bin", arrays.items())
+
+    archive = SessionArchive(tmp_path / "archive.bin")
+    assert archive.files == sorted(arrays)
+    for name, array in arrays.items():
+        loaded = archive.load(name)
+        assert loaded.shape == np.shape(array)
+        assert np.array_equal(loaded, array)
+        # arrays without a source file are never stale
+        assert not archive.is_stale(name)
+
+    with pytest.raises(KeyError):
+        archive.load("missing")
+
+
+def test_session_archive(session: Path) -> None:
+    archive = SessionArchive(build_archive(session))
+    assert archive.files == [
+        f"{name}/{file}"
+        for name in ["recording_a", "recording_b"]
+        for file in [
+            "Labels_00/kick.json",
+            "Labels_00/label_timestamp.csv",
+            "RadarIfxMimose_00/radar_timestamp.csv",
+            "RadarIfxMimose_00/target.npy",
+            "ref_kicks.npy",
+        ]
+    ]
+
+    recording = session / "recording_a"
+    timestamps_path = recording / "RadarIfxMimose_00" / "radar_timestamp.csv"
+    assert np.array_equal(archive.find(timestamps_path), np.loadtxt(timestamps_path))
+    assert np.array_equal(archive.find(recording / "Labels_00" / "kick.json"), np.load(recording / "ref_kicks.npy"))
+    assert archive.find(recording / "RadarIfxMimose_00" / "radar.npy") is None
+
+    recordings = archive.recordings()
+    assert len(recordings) == 2
+    raw_data, target, labels = recordings[0]
+    assert raw_data == recording / "RadarIfxMimose_00" / "radar.npy"
+    assert np.array_equal(target, np.load(recording / "RadarIfxMimose_00" / "target.npy"))
+    assert np.array_equal(labels, np.load(recording / "ref_kicks.npy"))
+
+    archive = SessionArchive(build_archive(session, raw=True))
+    assert np.array_equal(archive.recordings()[0][0], np.load(recording / "RadarIfxMimose_00" / "radar.npy"))
+
+
+def test_session_archive_stale(session: Path) -> None:
+    archive = SessionArchive(build_archive(session))
+
+    # e.g. the target regenerated by raw_to_target_converter.py --force
+    target_path = session / "recording_a" / "RadarIfxMimose_00" / "target.npy"
+    np.save(target_path, np.ones((25, 8), dtype=np.uint16))
+
+    assert archive.is_stale("recording_a/RadarIfxMimose_00/target.npy")
+    assert not archive.is_stale("recording_b/RadarIfxMimose_00/target.npy")
+    assert archive.find(target_path) is None
+    assert archive.recordings()[0][1] == target_path
+
+    # a removed source file does not make the archived copy stale
+    target_path.unlink()
+    assert archive.find(target_path).shape == (20, 8)
+
+
+def test_benchmarking_readers(session: Path) -> None:
+    pytest.importorskip("pandas")
+    fixtures_path = Path(__file__).resolve().parents[2] / "benchmarking" / "tests" / "fixtures" / "utils.py"
+    spec = importlib.util.spec_from_file_location("benchmarking_fixtures_utils", fixtures_path)
+    fixtures = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(fixtures)
+
+    radar_path = session / "recording_b" / "RadarIfxMimose_00"
+    label_path = session / "recording_b" / "Labels_00"
+    timestamps = fixtures.load_timestamps(radar_path / "radar_timestamp.csv")
+    target = np.load(radar_path / "target.npy")
+    labels = np.load(session / "recording_b" / "ref_kicks.npy")
+
+    build_archive(session)
+    # the archives are looked up once per folder
+    fixtures._archive_files.cache_clear()
+    (radar_path / "radar_timestamp.csv").unlink()
+    (radar_path / "target.npy").unlink()
+
+    assert fixtures.recording_file_exists(radar_path / "radar_timestamp.csv")
+    assert not fixtures.recording_file_exists(radar_path / "target_timestamp.csv")
+    assert fixtures.load_timestamps(radar_path / "radar_timestamp.csv").equals(timestamps)
+    assert np.array_equal(fixtures.load_array(radar_path / "target.npy"), target)
+    assert np.array_equal(fixtures.find_archived(label_path / "kick.json"), labels)
+
+    # the file on disk wins over a stale archived copy
+    with open(label_path / "kick.json", "w") as f:
+        json.dump([{"kick": 1} for _ in labels], f)
+    assert fixtures.find_archived(label_path / "kick.json") is None
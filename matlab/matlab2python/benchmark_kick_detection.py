@@ -0,0 +1,67 @@
+"""
+Compares the frame loop of the kick detection with its vectorized batch variant on a long recording,
+made of the example recording repeated (with small changes of the targets, so that the repetitions differ).
+
+run the code: python benchmark_kick_detection.py --repeats 20
+"""
+
+import argparse
+import contextlib
+import io
+import time
+from pathlib import Path
+
+import numpy as np
+
+from kick_detection_recording_optimized import kick_detection, kick_detection_batch
+
+
+def measure(name, func, num_frames):
+    """
+    Runs the detection once and prints its throughput.
+        -`func`: function without arguments returning the kick starts and stops
+        -`num_frames`: number of frames of the recording
+        -`return`: the kick starts and stops
+    """
+    # the frame loop prints every kick candidate
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        kicks = func()
+        duration = time.perf_counter() - start
+
+    print(f"{name:<12} {num_frames / duration:12.0f} frames/s   kicks: {len(kicks[0])}")
+
+    return kicks
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--target",
+        type=str,
+        default=str(
+            Path(__file__).resolve().parents[1] / "atr22" / "examples" / "target.npy"
+        ),
+        help="a path to the recording that is repeated",
+    )
+    parser.add_argument(
+        "--repeats", type=int, default=20, help="number of repetitions of the recording"
+    )
+
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    target = np.tile(np.load(args.target).reshape(-1, 8), (args.repeats, 1)).astype(
+        np.int64
+    )
+    changed = rng.random(target.shape) < 0.1
+    target = np.clip(
+        target + changed * rng.integers(-2, 3, size=target.shape), 0, 0xFFFF
+    ).astype(np.uint16)
+
+    loop_kicks = measure(
+        "frame loop", lambda: kick_detection(target, plot=False), len(target)
+    )
+    batch_kicks = measure("batch", lambda: kick_detection_batch(target), len(target))
+
+    print(f"identical kicks: {loop_kicks == batch_kicks}")
@@ -1,61 +1,135 @@
 import argparse
+import json
 import os
+import sys
 from pathlib import Path
 
-import matplotlib.pyplot as plt
 import numpy as np
 
+sys.path.insert(0, str(Path(__file__).resolve().parents[2] / "FFT"))
+from target_decoder import decode
 
-def kick_detection(recording):
-    """Kick detection based on target.npy"""
+PRT = 0.500e-3
+numPCs = 2
+N_FFT = 32
+c = 3e8
+fc = 24.2e9
+lambda_ = c / fc
 
-    print("Starting offline kick prediction!")
+TH = 100
+targetLen = 2
+FrameTime = 40e-3
+Fsamp = 1 / PRT
+time_avg_len = 10
 
-    if not os.path.exists(recording):
-        print("Error: Recording not found:" + str(recording))
-        return
+buff_size = 50
+detection_speed = 1 / 40  # m/s
+considertargetLen = 2
 
-    target = np.load((recording))
 
-    PRT = 0.500e-3
-    numPCs = 2
-    N_FFT = 32
-    c = 3e8
-    fc = 24.2e9
-    lambda_ = c / fc
+def kick_detection(recording, plot=True):
+    """Kick detection based on target.npy
 
-    TH = 100
-    targetLen = 2
-    FrameTime = 40e-3
-    Fsamp = 1 / PRT
-    time_avg_len = 10
+    recording: path to target.npy or the already loaded target data
+    plot: if False, no figure is created (e.g. when called from the benchmarking)
+    """
 
-    buff_size = 50
-    buffer_average_vel = np.zeros((buff_size, 2))
-    buffer_mov_average_vel = np.zeros((buff_size, 2))
-    buffer_average_acc = np.zeros((buff_size, 2))
-    buffer_mov_average_acc = np.zeros((buff_size, 2))
+    print("Starting offline kick prediction!")
 
-    buffer_kick_start = 1
-    buffer_kick_stop = 0
+    if isinstance(recording, np.ndarray):
+        target = recording
+    elif not os.path.exists(recording):
+        print("Error: Recording not found:" + str(recording))
+        return
+    else:
+        target = np.load((recording))
 
     start_index = []
     stop_index = []
 
-    # Kick detection variables
-    kick_detected = 0
-    detection_speed = 1 / 40  # m/s
-    considertargetLen = 2
-
     frame_count = target.shape[0]
     trgtDataReadCount = 2 * targetLen * 2
     target = target.reshape(frame_count, trgtDataReadCount)
 
-    fig, ax = plt.subplots(2, 1, figsize=(30, 20))
+    state = KickDetectorState()
+
+    for frame in target:
+        event = state.push(frame)
+
+        if event is not None:
+            print(
+                '{{"frame":   {},    yagi_kick: {}, patch_kick: {}, "kick_start": {}}}'.format(
+                    event["frame"],
+                    event["yagi_kick"],
+                    event["patch_kick"],
+                    event["kick_start"],
+                )
+            )
+
+            if event["yagi_kick"] and event["patch_kick"]:
+                start_index.append(event["kick_start"])
+                stop_index.append(event["frame"])
+
+    if plot:
+        plot_traces(*state.buffers())
+
+    return start_index, stop_index
+
+
+class RingBuffer:
+    """The last `size` rows (of `width` values) without shifting: every row is written twice, so that the rows
+    from the oldest to the newest are always the contiguous view `window()`
+    """
+
+    def __init__(self, size, width=2):
+        self.size = size
+        self.data = np.zeros((2 * size, width))
+        self.position = 0  # the oldest row
+
+    def append(self, value):
+        self.data[self.position] = value
+        self.data[self.position + self.size] = value
+        self.position = (self.position + 1) % self.size
+
+    def window(self):
+        return self.data[self.position : self.position + self.size]
+
+    def __getitem__(self, lag):
+        """The row appended `lag` rows before the newest one"""
+        return self.data[self.position + self.size - 1 - lag]
+
+
+class KickDetectorState:
+    """The state of the kick detection of `kick_detection` for a stream of frames: push one frame after the
+    other, every push costs the same (ring buffers instead of shifted buffers, absolute frame indices)
+    """
+
+    def __init__(self):
+        # last velocities (for the moving average, which does not include the current frame)
+        self.average_vel = RingBuffer(time_avg_len - 1)
+        # moving average of the velocity, up to the current frame
+        self.mov_average_vel = RingBuffer(buff_size - time_avg_len // 2 - 1)
+        # acceleration of the last frames (for the moving average)
+        self.average_acc = RingBuffer(time_avg_len)
+        # moving average of the acceleration, up to the current frame
+        self.mov_average_acc = RingBuffer(buff_size - time_avg_len)
+
+        self.frame_index = -1
+        self.kick_start = None  # frame in which the current kick was detected
+
+    def push(self, frame):
+        """Processes the next frame
+
+        frame: the 8 target values of the frame (target.npy)
+        return: None or the kick candidate ended by this frame, {"frame", "yagi_kick", "patch_kick", "kick_start"}
+                like the lines printed by `kick_detection`
+        """
+
+        self.frame_index += 1
+        i = self.frame_index
 
-    for i in range(frame_count):
         vel = convrtAveVelocity(
-            target[i, 0 : (4 * targetLen)],
+            np.ravel(frame)[0 : (4 * targetLen)],
             considertargetLen,
             TH,
             N_FFT,
@@ -64,117 +138,278 @@ def kick_detection(recording):
             targetLen,
         )
 
-        buffer_average_vel = shift_vector_left(buffer_average_vel, vel)
-
         if i >= time_avg_len - 1:
-            # Idea: we can use EWMA betta=0.95
+            mov_average_vel = 1.0 * np.mean(self.average_vel.window(), axis=0)
+            self.average_acc.append(
+                (mov_average_vel - self.mov_average_vel[0]) / FrameTime
+            )
+            self.mov_average_vel.append(mov_average_vel)
 
-            # May be changed in the future
+        self.average_vel.append(vel)
 
-            local_index = -1 - (time_avg_len // 2)
-            buffer_mov_average_vel = shift_vector_left_skip(
-                buffer_mov_average_vel,
-                1.0 * np.mean(buffer_average_vel[-time_avg_len:-1], axis=0),
-                skip=local_index,
-            )
+        if i <= 2 * time_avg_len - 1:
+            return None
 
-            buffer_average_acc = shift_vector_left_skip(
-                buffer_average_acc,
-                (
-                    buffer_mov_average_vel[local_index - 1]
-                    - buffer_mov_average_vel[local_index - 2]
-                )
-                / FrameTime,
-                skip=local_index,
-            )
+        self.mov_average_acc.append(1.0 * np.mean(self.average_acc.window(), axis=0))
 
-        if i > 2 * time_avg_len - 1:
+        lag = time_avg_len // 2
 
-            local_index = -1 - time_avg_len
-            local_indices_acc = np.arange(1, time_avg_len + 1) + (
-                -1 - 3 * time_avg_len // 2
-            )
+        if self.kick_start is None:
+            if np.abs(self.mov_average_vel[lag][1]) > detection_speed:
+                self.kick_start = i
+            return None
+
+        if i - self.kick_start <= 3:
+            return None
+
+        slow = sum(
+            np.abs(self.mov_average_vel[lag + k][1]) < detection_speed for k in range(5)
+        )
+        if slow <= 3:
+            return None
+
+        # indices relative to the end of the buffers of the frame loop
+        buffer_kick_start = -time_avg_len - 1 - (i - self.kick_start)
+        buffer_kick_stop = -time_avg_len - 4
+        buffer_mov_average_vel, buffer_mov_average_acc = self.buffers()
+
+        yagiKick = validateKick(
+            i,
+            None,
+            buffer_kick_start,
+            buffer_kick_stop,
+            buffer_mov_average_vel[:, 1],
+            buffer_mov_average_acc[:, 1],
+            time_avg_len,
+            FrameTime,
+        )
+
+        patchKick = validateKick(
+            i,
+            None,
+            buffer_kick_start,
+            buffer_kick_stop,
+            buffer_mov_average_vel[:, 0],
+            buffer_mov_average_acc[:, 0],
+            time_avg_len,
+            FrameTime,
+        )
+
+        self.kick_start = None
+
+        return {
+            "frame": i,
+            "yagi_kick": int(yagiKick),
+            "patch_kick": int(patchKick),
+            "kick_start": i + buffer_kick_start,
+        }
+
+    def buffers(self):
+        """The moving averages of the velocity and of the acceleration of the last `buff_size` frames, as the
+        buffers of the frame loop (the most recent frames, which are not averaged yet, are zeros)
+        """
+
+        buffer_mov_average_vel = np.zeros((buff_size, 2))
+        buffer_mov_average_vel[: self.mov_average_vel.size] = (
+            self.mov_average_vel.window()
+        )
+
+        buffer_mov_average_acc = np.zeros((buff_size, 2))
+        buffer_mov_average_acc[: self.mov_average_acc.size] = (
+            self.mov_average_acc.window()
+        )
+
+        return buffer_mov_average_vel, buffer_mov_average_acc
+
+
+def kick_detection_batch(recording):
+    """Offline kick detection based on target.npy, vectorized over the whole recording
+
+    Gives the same kicks as `kick_detection`, see `kick_candidates`.
+
+    recording: path to target.npy or the already loaded target data
+    """
+
+    kick_starts, kick_stops = detect_kicks(recording)
+
+    return kick_starts.tolist(), kick_stops.tolist()
 
-            buffer_mov_average_acc = shift_vector_left_skip(
-                buffer_mov_average_acc,
-                1.0 * np.mean(buffer_average_acc[local_indices_acc - 1], axis=0),
-                skip=local_index + 1,
-            )
 
-            if buffer_kick_start == 1:
-                if np.abs(buffer_mov_average_vel[local_index - 1, 1]) > detection_speed:
-                    buffer_kick_start = local_index
-            else:
-                buffer_kick_start -= 1  # shift left the start index
-
-                if buffer_kick_stop == 0:
-                    if (
-                        (
-                            np.abs(
-                                buffer_mov_average_vel[
-                                    -np.arange(5) + local_index - 1, 1
-                                ]
-                            )
-                            < detection_speed
-                        ).sum()
-                        > 3
-                    ) and (local_index - buffer_kick_start > 3):
-                        buffer_kick_stop = local_index - 3
-
-                        yagiKick = validateKick(
-                            i,
-                            ax,
-                            buffer_kick_start,
-                            buffer_kick_stop,
-                            buffer_mov_average_vel[:, 1],
-                            buffer_mov_average_acc[:, 1],
-                            time_avg_len,
-                            FrameTime,
-                        )
-
-                        patchKick = validateKick(
-                            i,
-                            ax,
-                            buffer_kick_start,
-                            buffer_kick_stop,
-                            buffer_mov_average_vel[:, 0],
-                            buffer_mov_average_acc[:, 0],
-                            time_avg_len,
-                            FrameTime,
-                        )
-
-                        print(
-                            '{{"frame":   {},    yagi_kick: {}, patch_kick: {}, "kick_start": {}}}'.format(
-                                i, int(yagiKick), int(patchKick), i + buffer_kick_start
-                            )
-                        )
-
-                        if yagiKick and patchKick:
-                            start_index.append(i + buffer_kick_start)
-                            stop_index.append(i)
-
-                        buffer_kick_start = 1
-                        buffer_kick_stop = 0
+def detect_kicks(recording, traces=False):
+    """Headless kick detection: no figure, no output
+
+    recording: path to target.npy or the already loaded target data
+    traces: if True, the per frame traces of the detection are returned too
+    return: kick starts and kick stops (frame indices from 0) and, with `traces`, a dict with the
+            "velocity" and the "acceleration" (moving averages, frame_count x 2: PC0 (patch), PC1 (yagi))
+    """
+
+    candidates, velocity, acceleration = kick_candidates(recording)
+    kicks = np.array(
+        [
+            (candidate["kick_start"], candidate["frame"])
+            for candidate in candidates
+            if candidate["yagi_kick"] and candidate["patch_kick"]
+        ],
+        dtype=int,
+    ).reshape(-1, 2)
+
+    if traces:
+        return (
+            kicks[:, 0],
+            kicks[:, 1],
+            {"velocity": velocity, "acceleration": acceleration},
+        )
+
+    return kicks[:, 0], kicks[:, 1]
+
+
+def kick_candidates(recording):
+    """All the kick candidates validated by `validateKick`, vectorized over the whole recording
+
+    The velocities, their moving averages and the accelerations of all the frames are computed at once, the
+    detection only steps from kick candidate to kick candidate and `validateKick` is called on the buffers as
+    they are in the frame loop of `kick_detection` at the end of every candidate.
+
+    recording: path to target.npy or the already loaded target data
+    return: the candidates ({"frame", "yagi_kick", "patch_kick", "kick_start"} like the lines printed by
+            `kick_detection`), the moving averages of the velocity and of the acceleration (frame_count x 2)
+    """
+
+    target = recording if isinstance(recording, np.ndarray) else np.load(recording)
+    target = target.reshape(target.shape[0], 2 * targetLen * 2)
+    frame_count = target.shape[0]
+
+    vel = convrtAveVelocities(
+        target, considertargetLen, TH, N_FFT, PRT, lambda_, targetLen
+    )
+
+    # moving average of the velocity of the 9 previous frames (frame i >= time_avg_len - 1)
+    mov_average_vel = np.zeros((frame_count, 2))
+    mov_average_vel[time_avg_len - 1 :] = moving_sum(vel[:-1], time_avg_len - 1) / (
+        time_avg_len - 1
+    )
+
+    average_acc = np.zeros((frame_count, 2))
+    average_acc[time_avg_len - 1 :] = (
+        mov_average_vel[time_avg_len - 1 :] - mov_average_vel[time_avg_len - 2 : -1]
+    ) / FrameTime
+
+    # moving average of the acceleration of the last 10 frames (frame i > 2 * time_avg_len - 1)
+    mov_average_acc = np.zeros((frame_count, 2))
+    mov_average_acc[2 * time_avg_len :] = (
+        moving_sum(average_acc[time_avg_len + 1 :], time_avg_len) / time_avg_len
+    )
+
+    # a kick starts when the velocity 5 frames back exceeds the detection speed, and stops when at least 4 of the
+    # velocities 5 to 9 frames back are below it (at least 4 frames after the start)
+    lag = time_avg_len // 2
+    slow = np.abs(mov_average_vel[:, 1]) < detection_speed
+    slow_count = moving_sum(slow[: frame_count - lag].astype(int), lag)
+
+    frames = np.arange(2 * time_avg_len, frame_count)
+    start_frames = frames[np.abs(mov_average_vel[frames - lag, 1]) > detection_speed]
+    stop_frames = frames[slow_count[frames - 2 * lag + 1] > 3]
+
+    candidates = []
+
+    i = 2 * time_avg_len
+    while True:
+        k = np.searchsorted(start_frames, i)
+        if k == len(start_frames):
+            break
+        kick_start_frame = start_frames[k]
+
+        k = np.searchsorted(stop_frames, kick_start_frame + 4)
+        if k == len(stop_frames):
+            break
+        i = stop_frames[k]
+
+        # indices relative to the end of the buffers of the frame loop
+        buffer_kick_start = -time_avg_len - 1 - (i - kick_start_frame)
+        buffer_kick_stop = -time_avg_len - 4
+        buffer_mov_average_vel = buffer_of(mov_average_vel, i, lag + 1)
+        buffer_mov_average_acc = buffer_of(mov_average_acc, i, time_avg_len)
+
+        yagiKick = validateKick(
+            i,
+            None,
+            buffer_kick_start,
+            buffer_kick_stop,
+            buffer_mov_average_vel[:, 1],
+            buffer_mov_average_acc[:, 1],
+            time_avg_len,
+            FrameTime,
+        )
+
+        patchKick = validateKick(
+            i,
+            None,
+            buffer_kick_start,
+            buffer_kick_stop,
+            buffer_mov_average_vel[:, 0],
+            buffer_mov_average_acc[:, 0],
+            time_avg_len,
+            FrameTime,
+        )
+
+        candidates.append(
+            {
+                "frame": int(i),
+                "yagi_kick": int(yagiKick),
+                "patch_kick": int(patchKick),
+                "kick_start": int(i + buffer_kick_start),
+            }
+        )
+
+        i += 1
+
+    return candidates, mov_average_vel, mov_average_acc
+
+
+def format_candidates(candidates):
+    """The JSON lines printed by the CLI for the kick candidates of `kick_candidates`, like the lines of the matlab
+    application (frames counted from 1)
+    """
+
+    return [
+        json.dumps(
+            {
+                **candidate,
+                "frame": candidate["frame"] + 1,
+                "kick_start": candidate["kick_start"] + 1,
+            }
+        )
+        for candidate in candidates
+    ]
+
+
+def plot_traces(velocity, acceleration):
+    """Plots the moving averages of the velocity and of the acceleration (frames x 2: PC0 (patch), PC1 (yagi))"""
+
+    import matplotlib.pyplot as plt
+
+    fig, ax = plt.subplots(2, 1, figsize=(30, 20))
 
     ax[0].plot(
-        np.arange(buffer_mov_average_vel.shape[0]) * FrameTime,
-        buffer_mov_average_vel[:, 0],
+        np.arange(velocity.shape[0]) * FrameTime,
+        velocity[:, 0],
         color="green",
     )
     ax[0].plot(
-        np.arange(buffer_mov_average_acc.shape[0]) * FrameTime,
-        buffer_mov_average_acc[:, 0],
+        np.arange(acceleration.shape[0]) * FrameTime,
+        acceleration[:, 0],
         color="red",
     )
 
     ax[1].plot(
-        np.arange(buffer_mov_average_vel.shape[0]) * FrameTime,
-        buffer_mov_average_vel[:, 1],
+        np.arange(velocity.shape[0]) * FrameTime,
+        velocity[:, 1],
         color="green",
     )
     ax[1].plot(
-        np.arange(buffer_mov_average_acc.shape[0]) * FrameTime,
-        buffer_mov_average_acc[:, 1],
+        np.arange(acceleration.shape[0]) * FrameTime,
+        acceleration[:, 1],
         color="red",
     )
 
@@ -195,19 +430,23 @@ def kick_detection(recording):
     plt.tight_layout()
     plt.show()
 
-    return start_index, stop_index
-
 
-def shift_vector_left(vec, value):
-    vec[:-1] = vec[1:]
-    vec[-1] = value
-    return vec
+def moving_sum(values, window):
+    """Sums of `window` consecutive values, added up from the oldest like the sums over the buffers"""
+    sums = np.zeros(
+        (max(len(values) - window + 1, 0),) + values.shape[1:], dtype=values.dtype
+    )
+    for k in range(window):
+        sums += values[k : k + len(sums)]
+    return sums
 
 
-def shift_vector_left_skip(vec, value, skip):
-    vec[: skip - 1] = vec[1:skip]
-    vec[skip - 1] = value
-    return vec
+def buffer_of(values, i, skip):
+    """The buffer of the frame loop at frame i: the values up to frame i, followed by `skip` never written zeros"""
+    buffer = np.zeros((buff_size,) + values.shape[1:])
+    count = min(i + 1, buff_size - skip)
+    buffer[buff_size - skip - count : buff_size - skip] = values[i + 1 - count : i + 1]
+    return buffer
 
 
 def convrtAveVelocity(
@@ -215,22 +454,19 @@ def convrtAveVelocity(
 ):
     averageVelocity = np.zeros((2,))
 
+    # amplitudes and bins of PC0 and PC1 (numofTargetfromATR22 targets each)
+    amps, bins = decode(np.reshape(TargetData, (1, 4 * numofTargetfromATR22)))
+
     for i in range(2):
         Target_MaxValue = np.zeros((numofTarget,))  # the shape may be not right
         Target_MaxLocations = np.zeros((numofTarget,))  # the shape may be not right
-        rawTarget = TargetData[
-            np.arange(1, 2 * numofTarget + 1) + (i * 2 * numofTargetfromATR22) - 1
-        ]  # PC0 and PC1
-        # rawTarget = np.concatenate((np.array([1]), rawTarget))
         counterTHexceedingTarget = 0
 
         for j in range(numofTarget):
-            Target_MaxValue[j] = (((0x00FF & int(rawTarget[j * 2 + 1])) << 4)) + (
-                (0xFF00 & int(rawTarget[j * 2])) >> 8
-            )
+            Target_MaxValue[j] = amps[0, i, j]
             if Target_MaxValue[j] > TH:
                 counterTHexceedingTarget += 1
-                Target_MaxLocations[j] = 0x00FF & int(rawTarget[j * 2])
+                Target_MaxLocations[j] = bins[0, i, j]
                 if Target_MaxLocations[j] > N_FFT / 2:
                     Target_MaxLocations[j] -= N_FFT
 
@@ -248,6 +484,40 @@ def convrtAveVelocity(
     return averageVelocity
 
 
+def convrtAveVelocities(
+    TargetData, numofTarget, TH, N_FFT, PRT, lambda_, numofTargetfromATR22
+):
+    """`convrtAveVelocity` of all the frames at once (TargetData: frame_count x 8)"""
+    amps, bins = decode(TargetData, dtype=np.int64)
+    averageVelocity = np.zeros((TargetData.shape[0], 2))
+
+    for i in range(2):
+        Target_MaxValue = amps[:, i, :numofTarget]
+        exceeding = Target_MaxValue > TH
+        counterTHexceedingTarget = exceeding.sum(axis=1)
+
+        Target_MaxLocations = np.where(exceeding, bins[:, i, :numofTarget], 0)
+        Target_MaxLocations = np.where(
+            Target_MaxLocations > N_FFT / 2,
+            Target_MaxLocations - N_FFT,
+            Target_MaxLocations,
+        ).astype(float)
+
+        # mean of the first counterTHexceedingTarget + 1 locations
+        count = np.minimum(counterTHexceedingTarget + 1, numofTarget)
+        total = np.zeros(TargetData.shape[0])
+        for j in range(numofTarget):
+            total += np.where(j < count, Target_MaxLocations[:, j], 0)
+
+        averageVelocity[:, i] = np.where(
+            counterTHexceedingTarget > 0,
+            total / count * lambda_ / 2 / PRT / (N_FFT - 1),
+            0,
+        )
+
+    return averageVelocity
+
+
 def validateKick(
     i,
     ax,
@@ -317,9 +587,26 @@ def validateKick(
 
 if __name__ == "__main__":
 
-    parser = argparse.ArgumentParser()
+    parser = argparse.ArgumentParser(
+        description="Prints one JSON line per kick candidate, like the matlab application "
+        "(frames counted from 1)"
+    )
     parser.add_argument("--target", type=str, help="a path to the input target file")
+    parser.add_argument(
+        "--plot",
+        action="store_true",
+        help="plot the velocity and the acceleration of the whole recording",
+    )
     args = parser.parse_args()
     recording_path = args.target
 
-    kick_detection(recording_path)
+    if recording_path is None or not os.path.exists(recording_path):
+        parser.error("Recording not found: " + str(recording_path))
+
+    candidates, velocity, acceleration = kick_candidates(recording_path)
+
+    for line in format_candidates(candidates):
+        print(line)
+
+    if args.plot:
+        plot_traces(velocity, acceleration)
@@ -0,0 +1,101 @@
+"""
+Throughput of the inference engines and their deviation from keras model.predict.
+
+The exact checkpointed engine runs as many GRU steps as the numpy windows, it is not faster. The
+smaller contexts are faster, but approximate: check their max |dp| before using them.
+
+run the code: python benchmark_inference.py path/to/target.npy --context 48 40 32 24
+"""
+import argparse
+import time
+
+import numpy as np
+
+from numpy_gru import CheckpointedGRU, NumpyGRU
+from tf_inference import load_model, load_target_data, make_windows
+
+
+def measure(name, func, num_frames, reference=None, repeats=3):
+    """
+    Runs the prediction function and prints its throughput and the deviation from the reference.
+        -`func`: function without arguments returning the Wx2 probabilities
+        -`num_frames`: number of frames of the recording
+        -`return`: the probabilities
+    """
+    best = np.inf
+    for _ in range(repeats):
+        start = time.perf_counter()
+        pred = func()
+        best = min(best, time.perf_counter() - start)
+
+    line = f"{name:<36} {num_frames / best:12.1f} frames/s"
+    if reference is not None:
+        line += f"   max |dp| = {np.abs(pred - reference).max(initial=0):.2e}"
+    print(line)
+
+    return pred
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("target_path", type=str, help="target.npy of a recording")
+    parser.add_argument(
+        "--context",
+        type=int,
+        nargs="*",
+        default=[],
+        help="contexts of the checkpointed engine to benchmark besides the exact one",
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=None,
+        help="calibrate the checkpointed engine to this tolerance and benchmark it",
+    )
+    parser.add_argument("--repeats", type=int, default=3)
+
+    args = parser.parse_args()
+
+    split_len = 50
+    model = load_model(split_len)
+    target_data = load_target_data(args.target_path)
+    num_frames = target_data.shape[0]
+
+    print(f"{num_frames} frames, {num_frames - split_len} windows")
+
+    reference = measure(
+        "keras model.predict",
+        lambda: model.predict(make_windows(target_data, split_len), verbose=0),
+        num_frames,
+        repeats=args.repeats,
+    )
+
+    gru = NumpyGRU.from_keras(model)
+    measure(
+        "numpy windows",
+        lambda: gru.predict(make_windows(target_data, split_len)),
+        num_frames,
+        reference,
+        args.repeats,
+    )
+
+    engine = CheckpointedGRU(gru, split_len)
+    for context in [engine.window_len, *args.context]:
+        exactness = "exact" if context == engine.window_len else "approximate"
+        measure(
+            f"checkpointed context={context} ({exactness})",
+            lambda: engine.predict(target_data, context=context),
+            num_frames,
+            reference,
+            args.repeats,
+        )
+
+    if args.tolerance is not None:
+        context = engine.calibrate(target_data, args.tolerance)
+        measure(
+            f"calibrated context={context} (approximate)",
+            lambda: engine.predict(target_data),
+            num_frames,
+            reference,
+            args.repeats,
+        )
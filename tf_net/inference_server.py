@@ -0,0 +1,87 @@
+"""
+A long-lived inference service: the model is loaded once and the recordings are processed
+one JSON line at a time (stdin -> stdout), so that the benchmarking does not start python,
+import tensorflow and load the weights again for every recording.
+
+request:  {"path": "<path to target.npy>"} or {"target": [[8 target values], ...]}
+response: {"kicks": [{"frame": ..., "kick_start": ...}, ...]} or {"error": "..."}
+
+run the code: python inference_server.py --backend numpy
+"""
+import argparse
+import json
+import sys
+
+import numpy as np
+
+from tf_inference import load_model, load_target_data, predict_kicks, preprocess_target
+
+
+def handle(model, request, **kwargs):
+    """
+    A function that answers a single request.
+        -`model`: model returned by `load_model`
+        -`request`: {"path": ...} or {"target": ...}
+        -`kwargs`: arguments of `predict_kicks`
+        -`return`: the response
+    """
+    if "path" in request:
+        target_data = load_target_data(request["path"])
+    elif "target" in request:
+        target_data = preprocess_target(np.asarray(request["target"], dtype=np.uint16))
+    else:
+        raise ValueError(f"Expected 'path' or 'target' in the request, but got {list(request)}")
+
+    kicks = predict_kicks(model, target_data, **kwargs)
+
+    return {"kicks": [{"frame": frame, "kick_start": kick_start} for frame, kick_start in kicks]}
+
+
+def serve(model, inp=sys.stdin, out=sys.stdout, **kwargs):
+    """
+    A function that answers the requests until the input is closed.
+        -`model`: model returned by `load_model`
+        -`inp`, `out`: request and response streams
+        -`kwargs`: arguments of `predict_kicks`
+    """
+    for line in inp:
+        if not line.strip():
+            continue
+        try:
+            response = handle(model, json.loads(line), **kwargs)
+        except Exception as e:
+            response = {"error": f"{type(e).__name__}: {e}"}
+
+        out.write(json.dumps(response) + "\n")
+        out.flush()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--backend",
+        type=str,
+        choices=["keras", "numpy"],
+        default="keras",
+        help="numpy runs the model without importing tensorflow",
+    )
+    parser.add_argument(
+        "--engine",
+        type=str,
+        choices=["window", "checkpointed"],
+        default="window",
+        help="window inference engine, checkpointed shares the GRU runs between the windows",
+    )
+    parser.add_argument(
+        "--context",
+        type=int,
+        default=None,
+        help="minimal window context of the checkpointed engine (default: exact predictions)",
+    )
+
+    args = parser.parse_args()
+
+    split_len = 50
+    model = load_model(split_len, backend=args.backend)
+
+    serve(model, split_len=split_len, engine=args.engine, context=args.context)
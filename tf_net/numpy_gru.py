@@ -0,0 +1,308 @@
+"""
+NumPy implementation of the `model_seq` network (GRU(64) -> Dense(2) -> Softmax).
+
+run the code: python numpy_gru.py models/our_train_our_fit_full.h5
+(exports the weights to models/our_train_our_fit_full.npz)
+"""
+import argparse
+from pathlib import Path
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+
+def sigmoid(x):
+    return 1 / (1 + np.exp(-x))
+
+
+def softmax(x):
+    e = np.exp(x - x.max(axis=-1, keepdims=True))
+    return e / e.sum(axis=-1, keepdims=True)
+
+
+def _to_str(name):
+    return name.decode("utf8") if isinstance(name, bytes) else str(name)
+
+
+def load_weights_h5(weights_path):
+    """
+    Reads the GRU and Dense weights from a keras .h5 file without importing tensorflow.
+        -`weights_path`: file written by `model.save_weights` or `model.save`
+        -`return`: kernel, recurrent_kernel, bias, dense_kernel, dense_bias
+    """
+    import h5py
+
+    layers = []
+    with h5py.File(weights_path, "r") as file:
+        group = file["model_weights"] if "model_weights" in file else file
+        for layer_name in group.attrs["layer_names"]:
+            layer = group[_to_str(layer_name)]
+            weights = {}
+            for weight_name in layer.attrs["weight_names"]:
+                weight_name = _to_str(weight_name)
+                weights[weight_name.split("/")[-1].split(":")[0]] = layer[weight_name][()]
+            if weights:
+                layers.append(weights)
+
+    grus = [i for i, weights in enumerate(layers) if "recurrent_kernel" in weights]
+    if not grus or grus[0] + 1 >= len(layers):
+        raise ValueError(f"Expected GRU and Dense layers in {weights_path}")
+    gru, dense = layers[grus[0]], layers[grus[0] + 1]
+
+    return gru["kernel"], gru["recurrent_kernel"], gru["bias"], dense["kernel"], dense["bias"]
+
+
+class NumpyGRU:
+    """
+    The `model_seq` model computed with NumPy, batched over the windows.
+    The weights are in the keras layout (GRU with reset_after=True, gates ordered z, r, h).
+    It computes in float32 like keras, but not in the same order: the probabilities differ from
+    `model.predict` by up to about 2e-5 (1.98e-5 observed), tests compare them with 5e-5.
+        -`kernel`: 8x192 input weights of the GRU
+        -`recurrent_kernel`: 64x192 recurrent weights of the GRU
+        -`bias`: 2x192 input and recurrent biases of the GRU
+        -`dense_kernel`: 64x2 weights of the Dense layer
+        -`dense_bias`: (2,) bias of the Dense layer
+    """
+
+    def __init__(self, kernel, recurrent_kernel, bias, dense_kernel, dense_bias):
+        self.kernel = np.asarray(kernel, dtype=np.float32)
+        self.recurrent_kernel = np.asarray(recurrent_kernel, dtype=np.float32)
+        self.bias = np.asarray(bias, dtype=np.float32).reshape(2, -1)
+        self.dense_kernel = np.asarray(dense_kernel, dtype=np.float32)
+        self.dense_bias = np.asarray(dense_bias, dtype=np.float32)
+        self.units = self.recurrent_kernel.shape[0]
+
+    @classmethod
+    def from_keras(cls, model):
+        """
+        Takes the weights of a loaded `model_seq` model.
+        """
+        gru, dense = model.layers[0], model.layers[1]
+
+        return cls(*gru.get_weights(), *dense.get_weights())
+
+    @classmethod
+    def from_file(cls, weights_path):
+        """
+        Loads the weights from a keras .h5 file or from its .npz export (see `save`).
+        The .npz export next to the .h5 file is preferred, if it is not older than the .h5 file.
+        """
+        weights_path = Path(weights_path)
+        npz_path = weights_path.with_suffix(".npz")
+        if weights_path.suffix != ".npz" and npz_path.exists():
+            if not weights_path.exists() or npz_path.stat().st_mtime >= weights_path.stat().st_mtime:
+                weights_path = npz_path
+
+        if weights_path.suffix == ".npz":
+            with np.load(weights_path) as weights:
+                return cls(**weights)
+
+        return cls(*load_weights_h5(weights_path))
+
+    def save(self, npz_path):
+        """
+        Exports the weights to a .npz file, which is loaded faster than the .h5 file.
+        """
+        np.savez(
+            npz_path,
+            kernel=self.kernel,
+            recurrent_kernel=self.recurrent_kernel,
+            bias=self.bias,
+            dense_kernel=self.dense_kernel,
+            dense_bias=self.dense_bias,
+        )
+
+    def initial_state(self, batch_size):
+        return np.zeros((batch_size, self.units), dtype=np.float32)
+
+    def step(self, x, h):
+        """
+        One GRU time step for a batch.
+            -`x`: Bx8 inputs
+            -`h`: Bx64 hidden states
+            -`return`: Bx64 new hidden states
+        """
+        units = self.units
+        x_proj = x.astype(np.float32) @ self.kernel + self.bias[0]
+        h_proj = h @ self.recurrent_kernel + self.bias[1]
+
+        z = sigmoid(x_proj[:, :units] + h_proj[:, :units])
+        r = sigmoid(x_proj[:, units : 2 * units] + h_proj[:, units : 2 * units])
+        h_hat = np.tanh(x_proj[:, 2 * units :] + r * h_proj[:, 2 * units :])
+
+        return z * h + (1 - z) * h_hat
+
+    def run(self, x):
+        """
+        Runs the GRU over the windows from the zero state.
+            -`x`: BxTx8 windows
+            -`return`: Bx64 last hidden states
+        """
+        h = self.initial_state(x.shape[0])
+        for t in range(x.shape[1]):
+            h = self.step(x[:, t], h)
+
+        return h
+
+    def head(self, h):
+        """
+        Dense and Softmax layers on the last hidden states.
+        """
+        return softmax(h @ self.dense_kernel + self.dense_bias)
+
+    def predict(self, x, verbose=0):
+        """
+        The same as the keras `model.predict`.
+            -`x`: BxTx8 windows
+            -`return`: Bx2 probabilities
+        """
+        return self.head(self.run(np.asarray(x)))
+
+    def __call__(self, x, training=False):
+        return self.predict(x)
+
+
+class CheckpointedGRU:
+    """
+    Window predictions of `inference` from shared GRU runs instead of one GRU run per window.
+
+    A run starts from the zero state at a checkpoint inside a window and its states are read off
+    for all the following windows, which have the same amplitude normalization and still contain
+    the checkpoint. Every window prediction sees at least its last `context` time steps, so with
+    `context` equal to the window length (default) each run serves one window and the result is
+    the one of `inference`: the exact mode runs as many GRU steps as `NumpyGRU.predict` on the
+    windows and only shares the amplitude averaging and normalization, so it is not faster
+    (0.106 s against 0.090 s of the numpy windows on a benchmark recording).
+    Smaller contexts drop the oldest time steps of the windows and save up to
+    `window length - context + 1` times the GRU steps, but their predictions are approximate:
+    the dropped steps are not always forgotten by the GRU and single probabilities differed by up
+    to 0.99 from the exact ones. `calibrate` finds the smallest context within a given tolerance
+    on one recording, which does not bound the error on other recordings.
+        -`gru`: NumpyGRU model
+        -`split_len`: model input batch size
+        -`kernel`: the averaging kernel of the amplitudes
+        -`context`: minimal number of time steps of a window, which the prediction sees
+    """
+
+    def __init__(self, gru, split_len=50, kernel=np.ones(3) / 3, eps=1e-8, context=None):
+        self.gru = gru
+        self.split_len = split_len
+        self.kernel = kernel
+        self.eps = eps
+        self.window_len = split_len - kernel.shape[0] + 1
+        self.context = self.window_len if context is None else context
+
+        if not 0 < self.context <= self.window_len:
+            raise ValueError(
+                f"Expected context in range [1, {self.window_len}], but got {self.context}"
+            )
+
+    def prepare(self, features):
+        """
+        Computes the per frame model inputs once for the whole recording.
+            -`features`: Nx8 decoded target data (`load_target_data`)
+            -`return`: averaged amplitudes, bins and the amplitude normalization of every window
+        """
+        kernel_size = self.kernel.shape[0]
+        num_windows = features.shape[0] - self.split_len
+
+        # 3-tap average of the amplitudes, summed in the same order as in `inference`
+        amps = features[:, [0, 2, 4, 6]]
+        avg = amps[: amps.shape[0] - kernel_size + 1] * self.kernel[0]
+        for k in range(1, kernel_size):
+            avg = avg + amps[k : amps.shape[0] - kernel_size + 1 + k] * self.kernel[k]
+        bins = features[kernel_size - 1 :, [1, 3, 5, 7]]
+
+        norm = sliding_window_view(avg, self.window_len, axis=0)[:num_windows].max(axis=-1)
+        norm = np.maximum(norm, self.eps)
+
+        return avg, bins, norm
+
+    def schedule(self, norm, context=None):
+        """
+        Assigns the windows to the GRU runs.
+            -`norm`: amplitude normalization of every window
+            -`context`: minimal number of time steps of a window, which the prediction sees
+            -`return`: first time step and normalizing window of every run,
+                       run and time step, at which the window prediction is read, for every window
+        """
+        context = self.context if context is None else context
+        num_windows = norm.shape[0]
+        same_norm = np.zeros(num_windows, dtype=bool)
+        same_norm[1:] = (norm[1:] == norm[:-1]).all(axis=-1)
+
+        run_starts, run_windows = [], []
+        window_run = np.zeros(num_windows, dtype=int)
+        window_step = np.zeros(num_windows, dtype=int)
+
+        start = None
+        for w in range(num_windows):
+            end = w + self.window_len - 1
+            if start is None or not same_norm[w] or end - start >= self.window_len:
+                start = end - context + 1
+                run_starts.append(start)
+                run_windows.append(w)
+            window_run[w] = len(run_starts) - 1
+            window_step[w] = end - start
+
+        return np.array(run_starts, dtype=int), np.array(run_windows, dtype=int), window_run, window_step
+
+    def predict(self, features, context=None):
+        """
+        The window probabilities of `inference`.
+            -`features`: Nx8 decoded target data (`load_target_data`)
+            -`context`: overrides the context of the engine
+            -`return`: Wx2 probabilities
+        """
+        avg, bins, norm = self.prepare(features)
+        run_starts, run_windows, window_run, window_step = self.schedule(norm, context)
+
+        run_norm = norm[run_windows]
+        h = self.gru.initial_state(len(run_starts))
+        states = np.zeros((norm.shape[0], self.gru.units), dtype=np.float32)
+        x = np.zeros((len(run_starts), 8))
+
+        for step in range(window_step.max(initial=-1) + 1):
+            index = np.minimum(run_starts + step, avg.shape[0] - 1)
+            x[:, [0, 2, 4, 6]] = avg[index] / run_norm
+            x[:, [1, 3, 5, 7]] = bins[index]
+            h = self.gru.step(x, h)
+
+            ready = np.where(window_step == step)[0]
+            states[ready] = h[window_run[ready]]
+
+        return self.gru.head(states)
+
+    def calibrate(self, features, tolerance=1e-3):
+        """
+        Sets the smallest context, with which the probabilities stay within the tolerance.
+            -`features`: Nx8 decoded target data of a representative recording
+            -`tolerance`: maximal absolute difference to the exact probabilities
+            -`return`: the chosen context
+        """
+        exact = self.predict(features, context=self.window_len)
+
+        context = self.window_len
+        while context > 1:
+            error = np.abs(self.predict(features, context=context - 1) - exact).max(initial=0)
+            if error > tolerance:
+                break
+            context -= 1
+
+        self.context = context
+
+        return context
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("weights_path", type=str, help="keras .h5 weights of the model")
+    parser.add_argument(
+        "--output", type=str, default=None, help=".npz path (default: next to the .h5 file)"
+    )
+
+    args = parser.parse_args()
+    output = args.output or Path(args.weights_path).with_suffix(".npz")
+
+    NumpyGRU(*load_weights_h5(args.weights_path)).save(output)
@@ -0,0 +1,90 @@
+"""Tests of the NumPy model (numpy_gru.py) against the keras `model_seq` model and of the reading of its .h5 files."""
+import os
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from numpy_gru import NumpyGRU, load_weights_h5  # noqa: E402
+
+# the float32 rounding differences to `model.predict` (see `NumpyGRU`)
+TOLERANCE = 5e-5
+
+
+@pytest.fixture
+def windows() -> np.ndarray:
+    """Windows like the ones of `make_windows`: normalized amplitudes and bins."""
+    rng = np.random.default_rng(0)
+    x = np.zeros((128, 48, 8), dtype=np.float32)
+    x[..., [0, 2, 4, 6]] = rng.random((128, 48, 4))
+    x[..., [1, 3, 5, 7]] = rng.integers(0, 32, size=(128, 48, 4))
+    return x
+
+
+@pytest.fixture
+def model():
+    """A `model_seq` model (GRU(64) -> Dense(2) -> Softmax) with random weights."""
+    os.environ.setdefault("TF_CPP_MIN_LOG_LEVEL", "3")
+    tf = pytest.importorskip("tensorflow")
+
+    tf.keras.utils.set_random_seed(0)
+    return tf.keras.Sequential(
+        [
+            tf.keras.Input(shape=(48, 8), batch_size=None),
+            tf.keras.layers.GRU(units=64, return_sequences=False),
+            tf.keras.layers.Dense(2),
+            tf.keras.layers.Softmax(),
+        ]
+    )
+
+
+def test_from_keras(model, windows: np.ndarray) -> None:
+    gru = NumpyGRU.from_keras(model)
+    np.testing.assert_allclose(gru.predict(windows), model.predict(windows, verbose=0), rtol=0, atol=TOLERANCE)
+
+
+def test_from_file_model_h5(model, windows: np.ndarray, tmp_path: Path) -> None:
+    pytest.importorskip("h5py")
+    # the .h5 file of `model.save` (the layer weights below "model_weights")
+    model.save(tmp_path / "model.h5")
+
+    gru = NumpyGRU.from_file(tmp_path / "model.h5")
+    np.testing.assert_allclose(gru.predict(windows), model.predict(windows, verbose=0), rtol=0, atol=TOLERANCE)
+
+    # the .npz export is loaded instead of the .h5 file
+    gru.save(tmp_path / "model.npz")
+    assert np.array_equal(NumpyGRU.from_file(tmp_path / "model.h5").predict(windows), gru.predict(windows))
+
+
+def test_load_weights_h5_save_weights(tmp_path: Path) -> None:
+    h5py = pytest.importorskip("h5py")
+    rng = np.random.default_rng(1)
+    weights = {
+        "gru": {
+            "gru/gru_cell/kernel:0": rng.normal(size=(8, 192)).astype(np.float32),
+            "gru/gru_cell/recurrent_kernel:0": rng.normal(size=(64, 192)).astype(np.float32),
+            "gru/gru_cell/bias:0": rng.normal(size=(2, 192)).astype(np.float32),
+        },
+        "dense": {
+            "dense/kernel:0": rng.normal(size=(64, 2)).astype(np.float32),
+            "dense/bias:0": rng.normal(size=2).astype(np.float32),
+        },
+        "softmax": {},
+    }
+
+    # the layout of the .h5 files of the keras 2 `model.save_weights`
+    with h5py.File(tmp_path / "weights.h5", "w") as file:
+        file.attrs["layer_names"] = [name.encode() for name in weights]
+        for layer_name, layer_weights in weights.items():
+            group = file.create_group(layer_name)
+            group.attrs["weight_names"] = [name.encode() for name in layer_weights]
+            for weight_name, weight in layer_weights.items():
+                group[weight_name] = weight
+
+    loaded = load_weights_h5(tmp_path / "weights.h5")
+    expected = [*weights["gru"].values(), *weights["dense"].values()]
+    assert len(loaded) == len(expected)
+    for array, weight in zip(loaded, expected):
+        assert np.array_equal(array, weight)
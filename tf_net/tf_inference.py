@@ -1,14 +1,17 @@
 import argparse
 import os
+import sys
 import warnings
 from pathlib import Path
 
 import numpy as np
 import scipy
-import tensorflow as tf
-from tensorflow import keras
 
-import matplotlib.pyplot as plt
+from numpy_gru import CheckpointedGRU, NumpyGRU
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "FFT"))
+from target_decoder import decode
+
 warnings.filterwarnings("ignore")
 os.environ["TF_CPP_MIN_LOG_LEVEL"] = "3"
 
@@ -32,27 +35,19 @@ def cleaning(inp, correcting_size=8):
     return label_kick_filled_erosed
 
 
-def decode(inp):
+def preprocess_target(target_data):
     """
-    A function, that given the target input data, decodes the amplitudes and bins.
-    Decoding via FFT, getting the n_max amplitudes (here 2)
-        -`inp`: Nx8 ,  Target data (target.npy).
-        -`return`: Nx2x2
+    A function for decoding the target data and converting it to the model features.
+        -`target_data`: Nx8 ,  Target data (target.npy).
+        -`return`: time-data with shape (N,8)
     """
+    # the amplitudes and bins are decoded directly into their (interleaved) columns
+    data = np.empty((len(target_data), 8), dtype=np.float32)
+    decode(target_data, amps=data[:, 0::2], bins=data[:, 1::2])
 
-    N = inp.shape[0]
-
-    tmp = inp.reshape(N, -1)
-    target_bins = tmp[:, ::2]
-    target_amps = tmp[:, 1::2]
-    # FFT part, bitshifts
-    decoded_bins = target_bins & 0x00FF
-    decoded_amps = ((target_bins & 0xFF00) >> 8) + ((target_amps & 0x00FF) << 4)
+    data[:, 1::2] /= 31  # deviding bins to it's max
 
-    amps = decoded_amps.reshape(N, 2, 2)
-    bins = decoded_bins.reshape(N, 2, 2)
-
-    return amps, bins
+    return data
 
 
 def load_target_data(folder_path):
@@ -62,16 +57,8 @@ def load_target_data(folder_path):
         -`return`: time-data with shape (N,8)
     """
     target_data = np.load(folder_path)
-    
-    amps, bins = decode(target_data)
-    len_points = amps.shape[0]
-    amps, bins = amps.reshape(len_points, 4), bins.reshape(len_points, 4)
-    data = np.hstack((amps, bins)).astype(np.float32)
-
-    data[:, [4, 5, 6, 7]] = data[:, [4, 5, 6, 7]] / 31  # deviding bins to it's max
-    data = data[:, [0, 4, 1, 5, 2, 6, 3, 7]]  # reordering data to amplitudes and bins
-    
-    return data
+
+    return preprocess_target(target_data)
 
 
 def model_seq(weights_path, kernel_size, split_len):
@@ -83,6 +70,9 @@ def model_seq(weights_path, kernel_size, split_len):
         -`split_len`: model input batch size
         -`return`: model with pretrained weights, split_len
     """
+    # imported here, so that the numpy backend does not load tensorflow
+    import tensorflow as tf
+    from tensorflow import keras
 
     model = keras.Sequential(
         [
@@ -97,51 +87,247 @@ def model_seq(weights_path, kernel_size, split_len):
     return model
 
 
-def inference(path, split_len=50, confidence=0.7):
+def load_model(split_len=50, kernel_size=3, backend="keras"):
     """
-    Function for inference on given file.
-        -`path`: imput file path
+    A function for loading the pretrained model shipped next to this script.
+        -`split_len`: model input batch size
+        -`kernel_size`: The kernel size of conv function
+        -`backend`: "keras" for the tensorflow model, "numpy" for `NumpyGRU` (no tensorflow import)
+        -`return`: model with pretrained weights
     """
-    eps = 1e-8
-    stride = 1
-    split_len = 50
-    kernel = np.ones(3) / 3
-
-    # load the model
     script_path = Path(os.path.realpath(__file__)).parent
-    weights_path = script_path / "models" / "our_train_our_fit_full.h5"    
-    model = model_seq(weights_path, len(kernel), split_len)
-    
-    # data loading and splitting
-    target_data = load_target_data(path)
-    mask = np.arange(split_len) + np.arange(target_data.shape[0] - split_len, step=stride)[..., None]
-    data = target_data[mask]
-    
-    # conv normalization
-    mask_conv = np.arange(split_len - kernel.shape[0] + 1)[:, None] + np.arange(kernel.shape[0])
-    data_avg = (data[..., [0, 2, 4, 6]][:, mask_conv] * kernel[..., None]).sum(axis=-2)
-    data_avg = data_avg / np.maximum(np.max(data_avg, axis=1), eps)[:, None]
-    joint_data = np.concatenate([data_avg, data[:, kernel.shape[0]-1:, [1, 3, 5, 7]]], axis=-1)
-    joint_data = joint_data[..., [0, 4, 1, 5, 2, 6, 3, 7]]  # reordering the data           
-    
-    # model prediction
-    pred = model.predict(joint_data, verbose=0)
-    pred = np.where(pred > confidence)[1]
+    weights_path = script_path / "models" / "our_train_our_fit_full.h5"
+
+    if backend == "numpy":
+        return NumpyGRU.from_file(weights_path)
+
+    return model_seq(weights_path, kernel_size, split_len)
+
+
+def format_kick(frame, kick_start):
+    """
+    A function that formats a detected kick as the JSON line expected by the benchmarking.
+    """
+    return '{{"frame":   {}, "kick_start": {}}}'.format(frame, kick_start)
+
+
+def find_kicks(pred, split_len):
+    """
+    A function for getting the kicks from the sequence of confident window predictions.
+        -`pred`: 0/1 predictions of the confident windows
+        -`split_len`: model input batch size
+        -`return`: list of (frame, kick_start) tuples
+    """
     pred = np.concatenate((np.zeros(split_len), pred))  # to cancel th AI delay
-    
+
     # getting kick's start and stop indices
     label, group_index = scipy.ndimage.label(pred)
     labels_i, labels_j, labels_i_count = np.unique(label, return_index=True, return_counts=True)
     kick_start, kick_stop = labels_j[1:], labels_j[1:] + labels_i_count[1:] - 1
 
+    kicks = []
     for i in range(len(kick_start)):
         start = int(kick_stop[i]-split_len)
         stop = int(kick_start[i])
         if start >= stop:
             continue
-        print('{{"frame":   {}, "kick_start": {}}}'.format(stop, start))     
+        kicks.append((stop, start))
+
+    return kicks
+
+
+def make_windows(target_data, split_len=50, kernel=np.ones(3) / 3, eps=1e-8, stride=1):
+    """
+    A function for splitting the decoded target data into the normalized model inputs.
+        -`target_data`: Nx8 decoded target data (`load_target_data`)
+        -`return`: Wx(split_len - kernel_size + 1)x8 windows
+    """
+    mask = np.arange(split_len) + np.arange(target_data.shape[0] - split_len, step=stride)[..., None]
+    data = target_data[mask]
+
+    # conv normalization
+    mask_conv = np.arange(split_len - kernel.shape[0] + 1)[:, None] + np.arange(kernel.shape[0])
+    data_avg = (data[..., [0, 2, 4, 6]][:, mask_conv] * kernel[..., None]).sum(axis=-2)
+    data_avg = data_avg / np.maximum(np.max(data_avg, axis=1), eps)[:, None]
+    joint_data = np.concatenate([data_avg, data[:, kernel.shape[0]-1:, [1, 3, 5, 7]]], axis=-1)
+    joint_data = joint_data[..., [0, 4, 1, 5, 2, 6, 3, 7]]  # reordering the data
+
+    return joint_data
+
+
+def predict_kicks(model, target_data, split_len=50, confidence=0.7, engine="window", context=None):
+    """
+    Function for detecting the kicks with a loaded model.
+        -`model`: model returned by `load_model`
+        -`target_data`: Nx8 decoded target data (`load_target_data`)
+        -`engine`: "window" runs the model on every window separately,
+                   "checkpointed" shares the GRU runs between the windows (`CheckpointedGRU`)
+        -`context`: context of the checkpointed engine, None for the exact predictions (as fast as "window"),
+                    smaller contexts are faster but approximate
+        -`return`: list of (frame, kick_start) tuples
+    """
+    kernel = np.ones(3) / 3
+
+    if engine == "checkpointed":
+        if not isinstance(model, NumpyGRU):
+            model = NumpyGRU.from_keras(model)
+        gru = CheckpointedGRU(model, split_len, kernel, context=context)
+        pred = gru.predict(target_data)
+    else:
+        pred = model.predict(make_windows(target_data, split_len, kernel), verbose=0)
+    pred = np.where(pred > confidence)[1]
+
+    return find_kicks(pred, split_len)
+
+
+def inference(path, split_len=50, confidence=0.7, engine="window", context=None, backend="keras"):
+    """
+    Function for inference on given file.
+        -`path`: imput file path
+        -`engine`, `context`: see `predict_kicks`
+        -`backend`: "keras" or "numpy", see `load_model`
+    """
+    split_len = 50
+
+    # load the model
+    model = load_model(split_len, backend=backend)
+
+    target_data = load_target_data(path)
+    kicks = predict_kicks(model, target_data, split_len, confidence, engine, context)
+
+    for frame, kick_start in kicks:
+        print(format_kick(frame, kick_start))
+
+
+class StreamingKickDetector:
+    """
+    A stateful kick detector that consumes the target data one frame (40 ms) at a time.
+    The last `split_len` decoded frames and their running average are kept in ring buffers,
+    so the memory stays O(split_len) and every frame costs exactly one window prediction.
+    The emitted kicks are the same as the ones printed by `inference`.
+        -`model`: model returned by `model_seq`
+        -`split_len`: model input batch size
+        -`confidence`: minimal probability of a confident window prediction
+        -`kernel`: the averaging kernel of the amplitudes
+    """
+
+    def __init__(self, model, split_len=50, confidence=0.7, kernel=np.ones(3) / 3, eps=1e-8):
+        self.model = model
+        self.split_len = split_len
+        self.confidence = confidence
+        self.kernel = kernel
+        self.eps = eps
+        self.avg_len = split_len - kernel.shape[0] + 1
+
+        # ring buffers: decoded frames and the averaged amplitudes of the current window
+        self._frames = np.zeros((split_len, 8), dtype=np.float32)
+        self._avg = np.zeros((self.avg_len, 4))
+
+        self.reset()
+
+    def reset(self):
+        """
+        Forgets all the consumed frames.
+        """
+        self.frame_count = 0
+        # length of the prediction sequence in `find_kicks`, including the leading zeros
+        self._pred_len = self.split_len
+        self._kick_begin = None
+
+    def push(self, frame):
+        """
+        Consumes a single target frame and returns the kick, which ended with it.
+            -`frame`: 8 values of the target data (one row of target.npy)
+            -`return`: {"frame": ..., "kick_start": ...} or None
+        """
+        kernel_size = self.kernel.shape[0]
+
+        self._frames[self.frame_count % self.split_len] = preprocess_target(
+            np.asarray(frame).reshape(1, 8)
+        )[0]
+        self.frame_count += 1
+
+        if self.frame_count >= kernel_size:
+            avg_index = self.frame_count - kernel_size
+            frames = self._frames[(avg_index + np.arange(kernel_size)) % self.split_len]
+            self._avg[avg_index % self.avg_len] = (
+                frames[:, [0, 2, 4, 6]] * self.kernel[..., None]
+            ).sum(axis=0)
+
+        if self.frame_count < self.split_len:
+            return None
+
+        return self._update(self._predict())
+
+    def flush(self):
+        """
+        Closes the kick, which is still open at the end of the recording.
+            -`return`: {"frame": ..., "kick_start": ...} or None
+        """
+        if self._kick_begin is None:
+            return None
+
+        return self._close_kick(self._pred_len - 1)
+
+    def _predict(self):
+        # oldest first, as in the windows of `inference`
+        order = self.frame_count - self.avg_len + np.arange(self.avg_len)
+        data_avg = self._avg[(order - self.kernel.shape[0] + 1) % self.avg_len]
+        data_avg = data_avg / np.maximum(np.max(data_avg, axis=0), self.eps)
+        bins = self._frames[order % self.split_len][:, [1, 3, 5, 7]]
+
+        joint_data = np.concatenate([data_avg, bins], axis=-1)
+        joint_data = joint_data[:, [0, 4, 1, 5, 2, 6, 3, 7]]  # reordering the data
+
+        return np.asarray(self.model(joint_data[None], training=False))[0]
+
+    def _update(self, pred):
+        pred = np.where(pred > self.confidence)[0]
+        if not len(pred):
+            # not confident windows are dropped from the prediction sequence
+            return None
+
+        index = self._pred_len
+        self._pred_len += 1
+
+        if pred[0]:
+            if self._kick_begin is None:
+                self._kick_begin = index
+            return None
+
+        if self._kick_begin is None:
+            return None
+
+        return self._close_kick(index - 1)
+
+    def _close_kick(self, kick_end):
+        kick_begin, self._kick_begin = self._kick_begin, None
+
+        start = int(kick_end - self.split_len)
+        stop = int(kick_begin)
+        if start >= stop:
+            return None
+
+        return {"frame": stop, "kick_start": start}
+
+
+def streaming_inference(path, split_len=50, confidence=0.7, backend="keras"):
+    """
+    Function for frame by frame inference on given file.
+        -`path`: imput file path
+        -`backend`: "keras" or "numpy", see `load_model`
+    """
+    detector = StreamingKickDetector(load_model(split_len, backend=backend), split_len, confidence)
+
+    # `inference` does not predict the last window, so the last frame is not pushed
+    target_data = np.load(path)
+    kicks = [detector.push(frame) for frame in target_data[:-1]] + [detector.flush()]
+
+    for kick in kicks:
+        if kick is not None:
+            print(format_kick(kick["frame"], kick["kick_start"]))
+
 
-        
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument(
@@ -149,8 +335,37 @@ if __name__ == "__main__":
         type=str,
         help="folder name of a file containing recordings",
     )
-  
+    parser.add_argument(
+        "--streaming",
+        action="store_true",
+        help="process the recording frame by frame with StreamingKickDetector",
+    )
+    parser.add_argument(
+        "--engine",
+        type=str,
+        choices=["window", "checkpointed"],
+        default="window",
+        help="window inference engine, checkpointed shares the GRU runs between the windows",
+    )
+    parser.add_argument(
+        "--context",
+        type=int,
+        default=None,
+        help="minimal window context of the checkpointed engine (default: exact predictions, "
+        "as fast as the window engine), smaller contexts are faster but approximate",
+    )
+    parser.add_argument(
+        "--backend",
+        type=str,
+        choices=["keras", "numpy"],
+        default="keras",
+        help="numpy runs the model without importing tensorflow",
+    )
+
     args = parser.parse_args()
     path = args.target_path
 
-    inference(path)
+    if args.streaming:
+        streaming_inference(path, backend=args.backend)
+    else:
+        inference(path, engine=args.engine, context=args.context, backend=args.backend)
@@ -0,0 +1,307 @@
+"""Regression tests of utils.py (the target extraction, the resampling, the kick placement, the target decoding and
+the loading of the windows) against the original implementations."""
+import os
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+import scipy.ndimage
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from utils import DataLoader, SegmentPlacement, decode, raw_to_target, resample_indices  # noqa: E402
+from target_extractor import get_extractor  # noqa: E402
+from session_archive import build_archive  # noqa: E402
+
+
+def reference_gauss(n: int) -> np.ndarray:
+    """The original window function `_gauss`."""
+    n += 1
+    x = np.arange(-n // 2 + 1, n // 2)
+    x = 2 * x / n
+    y = np.exp(-1 / (1 - x**2))
+
+    return y / y.sum()
+
+
+def reference_fft(raw_data: np.ndarray, window_fn=None) -> np.ndarray:
+    """The original `fft` (complex assembly with `np.vectorize(complex)`)."""
+    data = np.vectorize(complex)(raw_data[..., 0, :], raw_data[..., 1, :])
+    data -= data.mean(axis=-1, keepdims=True)
+
+    if window_fn is not None:
+        window = window_fn(raw_data.shape[-1])
+        window /= window.sum()
+        data = data * window
+
+    return np.fft.fft(data, axis=-1)
+
+
+def reference_raw_to_target(raw_data: np.ndarray, num_targets: int = 2) -> np.ndarray:
+    """The original `raw_to_target` for a single recording (the order of equal amplitudes is not defined)."""
+    amp = np.abs(reference_fft(raw_data, window_fn=reference_gauss))
+
+    bins = np.argpartition(amp, -num_targets, axis=-1)[..., -num_targets:][..., ::-1]
+    values = np.take_along_axis(amp, indices=bins, axis=-1)
+
+    values = values.astype(np.uint16).reshape(-1, 4)
+    bins = bins.astype(np.uint16).reshape(-1, 4)
+
+    return np.concatenate((values, bins), axis=1)
+
+
+def reference_data_load(data_loader: DataLoader, path: Path) -> tuple:
+    """The original `DataLoad` (a loop over the windows of every recording, without up/down sampled kicks)."""
+    kernel = data_loader.kernel
+    split_len = data_loader.split_len
+
+    interval_target_data = np.zeros([0, split_len - kernel.shape[0] + 1, 8])
+    interval_raw_data = np.zeros([0, split_len, 2, 2, 32])
+    interval_labels = np.zeros([0])
+
+    all_raw_datas = sorted(list(path.rglob("*/radar.npy")))
+    all_target_datas = sorted(list(path.rglob("*/target.npy")))
+    all_labels = sorted(list(path.rglob("*/ref_kicks.npy")))
+
+    for folder_i in range(len(all_target_datas)):
+        raw_data = np.load(all_raw_datas[folder_i]).astype(float)
+        target_data = np.load(all_target_datas[folder_i]).astype(float)
+        labels = np.load(all_labels[folder_i]).astype(float)
+        target_data[:, [4, 5, 6, 7]] = target_data[:, [4, 5, 6, 7]] / 31
+
+        interval_labels_curr = np.zeros(target_data.shape[0] - split_len + 1)
+        interval_target_data_curr = []
+        interval_raw_data_curr = []
+        del_idx = []
+
+        for i in range(target_data.shape[0] - split_len + 1):
+            data_i = target_data[i : i + split_len]
+            label_i = labels[i : i + split_len]
+
+            label, _ = scipy.ndimage.label(label_i)
+            _, labels_j, labels_i_count = np.unique(label, return_index=True, return_counts=True)
+            label_kick_start, label_kick_stop = labels_j[1:], labels_j[1:] + labels_i_count[1:] - 1
+            _len = len(label_kick_start)
+            if _len and i != 0 and i != target_data.shape[0] - split_len:
+                if (
+                    _len > 1
+                    or (labels[i - 1] or labels[i + split_len])
+                    or (label_kick_stop - label_kick_start) < data_loader.min_duration
+                ):
+                    del_idx.append(i)
+                    continue
+                else:
+                    interval_labels_curr[i] = 1
+
+            convolved_data = np.zeros(shape=(split_len - 2, 8))
+            mask = np.arange(split_len - kernel.shape[0] + 1)[:, None] + np.arange(kernel.shape[0])
+            data_avg = (data_i[..., [0, 1, 2, 3]][mask] * kernel[..., None]).sum(axis=1)
+            data_avg = data_avg / np.maximum(np.max(data_avg, axis=0), data_loader.eps)
+            convolved_data[:, [0, 1, 2, 3]] = data_avg
+            convolved_data[:, [4, 5, 6, 7]] = data_i[2:, [4, 5, 6, 7]]
+
+            interval_target_data_curr.append(convolved_data)
+            interval_raw_data_curr.append(raw_data[i : i + split_len])
+
+        if len(del_idx):
+            interval_labels_curr = np.delete(interval_labels_curr, del_idx)
+
+        interval_target_data = np.concatenate((interval_target_data, interval_target_data_curr), axis=0)
+        interval_raw_data = np.concatenate((interval_raw_data, interval_raw_data_curr), axis=0)
+        interval_labels = np.concatenate((interval_labels, interval_labels_curr), axis=0)
+
+    return interval_raw_data, interval_target_data[..., [0, 4, 1, 5, 2, 6, 3, 7]], interval_labels
+
+
+@pytest.fixture
+def raw_data() -> np.ndarray:
+    """Noisy raw data like in the augmentations (float, clipped to the ADC range)."""
+    rng = np.random.default_rng(0)
+    raw_data = rng.integers(0, 4095, size=(8, 50, 2, 2, 32)).astype(float)
+    return np.clip(raw_data + rng.normal(0, 20, size=raw_data.shape), 0, 4094)
+
+
+@pytest.mark.parametrize("window_fn", [None, reference_gauss])
+def test_spectrum(raw_data: np.ndarray, window_fn) -> None:
+    # the FFT of `raw_to_target` (its extractor has the default window) and of an extractor without window
+    extractor = get_extractor() if window_fn is not None else get_extractor(window=None)
+    assert np.array_equal(extractor.spectrum(raw_data[0]), reference_fft(raw_data[0], window_fn))
+    assert np.array_equal(
+        extractor.spectrum(raw_data[0].astype(np.uint16)),
+        reference_fft(raw_data[0].astype(np.uint16), window_fn),
+    )
+
+
+def test_raw_to_target(raw_data: np.ndarray) -> None:
+    assert np.array_equal(raw_to_target(raw_data[0]), reference_raw_to_target(raw_data[0]))
+
+
+def test_raw_to_target_batch(raw_data: np.ndarray) -> None:
+    expected = np.stack([reference_raw_to_target(window) for window in raw_data])
+    assert np.array_equal(raw_to_target(raw_data), expected)
+    assert raw_to_target(raw_data[:0]).shape == (0, 50, 8)
+
+
+def test_resample_indices() -> None:
+    torch = pytest.importorskip("torch")
+    input_sizes, output_sizes = [20 * 32, 20 * 32, 49 * 32, 13 * 32], [35 * 32, 50 * 32, 12 * 32, 13 * 32]
+
+    expected = np.concatenate(
+        [
+            torch.nn.functional.interpolate(torch.arange(n, dtype=torch.float64)[None, None], m)[0, 0].numpy()
+            for n, m in zip(input_sizes, output_sizes)
+        ]
+    )
+    assert np.array_equal(resample_indices(input_sizes, output_sizes), expected)
+
+
+def test_segment_placement() -> None:
+    rng = np.random.RandomState(0)
+    placement = SegmentPlacement(400, start_end_buffer=20, mid_buffer=10)
+
+    for segment_len in [40, 25, 60, 30]:
+        expected = [
+            start
+            for start in range(20, 400 - segment_len - 20)
+            if all(start > end + 10 or start + segment_len - 1 < begin - 10 for begin, end in placement)
+        ]
+        gap_starts, gap_stops = placement.FreeStarts(segment_len)
+        assert [start for gap in zip(gap_starts, gap_stops) for start in range(*gap)] == expected
+        assert placement.Place(segment_len, rng)[0] in expected
+
+    with pytest.raises(ValueError, match="No free position"):
+        SegmentPlacement(100, start_end_buffer=20, mid_buffer=10).Place(61, rng)
+
+
+def test_decode() -> None:
+    target = np.random.default_rng(0).integers(0, 0xFFFF, size=(100, 8), dtype=np.uint16, endpoint=True)
+
+    # the original decode
+    target_bins, target_amps = target[:, ::2], target[:, 1::2]
+    expected_amps = ((target_bins & 0xFF00) >> 8) + ((target_amps & 0x00FF) << 4)
+    expected_bins = target_bins & 0x00FF
+
+    amps, bins = decode(target)
+    assert amps.dtype == bins.dtype == np.uint16
+    assert np.array_equal(amps, expected_amps.reshape(-1, 2, 2))
+    assert np.array_equal(bins, expected_bins.reshape(-1, 2, 2))
+
+    features = np.empty((100, 8), dtype=np.float32)
+    decode(target.astype(np.int64), amps=features[:, 0::2], bins=features[:, 1::2])
+    assert np.array_equal(features[:, 0::2], expected_amps)
+    assert np.array_equal(features[:, 1::2], expected_bins)
+
+
+def test_data_load_session_archive(tmp_path: Path) -> None:
+    rng = np.random.default_rng(0)
+    for name, len_points in [("recording_b", 300), ("recording_a", 200)]:
+        radar_path = tmp_path / name / "RadarIfxMimose_00"
+        radar_path.mkdir(parents=True)
+        labels = np.zeros(len_points, dtype=np.uint16)
+        labels[100:130] = 1
+        np.save(radar_path / "radar.npy", rng.integers(0, 4095, size=(len_points, 2, 2, 32), dtype=np.uint16))
+        np.save(radar_path / "target.npy", rng.integers(0, 100, size=(len_points, 8), dtype=np.uint16))
+        np.save(tmp_path / name / "ref_kicks.npy", labels)
+
+    archive_path = build_archive(tmp_path)
+
+    data_loader = DataLoader(root_path=tmp_path)
+    expected = data_loader.DataLoad(tmp_path)
+    for result, expected_data in zip(data_loader.DataLoad(archive_path), expected):
+        assert np.array_equal(result, expected_data)
+
+
+@pytest.mark.parametrize("raw_windows", ["array", "lazy"])
+def test_data_load(tmp_path: Path, raw_windows: str) -> None:
+    kicks = {
+        # kicks at the edges of the recording
+        "edges": [(0, 20), (280, 300)],
+        # kicks separated by a single frame, kicks closer than a window and a kick touching the border of a window
+        "touching": [(60, 80), (81, 100), (150, 170), (190, 210), (249, 270)],
+        # kicks shorter than, as long as and just longer than `min_duration`
+        "short": [(40, 45), (100, 112), (160, 173), (220, 234)],
+        "no_kick": [],
+    }
+    rng = np.random.default_rng(0)
+    for name, intervals in kicks.items():
+        radar_path = tmp_path / name / "RadarIfxMimose_00"
+        radar_path.mkdir(parents=True)
+        labels = np.zeros(300, dtype=np.uint16)
+        for start, stop in intervals:
+            labels[start:stop] = 1
+        np.save(radar_path / "radar.npy", rng.integers(0, 4095, size=(300, 2, 2, 32), dtype=np.uint16))
+        np.save(radar_path / "target.npy", rng.integers(0, 100, size=(300, 8), dtype=np.uint16))
+        np.save(tmp_path / name / "ref_kicks.npy", labels)
+
+    data_loader = DataLoader(root_path=tmp_path)
+    raw, target, labels = data_loader.DataLoad(tmp_path, raw_windows=raw_windows)
+    expected_raw, expected_target, expected_labels = reference_data_load(data_loader, tmp_path)
+
+    assert 0 < expected_labels.sum() < len(expected_labels)
+    assert np.array_equal(labels, expected_labels)
+    assert np.array_equal(target, expected_target)
+    assert np.array_equal(np.asarray(raw), expected_raw)
+
+
+def test_cache(tmp_path: Path) -> None:
+    for folder in ["train/original/recording_a", "test/recording_b"]:
+        (tmp_path / "Data" / folder).mkdir(parents=True)
+        np.save(tmp_path / "Data" / folder / "target.npy", np.zeros((10, 8), dtype=np.uint16))
+    input_path = tmp_path / "Data" / "test" / "recording_b" / "target.npy"
+
+    prepared = ((np.zeros((2, 50, 2, 2, 32)), np.zeros((2, 50, 8)), np.ones(2)), (np.zeros((1, 50, 8)), np.zeros(1)))
+    data_loader = DataLoader(root_path=tmp_path / "Data", cache_dir=tmp_path / "cache")
+    data_loader.Prepare = lambda: prepared
+
+    key = data_loader.CacheKey()
+    data_loader()
+    assert (tmp_path / "cache" / key / "complete").exists()
+
+    # the key follows the modification of an input file without reading it
+    stat = input_path.stat()
+    os.utime(input_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+    assert data_loader.CacheKey() != key
+
+    # random augmentations are not cached
+    for aug_seed, aug_workers in [(None, 2), (0, 0)]:
+        data_loader = DataLoader(
+            root_path=tmp_path / "Data",
+            cache_dir=tmp_path / "aug_cache",
+            is_aug=True,
+            aug_seed=aug_seed,
+            aug_workers=aug_workers,
+        )
+        data_loader.Prepare = lambda: prepared
+        data_loader()
+        assert not (tmp_path / "aug_cache").exists()
+
+
+def test_augment(tmp_path: Path) -> None:
+    rng = np.random.default_rng(0)
+    for kind, len_points in [("kick", 600), ("no_kick", 600), ("background", 1500)]:
+        for i in range(3):
+            radar_path = tmp_path / "train" / "original" / kind / f"recording_{i}" / "RadarIfxMimose_00"
+            radar_path.mkdir(parents=True)
+            labels = np.zeros(len_points, dtype=np.uint16)
+            if kind == "kick":
+                labels[100 : 120 + 3 * i] = 1
+                labels[300:330] = 1
+            np.save(radar_path.parent / "ref_kicks.npy", labels)
+            np.save(radar_path / "radar.npy", rng.integers(0, 4095, size=(len_points, 2, 2, 32), dtype=np.uint16))
+            np.save(radar_path / "target.npy", rng.integers(0, 65535, size=(len_points, 8), dtype=np.uint16))
+
+    # the serial (in this process) and the parallel augmentations
+    results = [
+        DataLoader(root_path=tmp_path, kicks_perc=1.0, no_kicks_perc=0.5, sample_count=3).Augment(workers, seed=7)
+        for workers in [1, 2, 3]
+    ]
+
+    recordings, up_down_raw, up_down_target = results[0]
+    assert len(recordings) > 0 and len(up_down_raw) > 0
+    for other_recordings, other_up_down_raw, other_up_down_target in results[1:]:
+        assert len(other_recordings) == len(recordings)
+        for recording, other_recording in zip(recordings, other_recordings):
+            for array, other_array in zip(recording, other_recording):
+                assert np.array_equal(array, other_array)
+        assert np.array_equal(other_up_down_raw, up_down_raw)
+        assert np.array_equal(other_up_down_target, up_down_target)
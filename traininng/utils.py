@@ -1,48 +1,41 @@
+import bisect
+import copy
+import hashlib
+import json
 import os
-import random
 import shutil
+import sys
+import time
+import warnings
+from concurrent.futures import ProcessPoolExecutor
 from glob import glob
 from pathlib import Path
-from typing import Callable, Optional, Tuple
 
 import matplotlib.pyplot as plt
 import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
 import scipy
 import tensorflow as tf
-import torch
-import torch.nn.functional as fun
 from sklearn.metrics import confusion_matrix
 from sklearn.utils import shuffle
 from tensorflow import keras
 from tqdm import tqdm
 
-os.environ["TF_CPP_MIN_LOG_LEVEL"] = "2"  # Truns off tf warnings
-np.warnings.filterwarnings(
-    "ignore", category=np.VisibleDeprecationWarning
-)  # Truns off np warnings
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "FFT"))
+from target_decoder import decode
+from target_extractor import get_extractor
 
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "ifxdaq"))
+from session_archive import SessionArchive
 
-def decode(inp):
-    """
-    A function, that given the target input data, decodes the amplitudes and bins.
-    Decoding via FFT, getting the n_max amplitudes (here 2)
-        -`inp`: Nx8 ,  Target data (target.npy).
-        -`return`: Nx2x2
-    """
-
-    N = inp.shape[0]
+# increase, if the prepared data changes without a change of the code of this file
+CACHE_VERSION = 1
 
-    tmp = inp.reshape(N, -1)
-    target_bins = tmp[:, ::2]
-    target_amps = tmp[:, 1::2]
-    # FFT part, bitshifts
-    decoded_bins = target_bins & 0x00FF
-    decoded_amps = ((target_bins & 0xFF00) >> 8) + ((target_amps & 0x00FF) << 4)
-
-    amps = decoded_amps.reshape(N, 2, 2)
-    bins = decoded_bins.reshape(N, 2, 2)
+os.environ["TF_CPP_MIN_LOG_LEVEL"] = "2"  # Truns off tf warnings
+warnings.filterwarnings(
+    "ignore", category=np.VisibleDeprecationWarning
+)  # Truns off np warnings
 
-    return amps, bins
 
 def cleaning(inp, correcting_size=8):
     """
@@ -78,6 +71,190 @@ def cleaning(inp, correcting_size=8):
 
         return label_kick_filled_erosed
 
+
+def _load_array(source, mmap_mode=None):
+    """
+    Loads a .npy file, arrays are returned as they are.
+    """
+    if isinstance(source, np.ndarray):
+        return source
+
+    return np.load(source, mmap_mode=mmap_mode)
+
+
+def resample_indices(input_sizes, output_sizes):
+    """
+    The nearest neighbour resampling (like `torch.nn.functional.interpolate` with mode="nearest") of several
+    sequences at once: sample i of an output of size m takes the sample floor(i * n / m) of its input of size n.
+        -`input_sizes`: The sizes of the input sequences
+        -`output_sizes`: The sizes of the resampled sequences
+        -`return`: The concatenated indices of all the outputs into their inputs
+    """
+    input_sizes = np.asarray(input_sizes, dtype=int)
+    output_sizes = np.asarray(output_sizes, dtype=int)
+
+    offsets = np.cumsum(output_sizes) - output_sizes
+    positions = np.arange(output_sizes.sum()) - np.repeat(offsets, output_sizes)
+
+    return (
+        positions
+        * np.repeat(input_sizes, output_sizes)
+        // np.repeat(output_sizes, output_sizes)
+    )
+
+
+def _augmentation_task(data_loader, seed, kind, args):
+    """
+    A single augmentation of `DataLoader.Augment`, run in a worker process.
+        -`data_loader`: DataLoader (a copy in the worker)
+        -`seed`: SeedSequence of the task's random generator
+        -`kind`: "noise", "synthetic" or "up_down"
+        -`args`: arguments of the augmentation
+        -`return`: the augmented data and the time it took
+    """
+    start = time.perf_counter()
+    data_loader.rng = np.random.RandomState(np.random.MT19937(seed))
+
+    if kind == "noise":
+        result = data_loader.NoiseRecording(*args)
+    elif kind == "synthetic":
+        result = data_loader.SynthesizeRecording(*args)
+    else:
+        raw_kick, ref_kick = np.load(args[0]), np.load(args[1])
+        up_sampled_kicks = data_loader.UpDownSample(raw_kick, ref_kick, kind="up")
+        down_sampled_kicks = data_loader.UpDownSample(raw_kick, ref_kick, kind="down")
+        result = (
+            np.concatenate([up_sampled_kicks[0], down_sampled_kicks[0]]),
+            np.concatenate([up_sampled_kicks[1], down_sampled_kicks[1]]),
+        )
+
+    return result, time.perf_counter() - start
+
+
+class RawWindowDataset:
+    """
+    The raw data windows of DataLoad, indexed lazily from the recordings instead of copying every frame into up to
+    `split_len` windows. Indexing returns float copies of the selected windows, like the rows of the array.
+        -`recordings`: The raw data of the recordings (Nx2x2x32 arrays, can be memory-mapped).
+        -`recording_ids`: The recording of every window.
+        -`starts`: The first frame of every window in its recording.
+        -`split_len`: The window length.
+    """
+
+    def __init__(self, recordings, recording_ids, starts, split_len=50):
+        self.recordings = recordings
+        self.recording_ids = np.asarray(recording_ids, dtype=int)
+        self.starts = np.asarray(starts, dtype=int)
+        self.split_len = split_len
+        self.dtype = np.dtype(float)
+
+    @property
+    def shape(self):
+        return (len(self), self.split_len, 2, 2, 32)
+
+    @property
+    def ndim(self):
+        return len(self.shape)
+
+    def __len__(self):
+        return len(self.starts)
+
+    def __getitem__(self, index):
+        if isinstance(index, (int, np.integer)):
+            return self[np.array([index])][0]
+
+        windows = np.arange(len(self))[index]
+        out = np.empty((len(windows),) + self.shape[1:], dtype=self.dtype)
+
+        recording_ids = self.recording_ids[windows]
+        for recording_id in np.unique(recording_ids):
+            selected = recording_ids == recording_id
+            view = sliding_window_view(
+                self.recordings[recording_id], self.split_len, axis=0
+            )
+            out[selected] = np.moveaxis(view[self.starts[windows[selected]]], -1, 1)
+
+        return out
+
+    def __array__(self, dtype=None, copy=None):
+        out = self[:]
+        return out if dtype is None else out.astype(dtype)
+
+
+class SegmentPlacement:
+    """
+    The occupied time segments of a background recording, kept sorted, for placing new segments at random free
+    positions without overlaps and without the rejection sampling of the positions.
+        -`len_whole_seq`: The length of the background.
+        -`start_end_buffer`: The number of frames kept free at the beginning and at the end of the background.
+        -`mid_buffer`: The number of frames kept free between two segments.
+    """
+
+    def __init__(self, len_whole_seq, start_end_buffer=100, mid_buffer=50):
+        self.len_whole_seq = len_whole_seq
+        self.start_end_buffer = start_end_buffer
+        self.mid_buffer = mid_buffer
+        self.starts, self.ends = [], []
+
+    def __len__(self):
+        return len(self.starts)
+
+    def __iter__(self):
+        return zip(self.starts, self.ends)
+
+    def FreeStarts(self, segment_len):
+        """
+        The possible starts of a new segment.
+            -`segment_len`: The length of the new segment.
+            -`return`: (gap_starts, gap_stops), the segment can start in any [gap_start, gap_stop)
+        """
+        # the starts [start - mid_buffer - segment_len + 1, end + mid_buffer] are too near to a segment
+        ends = np.asarray(self.ends, dtype=int) + self.mid_buffer + 1
+        starts = np.asarray(self.starts, dtype=int) - self.mid_buffer - segment_len + 1
+
+        gap_starts = np.maximum(
+            np.append(self.start_end_buffer, ends), self.start_end_buffer
+        )
+        gap_stops = np.minimum(
+            np.append(starts, self.len_whole_seq - segment_len - self.start_end_buffer),
+            self.len_whole_seq - segment_len - self.start_end_buffer,
+        )
+
+        return gap_starts, np.maximum(gap_stops, gap_starts)
+
+    def Place(self, segment_len, random=np.random):
+        """
+        Draws a uniformly random free position for a new segment and marks it as occupied.
+            -`segment_len`: The length of the new segment.
+            -`random`: The random generator (np.random or a RandomState).
+            -`return`: a tuple (segment_start, segment_end)
+        """
+        gap_starts, gap_stops = self.FreeStarts(segment_len)
+        gap_sizes = gap_stops - gap_starts
+        cum_sizes = np.cumsum(gap_sizes)
+
+        if cum_sizes[-1] <= 0:
+            raise ValueError(
+                f"No free position for a segment of length {segment_len} in a background of length "
+                f"{self.len_whole_seq} with {len(self)} segments (start_end_buffer={self.start_end_buffer}, "
+                f"mid_buffer={self.mid_buffer})"
+            )
+
+        # the position among all the free starts, then its gap
+        position = random.randint(cum_sizes[-1])
+        gap = np.searchsorted(cum_sizes, position, side="right")
+        segment_start = int(
+            gap_starts[gap] + position - (cum_sizes[gap] - gap_sizes[gap])
+        )
+        segment_end = segment_start + segment_len - 1
+
+        index = bisect.bisect(self.starts, segment_start)
+        self.starts.insert(index, segment_start)
+        self.ends.insert(index, segment_end)
+
+        return segment_start, segment_end
+
+
 class DataLoader:
     def __init__(
         self,
@@ -99,8 +276,24 @@ class DataLoader:
         kernel=np.ones(3) / 3,
         eps=1e-8,
         sample_count=10,
+        raw_windows="array",
+        cache_dir=None,
+        aug_workers=0,
+        aug_seed=None,
     ):
+        # the parameters, which define the prepared data (part of the cache key)
+        self.params = {
+            name: value.tolist() if isinstance(value, np.ndarray) else value
+            for name, value in locals().items()
+            if name not in ("self", "cache_dir", "aug_workers")
+        }
+        self.cache_dir = None if cache_dir is None else Path(cache_dir)
+        self.aug_workers = aug_workers
+        self.aug_seed = aug_seed
+        # random generator of the augmentations, None for the global numpy one
+        self.rng = None
         self.eps = eps
+        self.raw_windows = raw_windows
         self.is_aug = is_aug
         self.kernel = kernel
         self.split_len = split_len
@@ -123,9 +316,122 @@ class DataLoader:
         self.uniform_low, self.uniform_high = uniform_low, uniform_high
 
     def __call__(self):
+        """
+        Prepares the train and the test data, or loads them from the cache, if `cache_dir` is given
+        (raw_windows="lazy" is not cached, as its windows reference the recordings, and neither are
+        augmentations, which are not reproducible: without `aug_seed` or without `aug_workers`).
+            -`return`: (raw, target, labels) train data, (target, labels) test data
+        """
+        if self.cache_dir is None or self.raw_windows == "lazy":
+            return self.Prepare()
+
+        if self.is_aug and (self.aug_seed is None or not self.aug_workers):
+            print(
+                "The augmented data is not cached, it is random without aug_seed and aug_workers"
+            )
+            return self.Prepare()
+
+        cache_path = self.cache_dir / self.CacheKey()
+        if (cache_path / "complete").exists():
+            return self.LoadCache(cache_path)
+
+        train_data, test_data = self.Prepare()
+        self.SaveCache(cache_path, train_data, test_data)
+
+        return train_data, test_data
+
+    def CacheKey(self):
+        """
+        A key of the prepared data: the parameters, the code version and the paths, sizes and
+        modification times of the input files (their content is not read).
+        """
+        key = hashlib.sha256()
+        key.update(
+            json.dumps(
+                [CACHE_VERSION, self.params], sort_keys=True, default=str
+            ).encode()
+        )
+
+        code_paths = [
+            Path(__file__),
+            Path(__file__).resolve().parents[1] / "FFT" / "target_extractor.py",
+            Path(__file__).resolve().parents[1] / "FFT" / "target_decoder.py",
+        ]
+        for code_path in code_paths:
+            key.update(code_path.read_bytes())
+
+        input_paths = sorted(self.train_data_folder.joinpath("original").rglob("*.npy"))
+        input_paths += sorted(self.test_data_path.rglob("*.npy"))
+        for input_path in input_paths:
+            stat = input_path.stat()
+            key.update(
+                f"{input_path.as_posix()}:{stat.st_size}:{stat.st_mtime_ns}".encode()
+            )
+
+        return key.hexdigest()[:32]
+
+    def SaveCache(self, cache_path, train_data, test_data):
+        """
+        Saves the prepared data as .npy files, which are loaded memory-mapped.
+        """
+        names = [
+            "train_raw",
+            "train_target",
+            "train_labels",
+            "test_target",
+            "test_labels",
+        ]
+        arrays = dict(zip(names, train_data + test_data))
+
+        tmp_path = cache_path.with_name(cache_path.name + ".tmp")
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(tmp_path)
+        for name, array in arrays.items():
+            if array is not None:
+                np.save(tmp_path / f"{name}.npy", array)
+        with open(tmp_path / "complete", "w") as f:
+            json.dump({"version": CACHE_VERSION, "params": self.params}, f, default=str)
+
+        shutil.rmtree(cache_path, ignore_errors=True)
+        os.replace(tmp_path, cache_path)
+
+    def LoadCache(self, cache_path):
+        """
+        Loads the prepared data saved by `SaveCache`.
+        """
+
+        def load(name):
+            path = cache_path / f"{name}.npy"
+            return np.load(path, mmap_mode="r") if path.exists() else None
+
+        train_data = (load("train_raw"), load("train_target"), load("train_labels"))
+        test_data = (load("test_target"), load("test_labels"))
+
+        return train_data, test_data
+
+    @property
+    def random(self):
+        """
+        The random generator of the augmentations.
+        """
+        return np.random if self.rng is None else self.rng
+
+    def Prepare(self):
         up_down_sampled_kicks_raw = np.zeros([0, 50, 2, 2, 32])
         up_down_sampled_kicks_target = np.zeros([0, 50, 8])
 
+        if self.is_aug and self.aug_workers:
+            recordings, up_down_sampled_kicks_raw, up_down_sampled_kicks_target = (
+                self.Augment(self.aug_workers, self.aug_seed)
+            )
+            train_data = self.DataLoad(
+                raw_up_down_sampled_kikcs=up_down_sampled_kicks_raw,
+                target_up_down_sampled_kikcs=up_down_sampled_kicks_target,
+                decode_target=False,
+                recordings=recordings,
+            )
+            return train_data, self.TestDataLoad()
+
         if self.is_aug:
             current_data_path = self.train_data_folder / "current_train_data"
 
@@ -218,36 +524,142 @@ class DataLoader:
         A function that takes kick segments, sets them to a given background, convolves the edges and saves as a `original_name_synthetic`.
         """
 
+        kicks = self.SyntheticKicks()
+
+        synthetic_data_path = self.train_data_path / "kick_synthetic"
+        synthetic_data_path.mkdir()
+
+        for rand_background_folder, kick_set in self.SyntheticSets(kicks):
+            synth_data, synth_labels, target = self.SynthesizeRecording(
+                rand_background_folder, kick_set
+            )
+
+            # save the synthetic kick data with the same record name in synthetic_kick folder
+            record_name = Path(rand_background_folder.parents[1].name.split("/")[-1])
+            save_path = synthetic_data_path / record_name
+            os.makedirs(save_path, exist_ok=True)
+
+            np.save(save_path / "radar.npy", synth_data)
+            np.save(save_path / "ref_kicks.npy", synth_labels)
+            np.save(save_path / "target.npy", target)
+
+    def Augment(self, workers=None, seed=None):
+        """
+        A function that augments the train data (noise, synthetic data, up/down sampling) in a process pool and
+        returns the augmented data instead of saving it. The random choices are made with a generator seeded by
+        `seed` and every task gets its own generator spawned from it, so that the result does not depend on the
+        number of workers.
+            -`workers`: The number of processes (None for one per CPU, 1 runs the tasks one after the other in
+                        this process).
+            -`seed`: Seed of the augmentations (None for a random one).
+            -`return`: list of the noisy and synthetic recordings (raw, target, labels),
+                       the up/down sampled raw and target windows
+        """
+        self.MakeDataPaths(self.train_data_path)
+
+        seed_sequence = np.random.SeedSequence(seed)
+        self.rng = np.random.RandomState(np.random.MT19937(seed_sequence.spawn(1)[0]))
+        try:
+            tasks = [("noise", (path,)) for path in self.NoisePaths()]
+            tasks += [
+                ("synthetic", synthetic_set)
+                for synthetic_set in self.SyntheticSets(self.SyntheticKicks())
+            ]
+            tasks += [
+                ("up_down", (kick_raw, kick_labels))
+                for kick_raw, kick_labels in zip(
+                    self.paths["kick_raw"], self.paths["kick_labels"]
+                )
+            ]
+        finally:
+            self.rng = None
+
+        workers = workers or os.cpu_count()
+        kinds = [kind for kind, _ in tasks]
+        args = [task_args for _, task_args in tasks]
+
+        start = time.perf_counter()
+        if workers == 1:
+            # every task on its own copy, like in the worker processes
+            results = [
+                _augmentation_task(copy.copy(self), task_seed, kind, task_args)
+                for task_seed, kind, task_args in zip(
+                    seed_sequence.spawn(len(tasks)), kinds, args
+                )
+            ]
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                results = list(
+                    executor.map(
+                        _augmentation_task,
+                        [self] * len(tasks),
+                        seed_sequence.spawn(len(tasks)),
+                        kinds,
+                        args,
+                    )
+                )
+        duration = time.perf_counter() - start
+
+        recordings, up_down_raw, up_down_target = [], [], []
+        timings = {"noise": 0.0, "synthetic": 0.0, "up_down": 0.0}
+        for kind, (result, task_time) in zip(kinds, results):
+            timings[kind] += task_time
+            if kind == "up_down":
+                up_down_raw.append(result[0])
+                up_down_target.append(result[1])
+            else:
+                raw_data, labels, target = result
+                recordings.append((raw_data, target, labels))
+
+        self.timings = dict(timings, total=duration)
+        print(
+            "augmentation: "
+            + ", ".join(f"{kind} {timings[kind]:.1f} s" for kind in timings)
+            + f" (task time), {duration:.1f} s with {workers} workers"
+        )
+
+        return (
+            recordings,
+            np.concatenate([np.zeros([0, 50, 2, 2, 32])] + up_down_raw),
+            np.concatenate([np.zeros([0, 50, 8])] + up_down_target),
+        )
+
+    def SyntheticKicks(self):
+        """
+        A function that takes the kick segments of randomly chosen kick recordings.
+            -`return`: list of raw kick segments
+        """
         kick_raw_paths = self.paths["kick_raw"]
         take_kicks_num = int(
             len(kick_raw_paths) * self.kicks_perc
         )  # If Need change perc
-        rand_kick_paths = np.random.choice(kick_raw_paths, take_kicks_num)
+        rand_kick_paths = self.random.choice(kick_raw_paths, take_kicks_num)
 
+        kicks = []
         for kick_path in rand_kick_paths:
             raw_data = np.load(kick_path).astype(float)
             ref_kicks = np.load(kick_path.parents[1] / "ref_kicks.npy")
 
-            labels, group_index = scipy.ndimage.label(ref_kicks)
-            labels_i, labels_j, labels_i_count = np.unique(
-                labels, return_index=True, return_counts=True
-            )
-            label_kick_start, label_kick_stop = (
-                labels_j[1:],
-                labels_j[1:] + labels_i_count[1:] - 1,
-            )
+            label_kick_start, label_kick_stop, _ = self.get_start_stop(ref_kicks)
 
-            kicks = []
             for i in range(len(label_kick_start)):
                 kicks.append(raw_data[label_kick_start[i] : label_kick_stop[i]])
 
-        synthetic_data_path = self.train_data_path / "kick_synthetic"
-        synthetic_data_path.mkdir()
+        return kicks
 
+    def SyntheticSets(self, kicks):
+        """
+        A function that splits the kick segments into sets of random size, each with a random background recording.
+            -`kicks`: list of raw kick segments
+            -`return`: iterator of (background raw data path, kick set)
+        """
         while len(kicks):
             # chooses a random background folder and a random number of kicks to put on data
-            num_kicks = random.choice(range(1, self.max_kicks))
-            rand_background_folder = random.choice(self.paths["background_raw"])
+            num_kicks = self.random.randint(1, self.max_kicks)
+            background_paths = self.paths["background_raw"]
+            rand_background_folder = background_paths[
+                self.random.randint(len(background_paths))
+            ]
 
             # if number of segments to insert is greater then the number of the remaining segments, insert the remaining
             if num_kicks > len(kicks):
@@ -257,68 +669,64 @@ class DataLoader:
                 kick_set = kicks[:num_kicks]
                 kicks = kicks[num_kicks:]
 
-            # loads empty labels and background data
-            background, labels = np.load(rand_background_folder), np.load(
-                rand_background_folder.parents[1] / "ref_kicks.npy"
-            )
-            # puts the augmented data over the loaded background (without intersections)
-            synth_data, synth_labels = self.AddAugmentedDataToBackground(
-                background, labels, augmented_data=kick_set
-            )
-            # conv on new data
-            label, group_index = scipy.ndimage.label(synth_labels)
-            labels_i, labels_j, labels_i_count = np.unique(
-                label, return_index=True, return_counts=True
-            )
-            label_kick_start, label_kick_stop = (
-                labels_j[1:],
-                labels_j[1:] + labels_i_count[1:] - 1,
-            )
-            kick_segment = np.stack([label_kick_start, label_kick_stop]).T
-
-            # indices which represent segmets where background and kick were merged
-            length = self.smoothing_size // 2 + 1
-            shift = np.concatenate([np.ones(length) * (length // 2), np.zeros(length)])
-            shift = np.concatenate(
-                [np.ones(length) * (length // 2), np.ones(length) * (-length // 2)]
-            )
-            conv_segment = np.stack([np.arange(length), np.arange(-length + 1, 1)])
-            indices = (
-                (kick_segment[:, :, None] + conv_segment).reshape(-1, 2 * length)
-                - shift
-            ).astype(int)
+            yield rand_background_folder, kick_set
 
-            # creating mask for raw data which will be convolved
-            conv_mask = np.clip(
-                np.arange(synth_data.shape[0])[:, None]
-                + np.arange(self.smoothing_size),
-                a_min=0,
-                a_max=synth_data.shape[0] - 1,
-            )
+    def SynthesizeRecording(self, rand_background_folder, kick_set):
+        """
+        A function that puts kick segments on a background recording and convolves the edges.
+            -`rand_background_folder`: raw data path of the background recording
+            -`kick_set`: list of raw kick segments
+            -`return`: uint16 raw data, labels and target data of the synthetic recording
+        """
+        # loads empty labels and background data
+        background, labels = np.load(rand_background_folder), np.load(
+            rand_background_folder.parents[1] / "ref_kicks.npy"
+        )
+        # puts the augmented data over the loaded background (without intersections)
+        synth_data, synth_labels = self.AddAugmentedDataToBackground(
+            background, labels, augmented_data=kick_set
+        )
+        # conv on new data
+        label_kick_start, label_kick_stop, _ = self.get_start_stop(synth_labels)
+        kick_segment = np.stack([label_kick_start, label_kick_stop]).T
+
+        # indices which represent segmets where background and kick were merged
+        length = self.smoothing_size // 2 + 1
+        shift = np.concatenate(
+            [np.ones(length) * (length // 2), np.ones(length) * (-length // 2)]
+        )
+        conv_segment = np.stack([np.arange(length), np.arange(-length + 1, 1)])
+        indices = (
+            (kick_segment[:, :, None] + conv_segment).reshape(-1, 2 * length) - shift
+        ).astype(int)
 
-            # convolution kernel: merged segmets are being convolved with [1/3,1/3,1/3] and the remainder with [1,0,0] kernel
-            conv_kernel = np.zeros_like(conv_mask, dtype=np.float32)
-            conv_kernel[:, 0] = 1
-            conv_kernel[indices] = np.ones(self.smoothing_size) / self.smoothing_size
+        # creating mask for raw data which will be convolved
+        conv_mask = np.clip(
+            np.arange(synth_data.shape[0])[:, None] + np.arange(self.smoothing_size),
+            a_min=0,
+            a_max=synth_data.shape[0] - 1,
+        )
 
-            # convolve on merged data
-            synth_data = (
-                synth_data[conv_mask] * conv_kernel[..., None, None, None]
-            ).sum(axis=1)
-            # clip as all raw_data's maximum number is 4094
-            synth_data = np.clip(synth_data, 0, 4094)
+        # convolution kernel: merged segmets are being convolved with [1/3,1/3,1/3] and the remainder with [1,0,0] kernel
+        conv_kernel = np.zeros_like(conv_mask, dtype=np.float32)
+        conv_kernel[:, 0] = 1
+        conv_kernel[indices] = np.ones(self.smoothing_size) / self.smoothing_size
 
-            # FFT here, and saving
-            target = np.ones((len(synth_data), 8))  # change later
+        # convolve on merged data
+        synth_data = (synth_data[conv_mask] * conv_kernel[..., None, None, None]).sum(
+            axis=1
+        )
+        # clip as all raw_data's maximum number is 4094
+        synth_data = np.clip(synth_data, 0, 4094)
 
-            # save the synthetic kick data with the same record name in synthetic_kick folder
-            record_name = Path(rand_background_folder.parents[1].name.split("/")[-1])
-            save_path = synthetic_data_path / record_name
-            os.makedirs(save_path, exist_ok=True)
+        # FFT here, and saving
+        target = np.ones((len(synth_data), 8))  # change later
 
-            np.save(save_path / "radar.npy", synth_data.astype(np.uint16))
-            np.save(save_path / "ref_kicks.npy", synth_labels.astype(np.uint16))
-            np.save(save_path / "target.npy", target.astype(np.uint16))
+        return (
+            synth_data.astype(np.uint16),
+            synth_labels.astype(np.uint16),
+            target.astype(np.uint16),
+        )
 
     def AddNoise(self):
         """
@@ -326,23 +734,8 @@ class DataLoader:
             -`inp`: raw data path
             -`return`:
         """
-        kick_raw_paths = self.paths["kick_raw"]
-        no_kick_raw_paths = self.paths["no_kick_raw"] + self.paths["background_raw"]
-
-        # randomly taking data paths from kick and no_kicks
-        take_kicks_num = int(len(kick_raw_paths) * self.kicks_perc)
-        take_no_kicks_num = int(len(kick_raw_paths) * self.no_kicks_perc)
-
-        rand_kick_paths = np.random.choice(kick_raw_paths, take_kicks_num)
-        rand_no_kick_paths = np.random.choice(no_kick_raw_paths, take_no_kicks_num)
-
-        all_data_paths = np.append(rand_kick_paths, rand_no_kick_paths)
-
         # load data and apply noise
-        for path in all_data_paths:
-            # load the data
-            raw_data = np.load(path).astype(float)
-
+        for path in self.NoisePaths():
             # create folder to save the noisy data if doesn't exist
             noise_data_fodler_path = path.parents[3] / Path(
                 path.parents[2].name + "_noise"
@@ -353,26 +746,60 @@ class DataLoader:
             save_path = noise_data_fodler_path / record_name
             os.makedirs(save_path, exist_ok=True)
 
-            # add noise
-            if self.noise_type == "gauss":
-                raw_data_noise = raw_data + np.random.normal(
-                    self.miu, self.sigma, size=raw_data.shape
-                )
-            elif self.noise_type == "uniform":
-                raw_data_noise = raw_data + np.random.uniform(
-                    self.uniform_low, self.uniform_high, size=raw_data.shape
-                )
+            raw_data_noise, ref_kicks, target = self.NoiseRecording(path)
+
+            np.save(save_path / "radar.npy", raw_data_noise)
+            np.save(save_path / "ref_kicks.npy", ref_kicks)
+            np.save(save_path / "target.npy", target)
+
+    def NoisePaths(self):
+        """
+        A function that randomly takes the kick and no kick recordings, on which noise is added.
+            -`return`: raw data paths
+        """
+        kick_raw_paths = self.paths["kick_raw"]
+        no_kick_raw_paths = self.paths["no_kick_raw"] + self.paths["background_raw"]
 
-            # clip as all raw_data's maximum number is 4094
-            raw_data_noise = np.clip(raw_data_noise, 0, 4094)
+        # randomly taking data paths from kick and no_kicks
+        take_kicks_num = int(len(kick_raw_paths) * self.kicks_perc)
+        take_no_kicks_num = int(len(kick_raw_paths) * self.no_kicks_perc)
+
+        rand_kick_paths = self.random.choice(kick_raw_paths, take_kicks_num)
+        rand_no_kick_paths = self.random.choice(no_kick_raw_paths, take_no_kicks_num)
+
+        return np.append(rand_kick_paths, rand_no_kick_paths)
+
+    def NoiseRecording(self, path):
+        """
+        A function that adds noise to a recording.
+            -`path`: raw data path
+            -`return`: uint16 noisy raw data, labels and target data
+        """
+        # load the data
+        raw_data = np.load(path).astype(float)
+
+        # add noise
+        if self.noise_type == "gauss":
+            raw_data_noise = raw_data + self.random.normal(
+                self.miu, self.sigma, size=raw_data.shape
+            )
+        elif self.noise_type == "uniform":
+            raw_data_noise = raw_data + self.random.uniform(
+                self.uniform_low, self.uniform_high, size=raw_data.shape
+            )
 
-            # FFT here, and saving
-            target = raw_to_target(raw_data_noise)  # change later
-            ref_kicks = np.load(path.parents[1] / "ref_kicks.npy")
+        # clip as all raw_data's maximum number is 4094
+        raw_data_noise = np.clip(raw_data_noise, 0, 4094)
 
-            np.save(save_path / "radar.npy", raw_data_noise.astype(np.uint16))
-            np.save(save_path / "ref_kicks.npy", ref_kicks.astype(np.uint16))
-            np.save(save_path / "target.npy", target.astype(np.uint16))
+        # FFT here, and saving
+        target = raw_to_target(raw_data_noise)  # change later
+        ref_kicks = np.load(path.parents[1] / "ref_kicks.npy")
+
+        return (
+            raw_data_noise.astype(np.uint16),
+            ref_kicks.astype(np.uint16),
+            target.astype(np.uint16),
+        )
 
     def get_start_stop(self, ref_kicks):
         """
@@ -427,14 +854,12 @@ class DataLoader:
 
         # define acceptable kick durations
         kick_min_duration, kick_max_duration = 12, 50
-        downsampling_min_size = 35
         upsampling_max_size = 35
+        n_samples = 32
 
-        # the resulting array, on which all the sampled kicks will be appended
-        all_raw_kicks = np.zeros((0, 50, 2, 2, 32))
+        # first the sampled kicks are planned (same random draws as before), then they are built in one pass
+        indices, sizes, lefts = [], [], []
         for index in np.arange(num_kicks):
-            # get kick crop from raw data
-            kick_cropped = raw_data[kick_starts[index] : kick_stops[index]]
             kick_len = kick_stops[index] - kick_starts[index] + 1
 
             if kick_len > 50:
@@ -460,232 +885,102 @@ class DataLoader:
                     if not (kick_min_duration <= kick_len <= upsampling_max_size):
                         continue
 
-                    upsample_size = np.random.randint(kick_len, kick_max_duration + 1)
-
-                    # if the upsampled kick length plus its borders length is smaller than 50, skip the kick
-                    if upsample_size + left_border + right_border < kick_max_duration:
-                        continue
+                    sample_size = self.random.randint(kick_len, kick_max_duration + 1)
 
                 if kind == "down":
-                    downsample_size = np.random.randint(kick_min_duration, kick_len)
-
-                    # if the downsampled kick length plus its borders length is smaller than 50, skip the kick
-                    if downsample_size + left_border + right_border < kick_max_duration:
-                        continue
-
-                n_samples = 32
-
-                antenna_1_I = kick_cropped[:, 0, 0, :].flatten()
-                antenna_1_Q = kick_cropped[:, 0, 1, :].flatten()
-                antenna_2_I = kick_cropped[:, 1, 0, :].flatten()
-                antenna_2_Q = kick_cropped[:, 1, 1, :].flatten()
-
-                # interoplate each antenna and each component separately (I/Q), then stack them together in the right order
-                if kind == "up":
-                    antenna_1_I = torch.nn.functional.interpolate(
-                        torch.tensor(antenna_1_I.astype(float))[None, None],
-                        upsample_size * n_samples,
-                    )[0, 0].numpy()
-                    antenna_1_Q = torch.nn.functional.interpolate(
-                        torch.tensor(antenna_1_Q.astype(float))[None, None],
-                        upsample_size * n_samples,
-                    )[0, 0].numpy()
-                    antenna_2_I = torch.nn.functional.interpolate(
-                        torch.tensor(antenna_2_I.astype(float))[None, None],
-                        upsample_size * n_samples,
-                    )[0, 0].numpy()
-                    antenna_2_Q = torch.nn.functional.interpolate(
-                        torch.tensor(antenna_2_Q.astype(float))[None, None],
-                        upsample_size * n_samples,
-                    )[0, 0].numpy()
+                    sample_size = self.random.randint(kick_min_duration, kick_len)
 
-                if kind == "down":
-                    antenna_1_I = torch.nn.functional.interpolate(
-                        torch.tensor(antenna_1_I.astype(float))[None, None],
-                        downsample_size * n_samples,
-                    )[0, 0].numpy()
-                    antenna_1_Q = torch.nn.functional.interpolate(
-                        torch.tensor(antenna_1_Q.astype(float))[None, None],
-                        downsample_size * n_samples,
-                    )[0, 0].numpy()
-                    antenna_2_I = torch.nn.functional.interpolate(
-                        torch.tensor(antenna_2_I.astype(float))[None, None],
-                        downsample_size * n_samples,
-                    )[0, 0].numpy()
-                    antenna_2_Q = torch.nn.functional.interpolate(
-                        torch.tensor(antenna_2_Q.astype(float))[None, None],
-                        downsample_size * n_samples,
-                    )[0, 0].numpy()
-
-                antenna_1_I = antenna_1_I.reshape(-1, n_samples)
-                antenna_1_Q = antenna_1_Q.reshape(-1, n_samples)
-                antenna_2_I = antenna_2_I.reshape(-1, n_samples)
-                antenna_2_Q = antenna_2_Q.reshape(-1, n_samples)
-
-                if kind == "up":
-                    kick_upsampled = np.stack(
-                        (
-                            np.stack((antenna_1_I, antenna_1_Q), axis=-2),
-                            np.stack((antenna_2_I, antenna_2_Q), axis=-2),
-                        ),
-                        axis=-3,
-                    )
-
-                    if upsample_size == kick_max_duration:
-                        all_raw_kicks = np.concatenate(
-                            (all_raw_kicks, kick_upsampled[None]), axis=0
-                        )
-                        continue
-
-                    border_size = kick_max_duration - upsample_size
-
-                if kind == "down":
-                    kick_downsampled = np.stack(
-                        (
-                            np.stack((antenna_1_I, antenna_1_Q), axis=-2),
-                            np.stack((antenna_2_I, antenna_2_Q), axis=-2),
-                        ),
-                        axis=-3,
-                    )
+                # if the sampled kick length plus its borders length is smaller than 50, skip the kick
+                if sample_size + left_border + right_border < kick_max_duration:
+                    continue
 
-                    border_size = kick_max_duration - downsample_size
+                border_size = kick_max_duration - sample_size
 
                 # get the extra frames
                 nudge = left_border + right_border - border_size
 
-                # if the nudge is zero, just concatenate the left and right borders and continue
-                if nudge == 0:
-                    left_border_slice = raw_data[
-                        kick_starts[index] - left_border : kick_starts[index]
-                    ]
-                    right_border_slice = raw_data[
-                        kick_stops[index] : kick_stops[index] + right_border
-                    ]
-                    modified_kick = np.concatenate(
-                        (left_border_slice, kick_downsampled, right_border_slice)
-                    )
-                    all_raw_kicks = np.concatenate(
-                        (all_raw_kicks, modified_kick[None]), axis=0
-                    )
-                    continue
+                # the sampled kick fills the whole window
+                if border_size == 0:
+                    from_left, from_right = 0, 0
+                # if the nudge is zero, just take the left and right borders
+                elif nudge == 0:
+                    from_left, from_right = left_border, right_border
                 # When the nudge is much bigger that needed
                 elif nudge > border_size:
                     if left_border < right_border:
-                        from_left = np.random.randint(0, min(border_size, left_border))
+                        from_left = self.random.randint(
+                            0, min(border_size, left_border)
+                        )
                         from_right = border_size - from_left
 
                     elif left_border >= right_border:
-                        from_right = np.random.randint(
+                        from_right = self.random.randint(
                             0, min(border_size, right_border)
                         )
                         from_left = border_size - from_right
                 # When the nudge is bigger from the minimum of the borders
                 elif nudge > min(left_border, right_border):
                     if left_border < right_border:
-                        from_left = np.random.randint(left_border)
+                        from_left = self.random.randint(left_border)
                         from_right = border_size - from_left
                     elif left_border >= right_border:
-                        from_right = np.random.randint(right_border)
+                        from_right = self.random.randint(right_border)
                         from_left = border_size - from_right
                 else:
-                    p = np.random.randint(0, nudge)
+                    p = self.random.randint(0, nudge)
                     from_left = left_border - p
                     from_right = right_border - (nudge - p)
 
-                left_border_slice = raw_data[
-                    kick_starts[index] - from_left : kick_starts[index]
-                ]
-                right_border_slice = raw_data[
-                    kick_stops[index] : kick_stops[index] + from_right
-                ]
+                indices.append(index)
+                sizes.append(sample_size)
+                lefts.append(from_left)
 
-                if kind == "up":
-                    modified_kick = np.concatenate(
-                        (left_border_slice, kick_upsampled, right_border_slice)
-                    )
+        indices, sizes = np.asarray(indices, dtype=int), np.asarray(sizes, dtype=int)
+        lefts = np.asarray(lefts, dtype=int)
+        starts, stops = kick_starts[indices], kick_stops[indices]
 
-                if kind == "down":
-                    modified_kick = np.concatenate(
-                        (left_border_slice, kick_downsampled, right_border_slice)
-                    )
-
-                all_raw_kicks = np.concatenate(
-                    (all_raw_kicks, modified_kick[None]), axis=0
-                )
-
-        # get targets for all sampled kicks
-        all_target_kikcs = np.zeros([0, 50, 8])
-        for k in range(len(all_raw_kicks)):
-            all_target_kikcs = np.concatenate(
-                [all_target_kikcs, (raw_to_target(all_raw_kicks[k]))[None]], axis=0
-            )
-
-        return all_raw_kicks, all_target_kikcs
-
-    def GetRandomTimeSegments(self, segment_len, len_whole_seq):
-        """
-        A function for generating random time segments for a given kick.
-            -`inp`: length of segment,
-                    length of the whole sequense on which to generate
-                    the number of time steps to keep empty (0) in the sequence
-            -`return`: a tuple (segment_start, segment_end)
-        """
+        # the source sample of every sample of the sampled kicks (flattened frames x samples),
+        # the borders are copied and the kick crops [start, stop) are resampled
+        position = np.arange(kick_max_duration * n_samples)
+        kick_begin = (lefts * n_samples)[:, None]
+        kick_end = ((lefts + sizes) * n_samples)[:, None]
 
-        # Make sure segment doesn't run past the background
-        segment_start = np.random.randint(
-            low=self.start_end_buffer,
-            high=len_whole_seq - segment_len - self.start_end_buffer,
+        source = np.where(
+            position < kick_begin,
+            (starts - lefts)[:, None] * n_samples + position,
+            stops[:, None] * n_samples + position - kick_end,
         )
-        segment_end = segment_start + segment_len - 1
-
-        return segment_start, segment_end
+        in_kick = (position >= kick_begin) & (position < kick_end)
+        source[in_kick] = np.repeat(
+            starts * n_samples, sizes * n_samples
+        ) + resample_indices((stops - starts) * n_samples, sizes * n_samples)
 
-    def IsOverlapping(self, segment_len, previous_segments):
-        """
-        A function for checking if the time segment being inserted is overlapping, or near to any of the previous time segments.
-            -`inp`: length of segment
-                    list containing tuples of all previously inserted segments[(segment_start, segment_end), ...]
-                    the distance to keep as a margin between the segments
-            -`return`: a boolean value: if overlaps or not
-        """
+        # all the antennas and I/Q components are gathered at once into the preallocated result
+        all_raw_kicks = np.empty((len(indices), kick_max_duration, 2, 2, n_samples))
+        all_raw_kicks.transpose(0, 1, 4, 2, 3)[...] = raw_data[
+            source // n_samples, :, :, source % n_samples
+        ].reshape(len(indices), kick_max_duration, n_samples, 2, 2)
 
-        segment_start, segment_end = segment_len
+        # get targets for all sampled kicks in one batch
+        all_target_kikcs = raw_to_target(all_raw_kicks).astype(np.float64)
 
-        overlap = False
-
-        for previous_start, previous_end in previous_segments:
-            if (
-                segment_start <= previous_end + self.mid_buffer
-                and segment_end >= previous_start - self.mid_buffer
-            ):
-                overlap = True
-                return overlap
-
-        return overlap
+        return all_raw_kicks, all_target_kikcs
 
-    def InsertSegmentToBackground(self, background, segment, previous_segments):
+    def InsertSegmentToBackground(self, background, segment, placement):
         """
         A function for inserting segments upon background.
             -`inp`: the array of background
                     the array of segment
-                    the list of tuples representing segments inserted previously
+                    the SegmentPlacement of the segments inserted previously
             -`return`: new background with inserted segment and the time tuple for the segment
         """
 
-        segment_len = len(segment)
-        len_whole_seq = len(background)
-
-        segment_time = self.GetRandomTimeSegments(segment_len, len_whole_seq)
-
-        while self.IsOverlapping(segment_time, previous_segments):
-            segment_time = self.GetRandomTimeSegments(segment_len, len_whole_seq)
-
-        previous_segments.append(segment_time)
+        segment_time = placement.Place(len(segment), self.random)
 
         new_background = background
         new_background[segment_time[0] : segment_time[1] + 1] = segment
 
-        return new_background, segment_time, previous_segments
+        return new_background, segment_time
 
     def AddAugmentedDataToBackground(self, background, labels, augmented_data):
         """
@@ -696,13 +991,15 @@ class DataLoader:
 
             -`return`: the new data with inserted augmented segment and updated labels
         """
-        previous_segments = []
+        placement = SegmentPlacement(
+            len(background), self.start_end_buffer, self.mid_buffer
+        )
         out_data = background.copy()
         out_labels = labels.copy()
 
         for segment in augmented_data:
-            out_data, segment_time, previous_segments = self.InsertSegmentToBackground(
-                out_data, segment, previous_segments
+            out_data, segment_time = self.InsertSegmentToBackground(
+                out_data, segment, placement
             )
             out_labels[segment_time[0] : segment_time[1] + 1] = 1
 
@@ -714,103 +1011,98 @@ class DataLoader:
         raw_up_down_sampled_kikcs=np.empty(0),
         target_up_down_sampled_kikcs=np.empty(0),
         decode_target=False,
+        raw_windows=None,
+        recordings=(),
     ):
         """
         A function for loading training data (X_train, Y_train)
-            -`inp`: Data folder path, split_len (<= len(data)).
+            -`inp`: Data folder path or session archive (ifxdaq/session_archive.py), split_len (<= len(data)).
+            -`recordings`: In-memory recordings (raw, target, labels), which are loaded besides the folder's ones.
+            -`raw_windows`: "array" copies the raw windows into an array, "lazy" returns a RawWindowDataset
+                            over the memory-mapped recordings, "skip" does not load the raw data (returns None).
+                            (Default: the DataLoader's `raw_windows`)
             -`return`: X_train, Y_train.
         """
+        raw_windows = self.raw_windows if raw_windows is None else raw_windows
+        if raw_windows not in ("array", "lazy", "skip"):
+            raise ValueError(
+                f"Expected raw_windows to be 'array', 'lazy' or 'skip', but got {raw_windows}"
+            )
 
         if data_path:
             path = Path(data_path)
         else:
             path = self.train_data_path
 
-        interval_target_data = np.zeros(
-            [0, self.split_len - self.kernel.shape[0] + 1, 8]
-        )
-        interval_raw_data = np.zeros([0, self.split_len, 2, 2, 32])
-        interval_labels = np.zeros([0])
+        if path.is_file():
+            # a session archive (ifxdaq/session_archive.py) of the recordings
+            archived = SessionArchive(path).recordings()
+            all_raw_datas = [raw_data for raw_data, _, _ in archived]
+            all_target_datas = [target_data for _, target_data, _ in archived]
+            all_labels = [labels for _, _, labels in archived]
+        else:
+            all_raw_datas = sorted(list(path.rglob("*/radar.npy")))
+            all_target_datas = sorted(list(path.rglob("*/target.npy")))
+            all_labels = sorted(list(path.rglob("*/ref_kicks.npy")))
 
-        all_raw_datas = sorted(list(path.rglob("*/radar.npy")))
-        all_target_datas = sorted(list(path.rglob("*/target.npy")))
-        all_labels = sorted(list(path.rglob("*/ref_kicks.npy")))
+        for raw_data, target_data, labels in recordings:
+            all_raw_datas.append(raw_data)
+            all_target_datas.append(target_data)
+            all_labels.append(labels)
 
-        for folder_i in range(len(all_target_datas)):
-            raw_data = np.load(all_raw_datas[folder_i]).astype(float)
-            target_data = np.load(all_target_datas[folder_i])
-            labels = np.load(all_labels[folder_i]).astype(float)
+        kernel_size = self.kernel.shape[0]
+        conv_len = self.split_len - kernel_size + 1
 
-            if decode_target:
-                amps, bins = decode(target_data)  # self.
-                len_points = amps.shape[0]
-                amps, bins = amps.reshape(len_points, 4), bins.reshape(len_points, 4)
-                target_data = np.hstack((amps, bins))
+        # first pass: the windows, which are kept, and their labels for every recording
+        target_datas, window_starts, window_labels = [], [], []
+        for folder_i in range(len(all_target_datas)):
+            target_data, labels = self.LoadRecording(
+                all_target_datas[folder_i], all_labels[folder_i], decode_target
+            )
+            starts, starts_labels = self.SelectWindows(labels, target_data.shape[0])
 
-            target_data = target_data.astype(float)
-            target_data[:, [4, 5, 6, 7]] = target_data[:, [4, 5, 6, 7]] / 31
+            target_datas.append(target_data)
+            window_starts.append(starts)
+            window_labels.append(starts_labels)
 
-            interval_labels_curr = np.zeros(target_data.shape[0] - self.split_len + 1)
-            interval_target_data_curr = []
-            interval_raw_data_curr = []
-            del_idx = []
+        num_windows = sum(len(starts) for starts in window_starts)
+        num_total = num_windows + len(raw_up_down_sampled_kikcs)
 
-            for i in range(target_data.shape[0] - self.split_len + 1):
-                data_i = target_data[i : i + self.split_len]
-                label_i = labels[i : i + self.split_len]
+        interval_target_data = np.empty([num_total, conv_len, 8])
+        interval_labels = np.empty([num_total])
+        if raw_windows == "array":
+            interval_raw_data = np.empty([num_total, self.split_len, 2, 2, 32])
+        else:
+            interval_raw_data = None
 
-                label, group_index = scipy.ndimage.label(label_i)
-                labels_i, labels_j, labels_i_count = np.unique(
-                    label, return_index=True, return_counts=True
+        # second pass: fill the windows into the preallocated arrays
+        pos = 0
+        for folder_i, (target_data, starts) in enumerate(
+            zip(target_datas, window_starts)
+        ):
+            count = len(starts)
+            interval_labels[pos : pos + count] = window_labels[folder_i]
+
+            if count and raw_windows == "array":
+                raw_data = _load_array(all_raw_datas[folder_i]).astype(float)
+                np.take(
+                    raw_data,
+                    starts[:, None] + np.arange(self.split_len),
+                    axis=0,
+                    out=interval_raw_data[pos : pos + count],
                 )
-                label_kick_start, label_kick_stop = (
-                    labels_j[1:],
-                    labels_j[1:] + labels_i_count[1:] - 1,
+
+            if count:
+                self.TargetWindows(
+                    target_data, starts, out=interval_target_data[pos : pos + count]
                 )
-                _len = len(label_kick_start)
-                if _len and i != 0 and i != target_data.shape[0] - self.split_len:
-                    if (
-                        _len > 1
-                        or (labels[i - 1] or labels[i + self.split_len])
-                        or (label_kick_stop - label_kick_start) < self.min_duration
-                    ):
-                        del_idx.append(i)
-                        continue
-                    else:
-                        interval_labels_curr[i] = 1
-
-                convolved_data = np.zeros(shape=(self.split_len - 2, 8))
-                mask = np.arange(self.split_len - self.kernel.shape[0] + 1)[
-                    :, None
-                ] + np.arange(self.kernel.shape[0])
-                data_avg = (
-                    data_i[..., [0, 1, 2, 3]][mask] * self.kernel[..., None]
-                ).sum(axis=1)
-                data_avg = data_avg / np.maximum(np.max(data_avg, axis=0), self.eps)
-                convolved_data[:, [0, 1, 2, 3]] = data_avg
-                convolved_data[:, [4, 5, 6, 7]] = data_i[2:, [4, 5, 6, 7]]
-
-                interval_target_data_curr.append(convolved_data)
-                interval_raw_data_curr.append(raw_data[i : i + self.split_len])
-
-            if len(del_idx):
-                # filtering out non-kicks that contain part from kick
-                interval_labels_curr = np.delete(interval_labels_curr, del_idx)
-
-            interval_target_data = np.concatenate(
-                (interval_target_data, interval_target_data_curr), axis=0
-            )  # shape (N,8)
-            interval_raw_data = np.concatenate(
-                (interval_raw_data, interval_raw_data_curr), axis=0
-            )  # shape (N,8)
-            interval_labels = np.concatenate(
-                (interval_labels, interval_labels_curr), axis=0
-            )  # shape (N,)
+
+            pos += count
+
         if len(raw_up_down_sampled_kikcs):
             #             print("Entered up/down sampling cat", interval_raw_data.shape, interval_target_data.shape, interval_labels.shape)
-            interval_raw_data = np.concatenate(
-                [interval_raw_data, raw_up_down_sampled_kikcs], axis=0
-            )
+            if raw_windows == "array":
+                interval_raw_data[num_windows:] = raw_up_down_sampled_kikcs
             mask = np.arange(self.split_len - self.kernel.shape[0] + 1)[
                 :, None
             ] + np.arange(self.kernel.shape[0])
@@ -821,14 +1113,30 @@ class DataLoader:
             data_avg = (
                 data_avg / np.maximum(np.max(data_avg, axis=1), self.eps)[:, None]
             )
-            concatenated_data = np.concatenate(
-                [data_avg, target_up_down_sampled_kikcs[:, 2:, [4, 5, 6, 7]]], axis=-1
-            )
-            interval_target_data = np.concatenate(
-                [interval_target_data, concatenated_data], axis=0
-            )
-            interval_labels = np.concatenate(
-                [interval_labels, np.ones(len(raw_up_down_sampled_kikcs))], axis=0
+            interval_target_data[num_windows:, :, :4] = data_avg
+            interval_target_data[num_windows:, :, 4:] = target_up_down_sampled_kikcs[
+                :, 2:, [4, 5, 6, 7]
+            ]
+            interval_labels[num_windows:] = 1
+
+        if raw_windows == "lazy":
+            raw_recordings = [
+                _load_array(raw_path, mmap_mode="r") for raw_path in all_raw_datas
+            ]
+            interval_raw_data = RawWindowDataset(
+                raw_recordings + list(raw_up_down_sampled_kikcs),
+                np.concatenate(
+                    [
+                        np.full(len(starts), folder_i)
+                        for folder_i, starts in enumerate(window_starts)
+                    ]
+                    + [len(raw_recordings) + np.arange(len(raw_up_down_sampled_kikcs))]
+                ).astype(int),
+                np.concatenate(
+                    window_starts
+                    + [np.zeros(len(raw_up_down_sampled_kikcs), dtype=int)]
+                ),
+                self.split_len,
             )
 
         return (
@@ -837,6 +1145,161 @@ class DataLoader:
             interval_labels,
         )
 
+    def StreamDataset(
+        self,
+        data_path=None,
+        batch_size=64,
+        shuffle_buffer=10000,
+        decode_target=False,
+        seed=None,
+    ):
+        """
+        A function that streams the training windows of DataLoad as a tf.data.Dataset instead of loading all of them
+        into memory. The recordings are loaded and windowed in parallel, the windows are shuffled in a bounded buffer,
+        batched and prefetched, so that the loading overlaps with the training.
+            -`data_path`: Data folder path (Default: the train data).
+            -`batch_size`: The number of windows per batch.
+            -`shuffle_buffer`: The number of windows the shuffling draws from.
+            -`decode_target`: The target data is bit-packed as recorded by the radar.
+            -`seed`: Seed of the shuffling (None for a random, nondeterministic order).
+            -`return`: dataset of (batch x 48 x 8 windows, batch labels)
+        """
+        path = Path(data_path) if data_path else self.train_data_path
+        target_paths = [str(p) for p in sorted(path.rglob("*/target.npy"))]
+        labels_paths = [str(p) for p in sorted(path.rglob("*/ref_kicks.npy"))]
+        conv_len = self.split_len - self.kernel.shape[0] + 1
+
+        def load(target_path, labels_path):
+            target_data, labels = self.LoadRecording(
+                target_path.decode(), labels_path.decode(), decode_target
+            )
+            starts, window_labels = self.SelectWindows(labels, target_data.shape[0])
+            windows = self.TargetWindows(target_data, starts)
+
+            return (
+                windows[..., [0, 4, 1, 5, 2, 6, 3, 7]].astype(np.float32),
+                window_labels.astype(np.float32),
+            )
+
+        def load_tf(target_path, labels_path):
+            windows, labels = tf.numpy_function(
+                load, [target_path, labels_path], [tf.float32, tf.float32]
+            )
+            windows.set_shape([None, conv_len, 8])
+            labels.set_shape([None])
+
+            return windows, labels
+
+        dataset = tf.data.Dataset.from_tensor_slices((target_paths, labels_paths))
+        dataset = dataset.shuffle(max(len(target_paths), 1), seed=seed)
+        dataset = dataset.map(
+            load_tf, num_parallel_calls=tf.data.AUTOTUNE, deterministic=seed is not None
+        )
+        dataset = dataset.unbatch().shuffle(shuffle_buffer, seed=seed)
+
+        return dataset.batch(batch_size).prefetch(tf.data.AUTOTUNE)
+
+    def LoadRecording(self, target_path, labels_path, decode_target=False):
+        """
+        A function that loads the target data and the labels of a recording.
+            -`target_path`: target.npy of the recording (or the array)
+            -`labels_path`: ref_kicks.npy of the recording (or the array)
+            -`decode_target`: The target data is bit-packed as recorded by the radar.
+            -`return`: Nx8 target data (4 amplitudes, 4 bins / 31) and the labels
+        """
+        target_data = _load_array(target_path)
+        labels = _load_array(labels_path).astype(float)
+
+        if decode_target:
+            decoded = np.empty((len(target_data), 8))
+            decode(target_data, amps=decoded[:, :4], bins=decoded[:, 4:])
+            target_data = decoded
+        else:
+            target_data = target_data.astype(float)
+        target_data[:, [4, 5, 6, 7]] = target_data[:, [4, 5, 6, 7]] / 31
+
+        return target_data, labels
+
+    def TargetWindows(self, target_data, starts, out=None):
+        """
+        A function that builds the model input windows (averaged, normalized amplitudes and bins) of a recording.
+            -`target_data`: Nx8 target data of `LoadRecording`
+            -`starts`: The first frame of every window.
+            -`out`: Preallocated array for the windows.
+            -`return`: windows x (split_len - kernel size + 1) x 8 (4 amplitudes, 4 bins)
+        """
+        kernel_size = self.kernel.shape[0]
+        conv_len = self.split_len - kernel_size + 1
+        if out is None:
+            out = np.empty([len(starts), conv_len, 8])
+
+        # the averaged amplitudes do not depend on the window, only their normalization does
+        data_avg = self.AverageAmplitudes(target_data[:, [0, 1, 2, 3]])
+        norm = sliding_window_view(data_avg, conv_len, axis=0)[starts].max(axis=-1)
+        norm = np.maximum(norm, self.eps)
+
+        conv_index = starts[:, None] + np.arange(conv_len)
+        out[..., :4] = data_avg[conv_index] / norm[:, None]
+        out[..., 4:] = target_data[conv_index + kernel_size - 1][..., [4, 5, 6, 7]]
+
+        return out
+
+    def SelectWindows(self, labels, len_points):
+        """
+        A function that selects the training windows of a recording, without looping over the windows.
+        A window containing a part of a kick is a kick window, if it contains a single kick completely, which lasts at
+        least `min_duration` frames, otherwise it is dropped. The first and the last windows are always kept as non-kicks.
+            -`labels`: Labels of the recording (ref_kicks.npy).
+            -`len_points`: The number of frames of the recording.
+            -`return`: start indices and labels of the kept windows
+        """
+        num_windows = max(len_points - self.split_len + 1, 0)
+        window_starts = np.arange(num_windows)
+
+        kick = labels[:len_points] != 0
+        kick_begin = kick.copy()
+        kick_begin[1:] &= ~kick[:-1]
+
+        def window_sum(values):
+            cumsum = np.concatenate(([0], np.cumsum(values)))
+            return cumsum[window_starts + self.split_len] - cumsum[window_starts]
+
+        # number of kicks (a kick started before the window counts too) and kick frames of every window
+        kick_count = window_sum(kick_begin) + (
+            kick[:num_windows] & ~kick_begin[:num_windows]
+        )
+        kick_len = window_sum(kick)
+
+        interior = (window_starts != 0) & (window_starts != num_windows - 1)
+        border = np.zeros(num_windows, dtype=bool)
+        border[interior] = (
+            kick[window_starts[interior] - 1]
+            | kick[window_starts[interior] + self.split_len]
+        )
+
+        has_kick = interior & (kick_count > 0)
+        drop = has_kick & (
+            (kick_count > 1) | border | (kick_len - 1 < self.min_duration)
+        )
+
+        keep = ~drop
+        return window_starts[keep], (has_kick & ~drop)[keep].astype(float)
+
+    def AverageAmplitudes(self, amps):
+        """
+        A function that averages the amplitudes of a recording with the kernel (summed in the same order as per window).
+            -`amps`: Nx4 amplitudes
+            -`return`: (N - kernel size + 1)x4 averaged amplitudes
+        """
+        kernel_size = self.kernel.shape[0]
+        len_avg = amps.shape[0] - kernel_size + 1
+
+        data_avg = amps[:len_avg] * self.kernel[0]
+        for k in range(1, kernel_size):
+            data_avg = data_avg + amps[k : len_avg + k] * self.kernel[k]
+
+        return data_avg
+
     def TestDataLoad(self):
         test_data_kicks = list(self.test_data_path.rglob("kick.npy"))
         test_data_kicks_labels = list(self.test_data_path.rglob("kick_labels.npy"))
@@ -891,78 +1354,14 @@ def CalcACC(predictions, labels):
     return acc
 
 
-def _gauss(n: int) -> np.ndarray:  # pylint: disable=invalid-name
-    """
-    A window function that is applied on the raw data before the Fourier Transformation.
-
-    Args:
-        n: The number of samples for constructing the window.
-
-    Returns:
-        Window as numpy array.
-    """
-    # pylint: disable=invalid-name
-    n += 1
-    x = np.arange(-n // 2 + 1, n // 2)
-    x = 2 * x / n  # type: ignore
-    y = np.exp(-1 / (1 - x**2))
-
-    return y / y.sum()
-
-
-def fft(
-    raw_data: np.ndarray, window_fn: Optional[Callable[[int], np.ndarray]] = None
-) -> np.ndarray:
-    """Compute fast fourier transformation on radar data.
-
-    Args:
-        raw_data: [frames, antennas, IQ, samples].
-        window_fn: Window function for FFT. If None, no window is applied. Otherwise, the given window
-            function is applied. (Default: None)
-
-    Returns:
-        FFT data [frames, antennas, samples].
-    """
-    data = np.vectorize(complex)(raw_data[..., 0, :], raw_data[..., 1, :])
-    data -= data.mean(axis=-1, keepdims=True)
-
-    if window_fn is not None:
-        window = window_fn(raw_data.shape[-1])
-        window /= window.sum()
-        data = data * window
-
-    fft_data: np.ndarray = np.fft.fft(data, axis=-1)
-
-    return fft_data
-
-
-def target_extraction_from_raw(fft_data, num_targets=2):
-    """Extract n targets from fft data.
+def raw_to_target(raw_data, num_targets=2):
+    """Converts raw data to target data using FFT.
 
     Args:
-        fft_data: Fourier transformed data [frames, antennas, samples].
+        raw_data: [frames, antennas, IQ, samples] or a batch of windows [windows, frames, antennas, IQ, samples].
         num_targets: Number of targets.
 
     Returns:
-        Tuple of Target data values and corresponding bins.
+        Target values followed by the target bins [..., frames, antennas * num_targets * 2].
     """
-    # Obtaining amplitudes of the frequencies
-    amp = np.abs(fft_data)
-
-    # Get top k values
-    bins = np.argpartition(amp, -num_targets, axis=-1)[..., -num_targets:][..., ::-1]
-    values = np.take_along_axis(amp, indices=bins, axis=-1)
-
-    values = values.astype(np.uint16).reshape(-1, 4)
-    bins = bins.astype(np.uint16).reshape(-1, 4)
-
-    return values, bins
-
-
-def raw_to_target(raw_data, num_targets=2):
-    """Converts raw data to target data using FFT"""
-    fft_data = fft(raw_data, window_fn=_gauss)
-    target_data = target_extraction_from_raw(fft_data=fft_data, num_targets=num_targets)
-    result = np.concatenate(target_data, axis=1)
-
-    return result
+    return get_extractor(num_targets=num_targets).values_bins(raw_data)